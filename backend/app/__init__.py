@@ -44,6 +44,8 @@ def create_app():
     CORS(
         app,
         resources={r"/api/.*": {"origins": origins or "*"}},
+        # Library listings return their next page cursor in this header.
+        expose_headers=["X-Next-Cursor"],
     )
     db.init_app(app)
     jwt.init_app(app)
@@ -92,13 +94,22 @@ def create_app():
     from .routes.auth import auth_bp
     from .routes.recommendations import recommend_bp
     from .routes.library import library_bp
+    from .routes.health import health_bp
+    from .routes.metrics import metrics_bp
 
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(recommend_bp, url_prefix="/api/recommend")
     app.register_blueprint(library_bp, url_prefix="/api/library")
+    app.register_blueprint(health_bp, url_prefix="/api/health")
+    app.register_blueprint(metrics_bp, url_prefix="/api/metrics")
 
     with app.app_context():
         from . import models  # noqa: F401
         db.create_all()
 
+    # Optional eager/preloaded recommender start-up (RECOMMENDER_INIT).
+    from .routes.recommendations import init_recommender
+
+    init_recommender(app)
+
     return app
@@ -0,0 +1,271 @@
+"""
+Offline vector index build.
+
+Run from backend/:
+  python -m app.ai.build_index [--workers N] [--chunk-rows 4096] [--force]
+
+Settings (catalog, index dir, model, backend, storage, index type) come from the same
+environment / backend/.env as the web app, so the web tier finds exactly the index it
+expects and, with INDEX_AUTO_BUILD=false, never builds one itself.
+
+The catalog is read in chunks and each chunk is encoded by a pool of worker processes.
+Rows whose (source_id, text hash) match the index already on disk reuse their old
+vector. Every encoded chunk is checkpointed as a shard in the work directory, so a
+crashed or interrupted build resumes from the first missing shard. The shards are then
+streamed one at a time into the index files (each written then renamed, the meta last),
+so memory stays at a few chunks however large the catalog is.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .catalog import CatalogPaths, file_digest, iter_catalog_chunks, row_content_hashes
+from .embedding import load_embedder
+from .recommender import RecommenderConfig
+from .vector_index import VectorIndex, fill_rows
+
+# Bump when the shard layout or the way shards are produced changes.
+_SHARD_FORMAT = "2"
+
+# Worker-process state (see _init_worker).
+_worker_embedder = None
+
+
+def _load_config() -> RecommenderConfig:
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).resolve().parents[2] / ".env", override=False)
+    from ..config import Config
+
+    return RecommenderConfig.from_config({k: getattr(Config, k) for k in dir(Config) if k.isupper()})
+
+
+def _init_worker(model_name: str, backend: str, threads: int) -> None:
+    global _worker_embedder
+    try:
+        import torch
+
+        torch.set_num_threads(max(1, threads))
+    except Exception:
+        pass
+    _worker_embedder = load_embedder(model_name, backend=backend)
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(_worker_embedder.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class ShardStore:
+    """
+    Per-chunk embedding checkpoints: shard_<chunk>.npy in `directory` plus the chunk's
+    source ids and content hashes in shard_<chunk>.json, each written then renamed (the
+    .npy last), valid only for the build key recorded in build.json.
+    """
+
+    def __init__(self, directory: str, key: str):
+        self.directory = directory
+        self.key = key
+
+    def open(self, force: bool) -> int:
+        # Returns how many shards from an earlier run of the same build are reusable.
+        state_path = os.path.join(self.directory, "build.json")
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                same = json.load(f).get("key") == self.key
+        except Exception:
+            same = False
+        if force or not same:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key}, f)
+        return sum(1 for name in os.listdir(self.directory) if name.startswith("shard_") and name.endswith(".npy"))
+
+    def path(self, chunk: int) -> str:
+        return os.path.join(self.directory, f"shard_{chunk:06d}.npy")
+
+    def load(self, chunk: int, rows: Optional[int] = None) -> Optional[Tuple[np.ndarray, List[str], List[str]]]:
+        # (embeddings, source ids, hashes) of a complete shard, else None.
+        try:
+            arr = np.load(self.path(chunk), mmap_mode="r")
+            with open(self.path(chunk)[:-4] + ".json", "r", encoding="utf-8") as f:
+                rows_meta = json.load(f)
+        except Exception:
+            return None
+        ids, hashes = rows_meta["source_ids"], rows_meta["hashes"]
+        if arr.ndim != 2 or not arr.shape[0] == len(ids) == len(hashes):
+            return None
+        if rows is not None and arr.shape[0] != rows:
+            return None
+        return arr, ids, hashes
+
+    def save(self, chunk: int, emb: np.ndarray, source_ids: List[str], hashes: List[str]) -> None:
+        path = self.path(chunk)
+        with open(path[:-4] + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"source_ids": source_ids, "hashes": hashes}, f)
+        os.replace(path[:-4] + ".json.tmp", path[:-4] + ".json")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.asarray(emb, dtype=np.float32))
+        os.replace(path + ".tmp", path)
+
+
+def build_key(cfg: RecommenderConfig, backend: str, chunk_rows: int) -> str:
+    parts = [_SHARD_FORMAT, file_digest(cfg.catalog_path), cfg.embedding_model, backend, str(chunk_rows)]
+    return hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def build(
+    cfg: RecommenderConfig,
+    workers: int,
+    chunk_rows: int = 4096,
+    batch_size: int = 64,
+    work_dir: Optional[str] = None,
+    force: bool = False,
+    keep_shards: bool = False,
+    log=print,
+) -> Dict[str, float]:
+    """
+    Builds (or refreshes) the index for `cfg` and returns a summary of the run.
+    """
+    t_start = time.perf_counter()
+    paths = CatalogPaths(catalog_csv=cfg.catalog_path, index_dir=cfg.index_dir)
+    if not os.path.exists(paths.catalog_csv):
+        raise FileNotFoundError(paths.catalog_csv)
+
+    # The parent resolves the effective backend (and encodes itself when workers <= 1).
+    embedder = load_embedder(cfg.embedding_model, backend=cfg.embedding_backend)
+    index = VectorIndex(
+        faiss_index_path=paths.faiss_index,
+        embeddings_path=paths.embeddings_npy,
+        meta_path=paths.meta_json,
+        scales_path=paths.embedding_scales_npy,
+        storage_dtype=cfg.embedding_storage,
+        params=cfg.index_params,
+        hashes_path=paths.row_hashes_json,
+        embedding_backend=embedder.backend,
+    )
+    shards = ShardStore(
+        work_dir or os.path.join(cfg.index_dir, ".index_build"),
+        build_key(cfg, embedder.backend, chunk_rows),
+    )
+    resumable = shards.open(force)
+    if resumable:
+        log(f"resuming: {resumable} checkpointed chunk(s) found")
+    prev = None if force else index.previous_rows(embedder.model_name)
+
+    stats = {"rows": 0, "chunks": 0, "resumed_chunks": 0, "reused_rows": 0, "encoded_rows": 0}
+    # chunk -> (partial embeddings or None, positions still to encode, source ids, hashes)
+    pending: Dict[int, Tuple[Optional[np.ndarray], np.ndarray, List[str], List[str]]] = {}
+    futures = {}
+
+    def finish(chunk: int, fresh: Optional[np.ndarray]) -> None:
+        emb, todo, ids, hashes = pending.pop(chunk)
+        if fresh is not None:
+            emb = fill_rows(emb, todo, fresh)
+        shards.save(chunk, emb, ids, hashes)
+        stats["encoded_rows"] += len(todo)
+
+    pool = None
+    if workers > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        import multiprocessing
+
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(cfg.embedding_model, embedder.backend, threads),
+        )
+    try:
+        for chunk_no, df in enumerate(iter_catalog_chunks(paths.catalog_csv, chunk_rows)):
+            texts = df["search_text"].fillna("").astype(str).tolist()
+            ids = df["source_id"].astype(str).tolist()
+            hashes = row_content_hashes(texts)
+            stats["rows"] += len(texts)
+            stats["chunks"] += 1
+
+            if shards.load(chunk_no, len(texts)) is not None:
+                stats["resumed_chunks"] += 1
+                continue
+
+            emb, todo = prev.reuse(ids, hashes) if prev is not None else (None, np.arange(len(texts)))
+            stats["reused_rows"] += len(texts) - len(todo)
+            pending[chunk_no] = (emb, todo, ids, hashes)
+            if not len(todo):
+                finish(chunk_no, None)
+            elif pool is None:
+                finish(chunk_no, np.asarray(embedder.encode([texts[i] for i in todo], batch_size=batch_size), dtype=np.float32))
+            else:
+                futures[pool.submit(_encode_in_worker, [texts[i] for i in todo], batch_size)] = chunk_no
+                # Bound how much of the catalog is in flight.
+                while len(futures) >= 2 * workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        finish(futures.pop(fut), fut.result())
+            if stats["chunks"] % 10 == 0:
+                log(f"{stats['rows']} rows read, {stats['encoded_rows']} encoded")
+        for fut in list(futures):
+            finish(futures.pop(fut), fut.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if not stats["rows"]:
+        raise RuntimeError(f"Catalog {paths.catalog_csv} has no rows")
+
+    def shard(chunk: int) -> Tuple[np.ndarray, List[str], List[str]]:
+        loaded = shards.load(chunk)
+        if loaded is None:
+            raise RuntimeError(f"Checkpoint {shards.path(chunk)} is missing or unreadable")
+        return loaded
+
+    dim = shard(0)[0].shape[1]
+    with index.writer(stats["rows"], dim, embedder.model_name, paths.catalog_csv) as writer:
+        for chunk_no in range(stats["chunks"]):
+            writer.append(*shard(chunk_no))
+        writer.commit(load=False)
+    if not keep_shards:
+        shutil.rmtree(shards.directory, ignore_errors=True)
+    stats["seconds"] = round(time.perf_counter() - t_start, 3)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="encoder processes (1 = in-process)")
+    ap.add_argument("--chunk-rows", type=int, default=4096)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--work-dir", default=None, help="checkpoint directory (default: INDEX_DIR/.index_build)")
+    ap.add_argument("--force", action="store_true", help="ignore checkpoints and the previous index")
+    ap.add_argument("--keep-shards", action="store_true")
+    args = ap.parse_args(argv)
+
+    cfg = _load_config()
+    stats = build(
+        cfg,
+        workers=max(1, args.workers),
+        chunk_rows=args.chunk_rows,
+        batch_size=args.batch_size,
+        work_dir=args.work_dir,
+        force=args.force,
+        keep_shards=args.keep_shards,
+        log=lambda msg: print(msg, file=sys.stderr, flush=True),
+    )
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,13 @@
+import hashlib
 import os
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from .embedding_store import open_temp_file
+
 
 @dataclass(frozen=True)
 class CatalogPaths:
@@ -14,6 +18,21 @@ class CatalogPaths:
     def embeddings_npy(self) -> str:
         return os.path.join(self.index_dir, "catalog_embeddings.npy")
 
+    @property
+    def embedding_scales_npy(self) -> str:
+        # Per-row dequantization scales, only present for int8 storage.
+        return os.path.join(self.index_dir, "catalog_embeddings.scales.npy")
+
+    @property
+    def row_hashes_json(self) -> str:
+        # source_id + content hash per embedding row, used to re-embed only changed rows.
+        return os.path.join(self.index_dir, "catalog_row_hashes.json")
+
+    @property
+    def catalog_parquet(self) -> str:
+        # Normalized catalog, reused while the CSV content hash is unchanged.
+        return os.path.join(self.index_dir, "catalog_normalized.parquet")
+
     @property
     def faiss_index(self) -> str:
         return os.path.join(self.index_dir, "catalog.faiss")
@@ -23,20 +42,162 @@ class CatalogPaths:
         return os.path.join(self.index_dir, "catalog_meta.json")
 
 
-def load_catalog(csv_path: str) -> pd.DataFrame:
+def _try_import_pyarrow():
+    try:
+        import pyarrow  # type: ignore
+        import pyarrow.parquet  # type: ignore
+
+        return pyarrow
+    except Exception:
+        return None
+
+
+# Bump when normalize_catalog's output changes so old cache files are ignored.
+_CACHE_FORMAT = "2"
+_CACHE_KEY = b"comicai.catalog_key"
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_catalog(csv_path: str, cache_path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Loads and normalizes the catalog CSV.
+
+    With `cache_path` set (and pyarrow installed) the normalized frame is also written
+    there as Parquet, tagged with the CSV's content hash; later loads of the same CSV
+    read it back instead of parsing and normalizing again.
+    """
     if not csv_path or not os.path.exists(csv_path):
         return pd.DataFrame()
 
-    df = pd.read_csv(
-        csv_path,
-        engine="python",
-        on_bad_lines="skip",
-        quotechar='"',
-        escapechar="\\",
-    )
+    key = None
+    if cache_path:
+        key = f"{_CACHE_FORMAT}:{file_digest(csv_path)}"
+        cached = _read_catalog_cache(cache_path, key)
+        if cached is not None:
+            return cached
+
+    df = _read_csv(csv_path)
     if df.empty:
         return df
-    return normalize_catalog(df)
+    df = normalize_catalog(df)
+    if cache_path and key:
+        _write_catalog_cache(df, cache_path, key)
+    return df
+
+
+def _read_csv(csv_path: str) -> pd.DataFrame:
+    # Text columns, as iter_catalog_chunks reads them, so the web tier and the offline build
+    # derive the same source_id and search_text (an id column with blanks would otherwise
+    # be inferred as float here: "1.0" vs "1"). normalize_catalog converts year and rating.
+    opts = dict(on_bad_lines="skip", quotechar='"', escapechar="\\", dtype=str)
+    try:
+        return pd.read_csv(csv_path, engine="c", **opts)
+    except pd.errors.ParserError:
+        # The python engine tolerates a few malformed layouts the C parser rejects.
+        return pd.read_csv(csv_path, engine="python", **opts)
+
+
+def iter_catalog_chunks(csv_path: str, chunk_rows: int = 4096) -> Iterator[pd.DataFrame]:
+    """
+    Yields the normalized catalog in frames of up to `chunk_rows` rows, `row_id` numbered
+    across the whole file, without holding the whole CSV in memory.
+
+    Columns are read as text (no per-chunk type inference), so an id or title reads the
+    same in every chunk.
+    """
+    if not csv_path or not os.path.exists(csv_path):
+        return
+    opts = dict(on_bad_lines="skip", quotechar='"', escapechar="\\", dtype=str, chunksize=max(1, int(chunk_rows)))
+    offset = 0
+    skip = 0
+    for engine in ("c", "python"):
+        try:
+            with pd.read_csv(csv_path, engine=engine, **opts) as reader:
+                for chunk in reader:
+                    if skip:
+                        # Rows already yielded before the C parser gave up.
+                        drop = min(skip, len(chunk))
+                        chunk = chunk.iloc[drop:]
+                        skip -= drop
+                    if chunk.empty:
+                        continue
+                    chunk = normalize_catalog(chunk.reset_index(drop=True))
+                    chunk["row_id"] = range(offset, offset + len(chunk))
+                    chunk.index = chunk["row_id"].to_numpy()
+                    offset += len(chunk)
+                    yield chunk
+            return
+        except pd.errors.ParserError:
+            if engine == "python":
+                raise
+            skip = offset
+
+
+def _read_catalog_cache(cache_path: str, key: str) -> Optional[pd.DataFrame]:
+    pa = _try_import_pyarrow()
+    if pa is None or not os.path.exists(cache_path):
+        return None
+    try:
+        table = pa.parquet.read_table(cache_path)
+        if (table.schema.metadata or {}).get(_CACHE_KEY) != key.encode("utf-8"):
+            return None
+        df = table.to_pandas()
+    except Exception:
+        return None
+    df = df.where(pd.notnull(df), None)
+    # Tags are stored comma-joined (normalized tags never contain commas).
+    joined = df["tags"].fillna("")
+    tags = joined.str.split(",").to_numpy(dtype=object)
+    for i in np.flatnonzero(joined.eq("").to_numpy()):
+        tags[i] = []
+    df["tags"] = pd.Series(tags, index=df.index, dtype=object)
+    return df
+
+
+def _write_catalog_cache(df: pd.DataFrame, cache_path: str, key: str) -> None:
+    pa = _try_import_pyarrow()
+    if pa is None:
+        return
+    try:
+        out = df.assign(tags=df["tags"].str.join(","))
+        table = pa.Table.from_pandas(out, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[_CACHE_KEY] = key.encode("utf-8")
+        table = table.replace_schema_metadata(meta)
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        # Every worker may write the cache at start-up; each writes its own temp file.
+        f, tmp = open_temp_file(cache_path)
+        f.close()
+        try:
+            pa.parquet.write_table(table, tmp)
+            os.replace(tmp, cache_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    except Exception:
+        # The cache is an optimization only.
+        return
+
+
+def _normalize_tags(col: pd.Series) -> pd.Series:
+    # Comma-separated strings (or lists) -> lists of stripped, lowercased, non-empty tags.
+    col = col.fillna("")
+    is_list = col.map(type).eq(list).to_numpy()
+    text = col.where(~is_list, "").astype(str).str.strip().str.lower()
+    tags = text.str.split(r"\s*,\s*", regex=True).to_numpy(dtype=object)
+    # Only list inputs and strings with empty items ("", "a,,b", "a,") need the slow path.
+    irregular = is_list | text.str.contains(r"(?:^|,)\s*(?:,|$)", regex=True).to_numpy()
+    for i in np.flatnonzero(irregular):
+        src = col.iat[i] if is_list[i] else tags[i]
+        tags[i] = [str(t).strip().lower() for t in src if str(t).strip()]
+    return pd.Series(tags, index=col.index, dtype=object)
 
 
 def normalize_catalog(df: pd.DataFrame) -> pd.DataFrame:
@@ -69,16 +230,14 @@ def normalize_catalog(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             df[col] = default
 
-    # Tags normalization
-    def _to_tags(x) -> list:
-        if x is None:
-            return []
-        if isinstance(x, list):
-            return [str(t).strip().lower() for t in x if str(t).strip()]
-        s = str(x)
-        return [t.strip().lower() for t in s.split(",") if t.strip()]
+    df["tags"] = _normalize_tags(df["tags"])
 
-    df["tags"] = df["tags"].fillna("").apply(_to_tags)
+    # Columns are read as text; year and rating become numbers when every value parses.
+    for col in ("year", "rating"):
+        present = df[col].notna()
+        values = pd.to_numeric(df[col], errors="coerce")
+        if present.any() and bool(values[present].notna().all()):
+            df[col] = values
 
     # Fill text columns
     for col in ["title", "author", "publisher", "genre", "series", "description"]:
@@ -96,7 +255,7 @@ def normalize_catalog(df: pd.DataFrame) -> pd.DataFrame:
         + " "
         + df["genre"]
         + " "
-        + df["tags"].apply(lambda x: " ".join(x) if isinstance(x, list) else str(x))
+        + df["tags"].str.join(" ")
         + " "
         + df["description"]
     ).astype(str)
@@ -111,15 +270,58 @@ def normalize_catalog(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def row_content_hashes(texts: List[str]) -> List[str]:
+    # Hash exactly what gets embedded, so any change to it (and only that) forces a re-encode.
+    return [hashlib.blake2b(t.encode("utf-8"), digest_size=8).hexdigest() for t in texts]
+
+
 def build_source_id_map(df: pd.DataFrame) -> Dict[str, int]:
     # source_id -> row_id
     if df.empty or "source_id" not in df.columns or "row_id" not in df.columns:
         return {}
-    out = {}
-    for _, r in df[["source_id", "row_id"]].iterrows():
-        sid = str(r["source_id"])
-        out[sid] = int(r["row_id"])
-    return out
+    return dict(zip(df["source_id"].astype(str).tolist(), df["row_id"].astype(int).tolist()))
+
+
+def _match_key(s: Optional[str]) -> str:
+    return (s or "").strip().lower()
+
+
+@dataclass
+class TitleAuthorIndex:
+    """
+    Normalized title / (title, author) -> row_id lookups, with the same semantics as
+    best_effort_match_row_id: the first row with that author among the title matches,
+    else the first title match.
+    """
+
+    by_title: Dict[str, int]
+    by_title_author: Dict[Tuple[str, str], int]
+
+    def match(self, title: Optional[str], author: Optional[str]) -> Optional[int]:
+        t = _match_key(title)
+        if not t:
+            return None
+        a = _match_key(author)
+        if a:
+            rid = self.by_title_author.get((t, a))
+            if rid is not None:
+                return rid
+        return self.by_title.get(t)
+
+
+def build_title_author_index(df: pd.DataFrame) -> TitleAuthorIndex:
+    if df.empty or "title" not in df.columns or "row_id" not in df.columns:
+        return TitleAuthorIndex(by_title={}, by_title_author={})
+    titles = df["title"].astype(str).str.strip().str.lower().tolist()
+    authors = df["author"].astype(str).str.strip().str.lower().tolist()
+    row_ids = df["row_id"].astype(int).tolist()
+    by_title: Dict[str, int] = {}
+    by_title_author: Dict[Tuple[str, str], int] = {}
+    # setdefault keeps the first row for a key, matching the scan's iloc[0].
+    for t, a, rid in zip(titles, authors, row_ids):
+        by_title.setdefault(t, rid)
+        by_title_author.setdefault((t, a), rid)
+    return TitleAuthorIndex(by_title=by_title, by_title_author=by_title_author)
 
 
 def best_effort_match_row_id(df: pd.DataFrame, title: str, author: Optional[str]) -> Optional[int]:
@@ -0,0 +1,406 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+# Implicit feedback weight per library status for the CF matrix (non-positive = ignored).
+CF_STATUS_WEIGHTS = {
+    "favorite": 3.0,
+    "completed": 2.0,
+    "reading": 1.0,
+    "trash": -1.0,
+}
+
+
+class InteractionMatrix:
+    """
+    The user x item matrix of CF weights, kept current from library writes.
+
+    A compacted CSR (`base`) plus a dict of edits made since the last compaction,
+    keyed by (user row, item row). An edit overrides the base entry and weight <= 0
+    removes it. `compact()` merges the edits in one vectorized pass and returns a new
+    CSR. Earlier CSRs are never modified, so snapshots can keep a reference to one.
+    """
+
+    def __init__(self, n_items: int):
+        self.n_items = int(n_items)
+        self.user_ids: List[int] = []
+        self.user_row: Dict[int, int] = {}
+        self.base = None  # scipy.sparse.csr_matrix (n_users_at_compaction, n_items)
+        self.pending: Dict[Tuple[int, int], float] = {}
+        self.compactions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.base is not None
+
+    def load(self, user_ids: np.ndarray, items: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Full rebuild from parallel arrays of interactions. Non-positive weights still
+        register their user, as every user with a library entry gets a row.
+        """
+        import scipy.sparse  # type: ignore
+
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        items = np.asarray(items, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float32)
+        uniq, rows = np.unique(user_ids, return_inverse=True)
+        live = (weights > 0) & (items >= 0) & (items < self.n_items)
+        base = scipy.sparse.csr_matrix(
+            (weights[live], (rows[live], items[live])), shape=(len(uniq), self.n_items), dtype=np.float32
+        )
+        base.sum_duplicates()
+        with self._lock:
+            self.user_ids = [int(u) for u in uniq.tolist()]
+            self.user_row = {u: i for i, u in enumerate(self.user_ids)}
+            self.base = base
+            self.pending = {}
+
+    def set(self, user_id: int, item: int, weight: float) -> None:
+        # Records one interaction; weight <= 0 removes it at the next compaction.
+        if not 0 <= int(item) < self.n_items:
+            return
+        with self._lock:
+            row = self.user_row.get(int(user_id))
+            if row is None:
+                row = len(self.user_ids)
+                self.user_ids.append(int(user_id))
+                self.user_row[int(user_id)] = row
+            self.pending[(row, int(item))] = float(weight)
+
+    def set_many(self, edits: Iterable[Tuple[int, int, float]]) -> None:
+        for user_id, item, weight in edits:
+            self.set(user_id, item, weight)
+
+    def compact(self) -> Tuple[object, np.ndarray]:
+        """
+        Folds pending edits into a new base CSR. Returns the CSR and the DB user id of
+        each of its rows. Edits that arrive while this runs go into the next round.
+        """
+        import scipy.sparse  # type: ignore
+
+        with self._lock:
+            if self.base is None:
+                raise RuntimeError("InteractionMatrix.load() has not been called")
+            pending, self.pending = self.pending, {}
+            n_users = len(self.user_ids)
+            user_ids = np.asarray(self.user_ids, dtype=np.int64)
+            base = self.base
+        if not pending and base.shape[0] == n_users:
+            return base, user_ids
+
+        n = self.n_items
+        p_keys = np.fromiter((r * n + c for r, c in pending), dtype=np.int64, count=len(pending))
+        p_w = np.fromiter(pending.values(), dtype=np.float32, count=len(pending))
+        b_rows = np.repeat(np.arange(base.shape[0], dtype=np.int64), np.diff(base.indptr))
+        b_keys = b_rows * n + base.indices
+        keep = ~np.isin(b_keys, p_keys) if len(p_keys) else slice(None)
+        live = p_w > 0
+        keys = np.concatenate([b_keys[keep], p_keys[live]])
+        data = np.concatenate([base.data[keep], p_w[live]])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        indptr = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n, minlength=n_users), out=indptr[1:])
+        merged = scipy.sparse.csr_matrix(
+            (data[order], (keys % n).astype(np.int32), indptr), shape=(n_users, n)
+        )
+        with self._lock:
+            self.base = merged
+            self.compactions += 1
+        return merged, user_ids
+
+    def stats(self) -> Dict[str, int]:
+        base = self.base
+        return {
+            "users": len(self.user_ids),
+            "nnz": int(base.nnz) if base is not None else 0,
+            "pending": len(self.pending),
+            "compactions": self.compactions,
+        }
+
+
+@dataclass(frozen=True)
+class CFSnapshot:
+    """
+    Immutable ALS factors plus the user x item matrix they were trained on (used to
+    filter already-shelved items). Requests only ever read a whole snapshot.
+    """
+
+    version: int
+    item_factors: np.ndarray  # (n_items, f)
+    user_factors: np.ndarray  # (n_users, f)
+    user_ids: np.ndarray  # (n_users,) DB user id per user_factors row
+    user_items: object  # scipy.sparse.csr_matrix (n_users, n_items)
+    stamp: str  # catalog and interactions version the factors were trained on
+    built_at: float
+    train_seconds: float
+    user_id_to_col: Dict[int, int] = field(default_factory=dict)
+
+    def recommend(self, user_id: int, top_k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        col = self.user_id_to_col.get(int(user_id))
+        if col is None:
+            return None
+        scores = self.item_factors @ self.user_factors[col]
+        liked = self.user_items.indices[self.user_items.indptr[col] : self.user_items.indptr[col + 1]]
+        scores[liked] = -np.inf
+        k = min(int(top_k), int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return None
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top.astype(np.int64), scores[top].astype(np.float32)
+
+
+def _snapshot_with_index(**kw) -> CFSnapshot:
+    user_ids = kw["user_ids"]
+    return CFSnapshot(**kw, user_id_to_col={int(u): i for i, u in enumerate(user_ids.tolist())})
+
+
+def train_snapshot(user_items, user_ids: np.ndarray, stamp: str, version: int) -> CFSnapshot:
+    import implicit  # type: ignore
+
+    t0 = time.perf_counter()
+    model = implicit.als.AlternatingLeastSquares(
+        factors=64,
+        regularization=0.01,
+        iterations=15,
+        use_gpu=False,
+    )
+    model.fit(user_items, show_progress=False)
+    return _snapshot_with_index(
+        version=version,
+        item_factors=np.asarray(model.item_factors, dtype=np.float32),
+        user_factors=np.asarray(model.user_factors, dtype=np.float32),
+        user_ids=np.asarray(user_ids, dtype=np.int64),
+        user_items=user_items,
+        stamp=stamp,
+        built_at=time.time(),
+        train_seconds=time.perf_counter() - t0,
+    )
+
+
+class CFSnapshotStore:
+    """
+    Versioned snapshots in `directory`: cf_snapshot_v<N>.npz plus a cf_snapshot.json
+    pointer to the current one. Both are written then renamed, so readers in any process
+    see either the old or the new snapshot, never a partial one.
+    """
+
+    KEEP = 2
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.pointer_path = os.path.join(directory, "cf_snapshot.json")
+
+    def _path(self, version: int) -> str:
+        return os.path.join(self.directory, f"cf_snapshot_v{version}.npz")
+
+    def read_pointer(self) -> Optional[dict]:
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def load(self, pointer: Optional[dict] = None, n_items: Optional[int] = None) -> Optional[CFSnapshot]:
+        """
+        The snapshot `pointer` (default: the current one) refers to, or None when it is
+        missing, unreadable or, given `n_items`, trained on a catalog of another size.
+        """
+        import scipy.sparse  # type: ignore
+
+        pointer = pointer or self.read_pointer()
+        if not pointer:
+            return None
+        if n_items is not None and pointer.get("n_items") not in (None, int(n_items)):
+            return None
+        try:
+            with np.load(self._path(int(pointer["version"]))) as data:
+                if n_items is not None and data["item_factors"].shape[0] != int(n_items):
+                    return None
+                user_items = scipy.sparse.csr_matrix(
+                    (data["ui_data"], data["ui_indices"], data["ui_indptr"]), shape=tuple(data["ui_shape"])
+                )
+                return _snapshot_with_index(
+                    version=int(pointer["version"]),
+                    item_factors=data["item_factors"],
+                    user_factors=data["user_factors"],
+                    user_ids=data["user_ids"],
+                    user_items=user_items,
+                    stamp=str(pointer.get("stamp") or ""),
+                    built_at=float(pointer.get("built_at") or 0),
+                    train_seconds=float(pointer.get("train_seconds") or 0),
+                )
+        except Exception:
+            return None
+
+    def save(self, snap: CFSnapshot) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(snap.version)
+        tmp = path + ".tmp"
+        ui = snap.user_items
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                item_factors=snap.item_factors,
+                user_factors=snap.user_factors,
+                user_ids=snap.user_ids,
+                ui_data=ui.data,
+                ui_indices=ui.indices,
+                ui_indptr=ui.indptr,
+                ui_shape=np.asarray(ui.shape, dtype=np.int64),
+            )
+        os.replace(tmp, path)
+        pointer = {
+            "version": snap.version,
+            "stamp": snap.stamp,
+            "n_items": int(snap.item_factors.shape[0]),
+            "built_at": snap.built_at,
+            "train_seconds": snap.train_seconds,
+        }
+        tmp = self.pointer_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pointer, f)
+        os.replace(tmp, self.pointer_path)
+        for old in range(snap.version - self.KEEP, 0, -1):
+            if not os.path.exists(self._path(old)):
+                break
+            os.remove(self._path(old))
+
+    def try_lock(self):
+        # Only one process trains at a time; the others pick up its snapshot from disk.
+        if fcntl is None:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(os.path.join(self.directory, "cf_train.lock"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+
+class CFTrainer:
+    """
+    Keeps `current` (a CFSnapshot or None) fresh from a background thread.
+
+    Every `interval_seconds` the worker picks up a newer snapshot written by another
+    process, then asks `stamp_fn()` for the catalog and interactions version; when it
+    differs from the current snapshot's it fetches the user x item matrix from
+    `matrix_fn()`, trains, saves and swaps the new snapshot in. Requests just read
+    `current`. Both callables run inside `app.app_context()` when an app is given;
+    without one only snapshots already on disk are served. Snapshots on disk whose item
+    count is not `n_items` (trained on another catalog) are ignored.
+    """
+
+    def __init__(
+        self,
+        store: CFSnapshotStore,
+        stamp_fn: Callable[[], Optional[str]],
+        matrix_fn: Callable[[], Optional[Tuple[object, np.ndarray]]],
+        app=None,
+        interval_seconds: float = 60.0,
+        n_items: Optional[int] = None,
+    ):
+        self.store = store
+        self.stamp_fn = stamp_fn
+        self.matrix_fn = matrix_fn
+        self.app = app
+        self.interval_seconds = max(1.0, float(interval_seconds))
+        self.n_items = n_items
+        self.current: Optional[CFSnapshot] = None
+        self.trainings = 0
+        self.last_checked_at = 0.0
+        self.latest_stamp: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._pid = 0
+
+    def ensure_started(self) -> None:
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="cf-trainer", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:  # noqa: BLE001 - keep the worker alive, surface in stats()
+                self.last_error = f"{type(e).__name__}: {e}"
+            time.sleep(self.interval_seconds)
+
+    def _pick_up_from_disk(self) -> None:
+        pointer = self.store.read_pointer()
+        cur = self.current
+        if pointer and (cur is None or int(pointer.get("version", 0)) > cur.version):
+            snap = self.store.load(pointer, n_items=self.n_items)
+            if snap is not None:
+                self.current = snap
+
+    def refresh(self) -> None:
+        self._pick_up_from_disk()
+        if self.app is None:
+            return
+        with self.app.app_context():
+            stamp = self.stamp_fn()
+            self.last_checked_at = time.time()
+            self.latest_stamp = stamp
+            cur = self.current
+            if stamp is None or (cur is not None and cur.stamp == stamp):
+                return
+            lock = self.store.try_lock()
+            if lock is None:
+                return
+            try:
+                self._pick_up_from_disk()
+                cur = self.current
+                if cur is not None and cur.stamp == stamp:
+                    return
+                data = self.matrix_fn()
+                if data is None:
+                    return
+                user_items, user_ids = data
+                pointer = self.store.read_pointer() or {}
+                version = max(int(pointer.get("version", 0)), cur.version if cur else 0) + 1
+                snap = train_snapshot(user_items, user_ids, stamp=stamp, version=version)
+                self.store.save(snap)
+                self.current = snap
+                self.trainings += 1
+            finally:
+                if lock is not True:
+                    lock.close()
+
+    def stats(self) -> Dict[str, object]:
+        cur = self.current
+        return {
+            "version": cur.version if cur else None,
+            "built_at": cur.built_at if cur else None,
+            "age_seconds": time.time() - cur.built_at if cur else None,
+            "train_seconds": cur.train_seconds if cur else None,
+            # True when the last check saw interactions the current snapshot was not trained on.
+            "behind": self.latest_stamp is not None and (cur is None or cur.stamp != self.latest_stamp),
+            "last_checked_at": self.last_checked_at or None,
+            "trainings": self.trainings,
+            "last_error": self.last_error,
+        }
@@ -1,15 +1,258 @@
 from __future__ import annotations
 
+import bisect
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join((prompt or "").split()).casefold()
+
+
+class PromptEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by (model name, normalized prompt).
+
+    Entries expire `ttl_seconds` after they were computed. With `persist_path` set the
+    cache is loaded on start and written back by `save()` (write-then-rename, so
+    concurrent workers never see a torn file).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0, persist_path: Optional[str] = None):
+        self.max_size = max(1, int(max_size))
+        self.ttl_seconds = float(ttl_seconds)
+        self.persist_path = persist_path or None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (created_at wall clock, vector)
+        self._items: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        if self.persist_path:
+            self.load()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, model_name: str, prompt: str) -> Optional[np.ndarray]:
+        key = (model_name, prompt)
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or self._expired(item[0], now):
+                if item is not None:
+                    del self._items[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, model_name: str, prompt: str, vec: np.ndarray, created_at: Optional[float] = None) -> None:
+        v = np.array(vec, dtype=np.float32).reshape(-1)
+        v.setflags(write=False)
+        with self._lock:
+            self._items[(model_name, prompt)] = (created_at or time.time(), v)
+            self._items.move_to_end((model_name, prompt))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            live = [(k, ts, v) for k, (ts, v) in self._items.items() if not self._expired(ts, now)]
+        if not live:
+            return
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        # Keys go in a JSON string and vectors in one flat float32 array (no pickling);
+        # offsets let vectors of different models/dims share the file.
+        keys = [[k[0], k[1], ts] for k, ts, _ in live]
+        offsets = np.cumsum([0] + [len(v) for _, _, v in live])
+        # A temp file of our own: every worker saves at exit, possibly at the same time.
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(self.persist_path) or ".", prefix=os.path.basename(self.persist_path) + ".", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    keys=np.array(json.dumps(keys)),
+                    offsets=offsets.astype(np.int64),
+                    vectors=np.concatenate([v for _, _, v in live]).astype(np.float32),
+                )
+            os.replace(tmp, self.persist_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path) as data:
+                keys = json.loads(str(data["keys"]))
+                offsets = data["offsets"]
+                vectors = data["vectors"]
+        except Exception:
+            return
+        now = time.time()
+        for i, (model_name, prompt, created_at) in enumerate(keys):
+            if not self._expired(float(created_at), now):
+                vec = vectors[offsets[i] : offsets[i + 1]]
+                self.put(str(model_name), str(prompt), vec, created_at=float(created_at))
+
+
+class _PendingQuery:
+    __slots__ = ("text", "enqueued_at", "done", "vec", "error")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.vec: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+# Upper bounds (seconds) of the queue-delay buckets EncodeBatcher counts prompts into.
+QUEUE_DELAY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+
+
+class EncodeBatcher:
+    """
+    Coalesces concurrent single-prompt encodes into one batched forward pass.
+
+    The first queued prompt opens a batch that closes after `max_wait_ms` or once
+    `max_batch` prompts are waiting; duplicates within a batch are encoded once. A
+    daemon worker thread runs the batches and is restarted lazily after a fork.
+    """
+
+    def __init__(self, encode_fn: Callable[..., np.ndarray], max_batch: int = 16, max_wait_ms: float = 2.0):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._pid = 0
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Dict[int, int] = {}
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        # Prompts per QUEUE_DELAY_BUCKETS bucket, plus one for longer delays.
+        self.queue_delay_counts = [0] * (len(QUEUE_DELAY_BUCKETS) + 1)
+
+    def encode(self, text: str) -> np.ndarray:
+        self._ensure_worker()
+        item = _PendingQuery(text)
+        self._queue.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.vec
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            # After fork the parent's thread (and anything it held) is gone.
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+            self._worker.start()
+
+    def _collect(self) -> List[_PendingQuery]:
+        q = self._queue
+        batch = [q.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts = list(dict.fromkeys(p.text for p in batch))
+            try:
+                vecs = np.asarray(self.encode_fn(texts, batch_size=len(texts)), dtype=np.float32)
+                by_text = dict(zip(texts, vecs))
+                for p in batch:
+                    p.vec = by_text[p.text]
+            except BaseException as e:  # noqa: BLE001 - handed to every waiting caller
+                for p in batch:
+                    p.error = e
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                for p in batch:
+                    delay = started - p.enqueued_at
+                    self.queue_delay_total += delay
+                    self.queue_delay_max = max(self.queue_delay_max, delay)
+                    self.queue_delay_counts[bisect.bisect_left(QUEUE_DELAY_BUCKETS, delay)] += 1
+            for p in batch:
+                p.done.set()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_delay_ms": 1000.0 * self.queue_delay_total / self.items if self.items else 0.0,
+                "max_queue_delay_ms": 1000.0 * self.queue_delay_max,
+                "queue_delay_seconds": (QUEUE_DELAY_BUCKETS, list(self.queue_delay_counts), self.queue_delay_total),
+            }
+
 
 @dataclass
 class Embedder:
     model_name: str
     _model: object
+    cache: Optional[PromptEmbeddingCache] = None
+    batcher: Optional[EncodeBatcher] = None
+    backend: str = "torch"
+
+    @property
+    def cache_key(self) -> str:
+        # Vectors from different backends drift apart, so they never share cache entries.
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
 
     def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         # SentenceTransformer returns np.ndarray (float32/float64 depending on backend).
@@ -20,33 +263,312 @@ class Embedder:
             normalize_embeddings=False,
         )
 
+    def encode_query(self, prompt: str) -> np.ndarray:
+        """
+        Embeds a single user prompt, served from `cache` when possible and otherwise
+        batched with concurrent callers through `batcher` when one is set.
+        The normalized prompt is what gets encoded, so cached and fresh vectors agree.
+        """
+        text = normalize_prompt(prompt)
+        if self.cache is not None:
+            hit = self.cache.get(self.cache_key, text)
+            if hit is not None:
+                return hit
+        if self.batcher is not None:
+            vec = self.batcher.encode(text)
+        else:
+            vec = np.asarray(self.encode([text], batch_size=1), dtype=np.float32)[0]
+        if self.cache is not None:
+            self.cache.put(self.cache_key, text, vec)
+        return vec
+
+    def encode_queries(self, prompts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Embeds many prompts as an (m, dim) float32 matrix. Cache misses are deduplicated
+        and encoded in one `encode` call rather than one call per prompt.
+        """
+        texts = [normalize_prompt(p) for p in prompts]
+        found: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            for t in dict.fromkeys(texts):
+                hit = self.cache.get(self.cache_key, t)
+                if hit is not None:
+                    found[t] = hit
+        missing = [t for t in dict.fromkeys(texts) if t not in found]
+        if missing:
+            vecs = np.asarray(self.encode(missing, batch_size=batch_size), dtype=np.float32)
+            for t, v in zip(missing, vecs):
+                found[t] = v
+                if self.cache is not None:
+                    self.cache.put(self.cache_key, t, v)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([found[t] for t in texts]).astype(np.float32, copy=False)
 
-def load_embedder(model_name: str) -> Embedder:
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8-dynamic", "onnxruntime")
+
+# ONNX exports of embedding models, reused across process starts.
+_DEFAULT_ONNX_EXPORT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "comicai", "onnx")
+
+
+class _OnnxSentenceModel:
+    """
+    SentenceTransformer.encode() look-alike whose transformer runs in onnxruntime; the
+    model's own tokenizer, pooling and normalization modules run unchanged after it.
+    """
+
+    def __init__(self, st_model, ort_model):
+        self._st = st_model
+        self._ort = ort_model
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False, normalize_embeddings: bool = False):
+        import torch
+
+        post = list(self._st.children())[1:]
+        out = []
+        for start in range(0, len(texts), batch_size):
+            feats = self._st.tokenize(texts[start : start + batch_size])
+            with torch.no_grad():
+                hidden = self._ort(**feats).last_hidden_state
+                features = {"token_embeddings": torch.as_tensor(hidden), "attention_mask": feats["attention_mask"]}
+                for module in post:
+                    features = module(features)
+            out.append(features["sentence_embedding"].cpu().numpy())
+        emb = np.vstack(out) if out else np.empty((0, self._st.get_sentence_embedding_dimension()), dtype=np.float32)
+        if normalize_embeddings:
+            emb = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-12)
+        return emb
+
+
+def load_embedder(model_name: str, backend: str = "torch", export_dir: Optional[str] = None) -> Embedder:
+    """
+    backend: torch (fp32), torch-int8-dynamic (int8 Linear layers, CPU) or onnxruntime
+    (through optimum; falls back to torch, with a warning, when not installed or the export
+    fails). The ONNX export is cached under `export_dir`. The returned Embedder.backend is
+    the one actually used.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
     from sentence_transformers import SentenceTransformer
 
-    model = SentenceTransformer(model_name)
-    return Embedder(model_name=model_name, _model=model)
+    if backend == "torch":
+        return Embedder(model_name=model_name, _model=SentenceTransformer(model_name))
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8-dynamic":
+        import torch
+
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return Embedder(model_name=model_name, _model=model, backend=backend)
+
+    model_path = _sentence_transformer_path(model, model_name)
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction  # type: ignore
+
+        ort = _load_onnx_export(ORTModelForFeatureExtraction, model_path, export_dir or _DEFAULT_ONNX_EXPORT_DIR)
+    except Exception:
+        logger.warning("ONNX export of %s failed; encoding with torch instead", model_path, exc_info=True)
+        return Embedder(model_name=model_name, _model=model)
+    return Embedder(model_name=model_name, _model=_OnnxSentenceModel(model, ort), backend=backend)
+
+
+def _sentence_transformer_path(model, model_name: str) -> str:
+    # The local snapshot SentenceTransformer loaded its transformer from, else the hub id
+    # it resolved ("all-MiniLM-L6-v2" -> "sentence-transformers/all-MiniLM-L6-v2").
+    try:
+        path = model[0].auto_model.config._name_or_path
+        if path and os.path.isdir(path):
+            return path
+    except Exception:
+        pass
+    if os.path.exists(model_name) or "/" in model_name:
+        return model_name
+    return "sentence-transformers/" + model_name
+
+
+def _load_onnx_export(ort_class, model_path: str, export_dir: str):
+    """
+    The ONNX export of `model_path` as an optimum `ort_class` model, exported once and
+    then loaded from `export_dir`. Concurrent exports (several workers starting together)
+    each write a directory of their own; the first rename wins and the others are
+    discarded.
+    """
+    # One export per (model, task head).
+    stamp = f"{ort_class.__name__}:{model_path}"
+    if os.path.isdir(model_path):
+        stamp += f"@{os.path.getmtime(model_path)}"
+    digest = hashlib.blake2b(stamp.encode("utf-8"), digest_size=8).hexdigest()
+    name = "".join(c if c.isalnum() or c in "._-" else "_" for c in model_path.strip("/"))[-80:]
+    target = os.path.join(export_dir, f"{name}-{digest}")
+    if os.path.exists(os.path.join(target, "model.onnx")):
+        return ort_class.from_pretrained(target)
+
+    ort = ort_class.from_pretrained(model_path, export=True)
+    os.makedirs(export_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=export_dir, prefix=f"{name}-{digest}.")
+    try:
+        ort.save_pretrained(tmp)
+        os.replace(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return ort
+
+
+RERANK_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+class RerankScoreCache:
+    """
+    Bounded LRU of cross-encoder scores keyed by (prompt hash, row id), so repeated and
+    paginated queries only score candidates they have not seen.
+    """
+
+    def __init__(self, max_size: int = 50000):
+        self.max_size = max(1, int(max_size))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple[bytes, object], float]" = OrderedDict()
+
+    @staticmethod
+    def prompt_key(prompt: str) -> bytes:
+        return hashlib.blake2b(normalize_prompt(prompt).encode("utf-8"), digest_size=12).digest()
+
+    def get_many(self, prompt_key: bytes, keys: List[object]) -> List[Optional[float]]:
+        out: List[Optional[float]] = []
+        with self._lock:
+            for k in keys:
+                score = self._items.get((prompt_key, k))
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._items.move_to_end((prompt_key, k))
+                    self.hits += 1
+                out.append(score)
+        return out
+
+    def put_many(self, prompt_key: bytes, keys: List[object], scores: List[float]) -> None:
+        with self._lock:
+            for k, sc in zip(keys, scores):
+                self._items[(prompt_key, k)] = float(sc)
+                self._items.move_to_end((prompt_key, k))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
 
 
 class OptionalReranker:
-    def __init__(self, model_name: str):
+    """
+    Lazily loaded cross-encoder.
+
+    backend: torch (fp32), torch-int8 (dynamically quantized Linear layers, CPU) or onnx
+    (onnxruntime through optimum, exported once and cached under `export_dir`; falls back
+    to torch, with a warning, when not installed, see `backend_effective`). The onnx
+    backend loads only the tokenizer next to the session, not the torch model.
+    `max_length` is the token budget per (query, doc) pair; longer docs are truncated.
+    With a `cache`, scores are reused per (prompt, key).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        max_length: Optional[int] = None,
+        cache: Optional[RerankScoreCache] = None,
+        export_dir: Optional[str] = None,
+    ):
+        if backend not in RERANK_BACKENDS:
+            raise ValueError(f"Unknown rerank backend: {backend}")
         self.model_name = model_name
+        self.backend = backend
+        self.backend_effective = backend
+        self.max_length = int(max_length) if max_length else None
+        self.cache = cache
+        self.export_dir = export_dir or _DEFAULT_ONNX_EXPORT_DIR
         self._model = None
+        # onnx backend: the session, the tokenizer and the score activation.
+        self._ort = None
+        self._tokenizer = None
+        self._activation = None
 
     def available(self) -> bool:
         return True
 
     def load(self) -> None:
-        if self._model is not None:
+        if self._model is not None or self._ort is not None:
             return
+        if self.backend == "onnx":
+            try:
+                self._load_onnx()
+                return
+            except Exception:
+                logger.warning("ONNX export of %s failed; reranking with torch instead", self.model_name, exc_info=True)
+                self.backend_effective = "torch"
         from sentence_transformers import CrossEncoder
 
-        self._model = CrossEncoder(self.model_name)
+        model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu" if self.backend != "torch" else None)
+        if self.backend == "torch-int8":
+            import torch
+
+            model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self._model = model
+
+    def _load_onnx(self) -> None:
+        import torch
+        from optimum.onnxruntime import ORTModelForSequenceClassification  # type: ignore
+        from transformers import AutoTokenizer
+
+        ort = _load_onnx_export(ORTModelForSequenceClassification, self.model_name, self.export_dir)
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # CrossEncoder's default: a sigmoid over single-logit models.
+        self._activation = torch.nn.Sigmoid() if ort.config.num_labels == 1 else torch.nn.Identity()
+        self._ort = ort
 
-    def rerank(self, query: str, docs: List[str]) -> Optional[List[float]]:
+    def _predict(self, query: str, docs: List[str]) -> List[float]:
+        if self._ort is None:
+            scores = self._model.predict([(query, d) for d in docs])  # higher is better
+            return [float(s) for s in np.asarray(scores).reshape(-1)]
+
+        import torch
+
+        out = []
+        for start in range(0, len(docs), 32):
+            chunk = docs[start : start + 32]
+            features = self._tokenizer(
+                [query.strip()] * len(chunk),
+                [d.strip() for d in chunk],
+                padding=True,
+                truncation="longest_first",
+                max_length=self.max_length,
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                logits = torch.as_tensor(self._ort(**features).logits)
+                out.extend(self._activation(logits)[:, 0].tolist())
+        return [float(s) for s in out]
+
+    def rerank(self, query: str, docs: List[str], keys: Optional[List[object]] = None) -> Optional[List[float]]:
+        """
+        Scores each doc against `query`. `keys` (e.g. catalog row ids) identify the docs
+        for the score cache; without them every doc is scored.
+        """
         if not docs:
             return []
-        self.load()
-        pairs = [(query, d) for d in docs]
-        scores = self._model.predict(pairs)  # higher is better
-        return [float(s) for s in scores]
+        if self.cache is None or keys is None:
+            self.load()
+            return self._predict(query, docs)
+
+        pkey = self.cache.prompt_key(query)
+        scores = self.cache.get_many(pkey, keys)
+        todo = [i for i, sc in enumerate(scores) if sc is None]
+        if todo:
+            self.load()
+            fresh = self._predict(query, [docs[i] for i in todo])
+            for i, sc in zip(todo, fresh):
+                scores[i] = sc
+            self.cache.put_many(pkey, [keys[i] for i in todo], fresh)
+        return scores
@@ -0,0 +1,192 @@
+import os
+import tempfile
+from typing import Iterator, Optional, Union
+
+import numpy as np
+
+# On-disk dtypes for the catalog embedding matrix.
+#   float32: exact, 4 bytes/dim
+#   float16: ~1e-3 relative error, 2 bytes/dim
+#   int8:    symmetric per-row quantization (codes + one float32 scale per row), 1 byte/dim
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Rows per block when scoring a non-float32 matrix, so we never materialize a full
+# float32 copy of a memory-mapped file just to run one dot product.
+_DOT_CHUNK_ROWS = 65536
+
+
+class QuantizedEmbeddings:
+    """
+    Read-only int8 embedding matrix with per-row scales.
+
+    Behaves like a float32 ndarray for the operations the recommender needs:
+    `len()`, `.shape`, row indexing (`emb[rid]`, `emb[[r1, r2]]`) and `emb @ q`.
+    Rows are dequantized on access; the codes themselves can stay memory-mapped.
+    """
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __len__(self) -> int:
+        return int(self.codes.shape[0])
+
+    def __getitem__(self, key) -> np.ndarray:
+        codes = np.asarray(self.codes[key], dtype=np.float32)
+        scales = np.asarray(self.scales[key], dtype=np.float32)
+        if codes.ndim == 1:
+            return codes * scales
+        return codes * scales[:, None]
+
+    def __matmul__(self, other) -> np.ndarray:
+        return dot_scores(self, other)
+
+
+EmbeddingMatrix = Union[np.ndarray, QuantizedEmbeddings]
+
+
+def open_temp_file(path: str, mode: str = "wb+", **kwargs):
+    """
+    Opens a new temp file next to `path` and returns (file, temp path). Names are unique
+    per call, so writers in several processes never share one before renaming it over
+    `path`. Write-then-rename keeps workers that mapped the old file on a consistent view.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    return os.fdopen(fd, mode, **kwargs), tmp
+
+
+def quantize_int8(emb: np.ndarray):
+    emb = np.asarray(emb, dtype=np.float32)
+    scales = np.abs(emb).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(emb / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class EmbeddingWriter:
+    """
+    Writes an embedding matrix of known shape to disk chunk by chunk, without ever
+    holding the whole matrix: each appended chunk is converted to the storage dtype and
+    written straight after the .npy header. int8 storage writes the codes to `path` and
+    one float32 scale per row to `scales_path`.
+
+    Rows go to temp files of this writer's own; commit() renames them into place (scales
+    first) once every row has been written, abort() discards them.
+    """
+
+    def __init__(self, path: str, scales_path: str, n_rows: int, dim: int, storage_dtype: str):
+        if storage_dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding storage dtype: {storage_dtype}")
+        self.path = path
+        self.scales_path = scales_path
+        self.n_rows = int(n_rows)
+        self.dim = int(dim)
+        self.storage_dtype = storage_dtype
+        self.rows = 0
+        self._files = {}
+        self._tmp = {}
+        dtype = np.int8 if storage_dtype == "int8" else np.dtype(storage_dtype)
+        self._open(path, dtype, (self.n_rows, self.dim))
+        if storage_dtype == "int8":
+            self._open(scales_path, np.float32, (self.n_rows,))
+
+    def _open(self, path: str, dtype, shape) -> None:
+        f, self._tmp[path] = open_temp_file(path)
+        np.lib.format.write_array_header_1_0(
+            f, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape}
+        )
+        # (file, dtype, offset of the first row)
+        self._files[path] = (f, np.dtype(dtype), f.tell())
+
+    def append(self, emb: np.ndarray) -> None:
+        emb = np.asarray(emb, dtype=np.float32)
+        if emb.ndim != 2 or emb.shape[1] != self.dim:
+            raise ValueError(f"Expected rows of dim {self.dim}, got shape {emb.shape}")
+        if self.rows + len(emb) > self.n_rows:
+            raise ValueError(f"More than the {self.n_rows} rows this writer was opened for")
+        if self.storage_dtype == "int8":
+            codes, scales = quantize_int8(emb)
+            self._files[self.path][0].write(codes.tobytes())
+            self._files[self.scales_path][0].write(scales.tobytes())
+        else:
+            self._files[self.path][0].write(np.ascontiguousarray(emb, dtype=self.storage_dtype).tobytes())
+        self.rows += len(emb)
+
+    def iter_chunks(self, chunk_rows: int = _DOT_CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """
+        Reads the rows written so far back as float32 chunks (dequantized for int8).
+        """
+        f, dtype, offset = self._files[self.path]
+        f.flush()
+        scales = self._files.get(self.scales_path)
+        if scales is not None:
+            scales[0].flush()
+        for start in range(0, self.rows, chunk_rows):
+            count = min(chunk_rows, self.rows - start)
+            f.seek(offset + start * self.dim * dtype.itemsize)
+            chunk = np.fromfile(f, dtype=dtype, count=count * self.dim).reshape(count, self.dim).astype(np.float32)
+            if scales is not None:
+                scales[0].seek(scales[2] + start * 4)
+                chunk *= np.fromfile(scales[0], dtype=np.float32, count=count)[:, None]
+            yield chunk
+        # Later appends continue at the end of each file.
+        for g, _, _ in self._files.values():
+            g.seek(0, os.SEEK_END)
+
+    def commit(self) -> None:
+        if self.rows != self.n_rows:
+            raise ValueError(f"Wrote {self.rows} of {self.n_rows} rows")
+        self._close()
+        if self.storage_dtype == "int8":
+            os.replace(self._tmp.pop(self.scales_path), self.scales_path)
+        elif os.path.exists(self.scales_path):
+            os.remove(self.scales_path)
+        os.replace(self._tmp.pop(self.path), self.path)
+
+    def abort(self) -> None:
+        self._close()
+        for tmp in self._tmp.values():
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._tmp = {}
+
+    def _close(self) -> None:
+        for f, _, _ in self._files.values():
+            f.close()
+        self._files = {}
+
+
+def load_embeddings(path: str, scales_path: str, mmap: bool) -> EmbeddingMatrix:
+    # mmap_mode="r" maps the file read-only: pages live in the OS page cache and are
+    # shared by every process that maps the same file.
+    mode: Optional[str] = "r" if mmap else None
+    arr = np.load(path, mmap_mode=mode)
+    if arr.dtype == np.int8:
+        scales = np.load(scales_path, mmap_mode=mode)
+        return QuantizedEmbeddings(arr, scales)
+    return arr
+
+
+def dot_scores(emb: EmbeddingMatrix, q: np.ndarray) -> np.ndarray:
+    """
+    Returns `emb @ q` as float32 for q of shape (dim, k).
+    """
+    q = np.asarray(q, dtype=np.float32)
+    if isinstance(emb, np.ndarray) and emb.dtype == np.float32:
+        return emb @ q
+
+    codes = emb.codes if isinstance(emb, QuantizedEmbeddings) else emb
+    n = int(codes.shape[0])
+    out = np.empty((n, q.shape[1]), dtype=np.float32)
+    for start in range(0, n, _DOT_CHUNK_ROWS):
+        stop = min(start + _DOT_CHUNK_ROWS, n)
+        out[start:stop] = np.asarray(codes[start:stop], dtype=np.float32) @ q
+    if isinstance(emb, QuantizedEmbeddings):
+        out *= np.asarray(emb.scales, dtype=np.float32)[:, None]
+    return out
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_GENRE_SPLIT = re.compile(r"\s*[,/;|]\s*")
+
+
+def _norm(value) -> str:
+    return " ".join(str(value or "").split()).lower()
+
+
+def _values(raw) -> Tuple[str, ...]:
+    # A filter field accepts one string or a list of strings (OR'ed together).
+    if raw is None:
+        return ()
+    if isinstance(raw, str):
+        raw = [raw]
+    if not isinstance(raw, (list, tuple)):
+        raise ValueError("Filter values must be a string or a list of strings")
+    out = []
+    for v in raw:
+        if not isinstance(v, (str, int)):
+            raise ValueError("Filter values must be a string or a list of strings")
+        v = _norm(v)
+        if v:
+            out.append(v)
+    return tuple(sorted(set(out)))
+
+
+def _year(raw) -> Optional[int]:
+    if raw is None or raw == "":
+        return None
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid year: {raw!r}") from None
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """
+    Structured restriction of a recommendation to matching catalog rows.
+
+    Values within a field are OR'ed, fields are AND'ed. Matching is case-insensitive
+    and exact per value; a row's genre string is split on , / ; | into its genres.
+    """
+
+    genres: Tuple[str, ...] = ()
+    publishers: Tuple[str, ...] = ()
+    authors: Tuple[str, ...] = ()
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+
+    @staticmethod
+    def from_payload(payload) -> Optional["SearchFilters"]:
+        """
+        Parses the `filters` object of an API request:
+          {"genre": "manga" | [...], "publisher": ..., "author": ..., "year_min": 2010, "year_max": ...}
+        Returns None when no filter is set; raises ValueError on malformed input.
+        """
+        if payload is None:
+            return None
+        if not isinstance(payload, dict):
+            raise ValueError("filters must be an object")
+        f = SearchFilters(
+            genres=_values(payload.get("genre", payload.get("genres"))),
+            publishers=_values(payload.get("publisher", payload.get("publishers"))),
+            authors=_values(payload.get("author", payload.get("authors"))),
+            year_min=_year(payload.get("year_min")),
+            year_max=_year(payload.get("year_max")),
+        )
+        return None if f.is_empty() else f
+
+    def is_empty(self) -> bool:
+        return not (self.genres or self.publishers or self.authors) and self.year_min is None and self.year_max is None
+
+
+class AttributeIndex:
+    """
+    Per-value row-id sets over the catalog, built once, for genre, publisher and author,
+    plus the rows sorted by year for range filters.
+
+    `mask(filters)` ORs the sets of each field and ANDs the fields into a boolean row
+    mask, which VectorIndex.search applies during retrieval. Masks are cached per
+    distinct filter, as the same few filters tend to repeat.
+    """
+
+    def __init__(self, df: pd.DataFrame, cache_size: int = 256):
+        self.n_rows = int(len(df))
+        self.genres = self._postings(
+            (_GENRE_SPLIT.split(_norm(g)) for g in df["genre"].tolist()) if "genre" in df else ()
+        )
+        self.publishers = self._postings(([_norm(p)] for p in df["publisher"].tolist()) if "publisher" in df else ())
+        self.authors = self._postings(([_norm(a)] for a in df["author"].tolist()) if "author" in df else ())
+
+        years = pd.to_numeric(df["year"], errors="coerce").to_numpy(dtype=np.float64) if "year" in df else np.array([])
+        has_year = np.flatnonzero(~np.isnan(years))
+        order = np.argsort(years[has_year], kind="stable")
+        self._year_rows = has_year[order].astype(np.int64)
+        self._year_values = years[has_year][order]
+
+        self.cache_size = int(cache_size)
+        self._cache: "OrderedDict[SearchFilters, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _postings(values_per_row) -> Dict[str, np.ndarray]:
+        rows: Dict[str, list] = {}
+        for row, values in enumerate(values_per_row):
+            for v in values:
+                if v:
+                    rows.setdefault(v, []).append(row)
+        return {v: np.asarray(r, dtype=np.int64) for v, r in rows.items()}
+
+    def _any_of(self, postings: Dict[str, np.ndarray], values: Tuple[str, ...]) -> np.ndarray:
+        m = np.zeros(self.n_rows, dtype=bool)
+        for v in values:
+            rows = postings.get(v)
+            if rows is not None:
+                m[rows] = True
+        return m
+
+    def _build(self, f: SearchFilters) -> np.ndarray:
+        m = np.ones(self.n_rows, dtype=bool)
+        if f.genres:
+            m &= self._any_of(self.genres, f.genres)
+        if f.publishers:
+            m &= self._any_of(self.publishers, f.publishers)
+        if f.authors:
+            m &= self._any_of(self.authors, f.authors)
+        if f.year_min is not None or f.year_max is not None:
+            lo = 0 if f.year_min is None else np.searchsorted(self._year_values, f.year_min, side="left")
+            hi = len(self._year_values) if f.year_max is None else np.searchsorted(self._year_values, f.year_max, side="right")
+            in_range = np.zeros(self.n_rows, dtype=bool)
+            in_range[self._year_rows[lo:hi]] = True
+            m &= in_range
+        m.flags.writeable = False
+        return m
+
+    def mask(self, filters: Optional[SearchFilters]) -> Optional[np.ndarray]:
+        """
+        Read-only boolean mask of the rows matching `filters`, or None for no filter.
+        """
+        if filters is None or filters.is_empty():
+            return None
+        with self._lock:
+            m = self._cache.get(filters)
+            if m is not None:
+                self._cache.move_to_end(filters)
+                self.hits += 1
+                return m
+            self.misses += 1
+        m = self._build(filters)
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[filters] = m
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return m
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+FUSION_METHODS = ("weighted", "rrf")
+
+# (row ids, scores, weight). Ids are row offsets into the catalog; negative ids (FAISS
+# padding) are ignored. For "rrf" each list must be ordered best-first.
+Source = Tuple[np.ndarray, np.ndarray, float]
+
+
+def fuse(
+    sources: Sequence[Source],
+    top_k: int,
+    method: str = "weighted",
+    rrf_k: int = 60,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combines any number of ranked candidate lists into one (row ids, scores) top-k.
+
+    weighted: score(row) = sum_i w_i * score_i(row)
+    rrf:      score(row) = sum_i w_i / (rrf_k + rank_i(row)), ranks starting at 1
+
+    A row missing from a list contributes nothing for that list. The result is sorted
+    by descending score.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+
+    ids_parts = []
+    val_parts = []
+    for ids, scores, weight in sources:
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if method == "rrf":
+            vals = float(weight) / (rrf_k + np.arange(1, len(ids) + 1, dtype=np.float32))
+        else:
+            vals = float(weight) * np.asarray(scores, dtype=np.float32).reshape(-1)
+        keep = ids >= 0
+        ids_parts.append(ids[keep])
+        val_parts.append(vals[keep])
+
+    if not ids_parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    all_ids = np.concatenate(ids_parts)
+    if all_ids.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    # Scatter-add onto the distinct candidate rows (not the whole catalog).
+    rows, inverse = np.unique(all_ids, return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate(val_parts), minlength=len(rows))
+
+    if len(rows) > top_k:
+        part = np.argpartition(-totals, top_k - 1)[:top_k]
+    else:
+        part = np.arange(len(rows))
+    order = part[np.argsort(-totals[part], kind="stable")]
+    return rows[order], totals[order].astype(np.float32)
@@ -0,0 +1,160 @@
+"""
+Process-local request metrics in the Prometheus text exposition format.
+
+Requests time their stages with a StageTimer (one perf_counter() call per stage) and
+hand it to MetricsRegistry.observe_stages, which feeds one fixed-bucket histogram per
+(op, stage). Gauges that are cheaper to read on demand, such as cache and index sizes,
+are passed to render() as samples at scrape time instead of being kept up to date.
+
+Every worker process has its own registry; a scrape sees the worker that served it.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Seconds; request stages range from tens of microseconds (fusion) to seconds (rerank).
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (name, type, help, labels, value) as accepted by MetricsRegistry.render. The value of a
+# "histogram" sample is a HistogramValue.
+Sample = Tuple[str, str, str, Dict[str, str], object]
+
+# (bucket upper bounds, observations per bucket plus one past the last bound, sum).
+HistogramValue = Tuple[Tuple[float, ...], List[int], float]
+
+
+class StageTimer:
+    """
+    Wall-clock time per named stage of one request. `lap(stage)` charges the time since
+    the previous lap (or since the timer started) to `stage`; a repeated stage adds up.
+    """
+
+    __slots__ = ("stages", "started", "_last")
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self.started
+
+    def as_ms(self) -> Dict[str, float]:
+        out = {stage: round(s * 1000.0, 3) for stage, s in self.stages.items()}
+        out["total"] = round(self.total() * 1000.0, 3)
+        return out
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * n_buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _histogram_lines(name: str, labels: Dict[str, str], bounds: Tuple[float, ...], counts: List[int], total: float) -> List[str]:
+    lines = []
+    cumulative = 0
+    for le, c in zip(tuple(bounds) + (float("inf"),), counts):
+        cumulative += c
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(le)})} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return lines
+
+
+def _number(v: float) -> str:
+    if v != v:
+        return "NaN"
+    if v in (float("inf"), float("-inf")):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "comicai", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._stages: Dict[Tuple[str, str], _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, op: str, stage: str, seconds: float) -> None:
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._stages.get((op, stage))
+            if h is None:
+                h = self._stages[(op, stage)] = _Histogram(len(self.buckets) + 1)
+            h.counts[i] += 1
+            h.sum += seconds
+            h.count += 1
+
+    def observe_stages(self, op: str, timer: StageTimer) -> None:
+        """
+        Records every stage of `timer`, plus its total, under `op`.
+        """
+        for stage, seconds in timer.stages.items():
+            self.observe(op, stage, seconds)
+        self.observe(op, "total", timer.total())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+    def render(self, samples: Optional[Iterable[Sample]] = None) -> str:
+        """
+        The stage histograms plus `samples`, in text format 0.0.4.
+        """
+        p = self.prefix
+        lines: List[str] = []
+        with self._lock:
+            stages = sorted(self._stages.items())
+            hists = [(op, stage, list(h.counts), h.sum, h.count) for (op, stage), h in stages]
+
+        if hists:
+            name = f"{p}_stage_seconds"
+            lines.append(f"# HELP {name} Time spent per request stage.")
+            lines.append(f"# TYPE {name} histogram")
+            for op, stage, counts, total, _ in hists:
+                lines.extend(_histogram_lines(name, {"op": op, "stage": stage}, self.buckets, counts, total))
+
+        # Samples of one metric are grouped under a single HELP/TYPE header.
+        typed: Dict[str, Tuple[str, str, List[str]]] = {}
+        for name, kind, help_line, labels, value in samples or ():
+            if value is None:
+                continue
+            full = f"{p}_{name}"
+            rows = typed.setdefault(full, (kind, help_line, []))[2]
+            if kind == "histogram":
+                rows.extend(_histogram_lines(full, labels, *value))
+            else:
+                rows.append(f"{full}{_labels(labels)} {_number(value)}")
+        for full, (kind, help_line, rows) in typed.items():
+            if help_line:
+                lines.append(f"# HELP {full} {help_line}")
+            lines.append(f"# TYPE {full} {kind}")
+            lines.extend(rows)
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry the recommender and the routes report to.
+REGISTRY = MetricsRegistry()
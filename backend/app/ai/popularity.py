@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+# Weight of a library entry in the popularity score, by status. Trashed comics were
+# picked up once but are not recommended to others on that basis.
+POPULARITY_STATUS_WEIGHTS = {
+    "favorite": 3.0,
+    "completed": 2.0,
+    "reading": 1.0,
+    "trash": 0.0,
+}
+
+# Rebase the decay epoch once scores have grown by 2**_REBASE_HALF_LIVES.
+_REBASE_HALF_LIVES = 64.0
+
+
+class PopularityIndex:
+    """
+    Time-decayed popularity of every catalog row, from library entries.
+
+    Forward decay: an entry written at time t contributes w * 2**((t - epoch) / half_life).
+    Every score is the decayed score at any later time times the same factor, so rankings
+    never need rescaling as time passes; only the epoch is moved forward now and then to
+    keep the numbers small.
+
+    `set()` replaces one (user, row) entry and updates that row's score in place. The
+    current contribution of every entry is kept (sorted arrays from the last compaction
+    plus a dict of edits since) so a changed or removed entry is subtracted exactly.
+    `compact()` folds the edits in, recomputes the scores and precomputes the best `depth`
+    rows overall and per genre, so `top()` is a slice.
+    """
+
+    def __init__(self, n_items: int, genre_rows: Dict[str, np.ndarray], half_life_seconds: float, depth: int = 100):
+        self.n_items = int(n_items)
+        self.genre_rows = genre_rows
+        self.half_life = max(1.0, float(half_life_seconds))
+        self.depth = max(1, int(depth))
+        self.epoch = time.time()
+        self.scores = np.zeros(self.n_items, dtype=np.float64)
+        self.keys = np.zeros(0, dtype=np.int64)  # user_id * n_items + row, sorted
+        self.values = np.zeros(0, dtype=np.float64)
+        self.pending: Dict[int, float] = {}
+        # Bumped whenever the top lists change.
+        self.version = 0
+        self.compactions = 0
+        self.loaded = False
+        self._top: Dict[Optional[str], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _contribution(self, weight: float, at: float) -> float:
+        return float(weight) * 2.0 ** ((float(at) - self.epoch) / self.half_life) if weight > 0 else 0.0
+
+    def load(self, user_ids: np.ndarray, items: np.ndarray, weights: np.ndarray, times: np.ndarray) -> None:
+        """
+        Full rebuild from parallel arrays of library entries (write times as epoch seconds).
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        items = np.asarray(items, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        live = (weights > 0) & (items >= 0) & (items < self.n_items)
+        epoch = time.time()
+        keys = user_ids[live] * self.n_items + items[live]
+        values = weights[live] * np.exp2((times[live] - epoch) / self.half_life)
+        keys, first = np.unique(keys, return_index=True)
+        with self._lock:
+            self.epoch = epoch
+            self.keys, self.values = keys, values[first]
+            self.pending = {}
+            self._rebuild()
+            self.loaded = True
+
+    def set(self, user_id: int, item: int, weight: float, at: Optional[float] = None) -> None:
+        # Records one library entry; weight <= 0 (or a removed entry) takes it out.
+        if not 0 <= int(item) < self.n_items:
+            return
+        key = int(user_id) * self.n_items + int(item)
+        with self._lock:
+            new = self._contribution(weight, time.time() if at is None else at)
+            old = self.pending.get(key)
+            if old is None:
+                i = int(np.searchsorted(self.keys, key))
+                old = float(self.values[i]) if i < len(self.keys) and self.keys[i] == key else 0.0
+            self.scores[int(item)] += new - old
+            self.pending[key] = new
+
+    def compact(self) -> bool:
+        """
+        Folds pending edits into the sorted arrays and recomputes scores and top lists.
+        Returns whether anything changed. Holds the lock throughout, so concurrent set()
+        calls wait instead of racing the merge.
+        """
+        with self._lock:
+            rebase = time.time() - self.epoch > _REBASE_HALF_LIVES * self.half_life
+            if not self.pending and not rebase:
+                return False
+            if self.pending:
+                p_keys = np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending))
+                p_vals = np.fromiter(self.pending.values(), dtype=np.float64, count=len(self.pending))
+                keep = ~np.isin(self.keys, p_keys)
+                live = p_vals > 0
+                keys = np.concatenate([self.keys[keep], p_keys[live]])
+                values = np.concatenate([self.values[keep], p_vals[live]])
+                order = np.argsort(keys, kind="stable")
+                self.keys, self.values = keys[order], values[order]
+                self.pending = {}
+            if rebase:
+                now = time.time()
+                self.values = self.values * 2.0 ** ((self.epoch - now) / self.half_life)
+                self.epoch = now
+            self._rebuild()
+            self.compactions += 1
+            return True
+
+    def _rebuild(self) -> None:
+        # Caller holds the lock; pending is empty.
+        self.scores = np.bincount(self.keys % self.n_items, weights=self.values, minlength=self.n_items)
+        top = {None: self._best(np.arange(self.n_items))}
+        for genre, rows in self.genre_rows.items():
+            best = self._best(rows)
+            if len(best):
+                top[genre] = best
+        self._top = top
+        self.version += 1
+
+    def _best(self, rows: np.ndarray) -> np.ndarray:
+        s = self.scores[rows]
+        rows = rows[s > 0]
+        s = s[s > 0]
+        if len(rows) > self.depth:
+            part = np.argpartition(-s, self.depth - 1)[: self.depth]
+            rows, s = rows[part], s[part]
+        # Ties keep catalog order.
+        out = rows[np.lexsort((rows, -s))]
+        out.setflags(write=False)
+        return out
+
+    def top(self, genre: Optional[str] = None) -> np.ndarray:
+        """
+        Up to `depth` row ids, most popular first, overall or for one (normalized) genre,
+        as of the last compaction. Rows nobody has shelved are never listed.
+        """
+        top = self._top.get(genre)
+        return top if top is not None else np.zeros(0, dtype=np.int64)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": int(len(self.keys)),
+            "pending": len(self.pending),
+            "compactions": self.compactions,
+            "version": self.version,
+        }
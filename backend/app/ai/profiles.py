@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Implicit feedback weight per library status for the profile embedding.
+PROFILE_STATUS_WEIGHTS = {
+    "favorite": 2.0,
+    "completed": 1.5,
+    "reading": 1.0,
+    "trash": -1.0,
+}
+
+# Statuses whose comics are never recommended back to the user.
+EXCLUDED_STATUSES = frozenset({"favorite", "completed", "trash"})
+
+
+class UserProfile:
+    """
+    Running weighted sum of a user's library vectors.
+
+    Keeps each comic's (row id, weight, excluded) so a status change or removal is undone
+    and redone in O(dim), without re-reading the rest of the library. `excluded` marks
+    rows the search must skip for this user (see EXCLUDED_STATUSES).
+    """
+
+    def __init__(self, dim: int):
+        self.items: Dict[int, Tuple[int, float, bool]] = {}  # comic_id -> (row id, weight, excluded)
+        self.total = np.zeros(dim, dtype=np.float64)
+        self.abs_weight = 0.0
+        self._excluded: Optional[np.ndarray] = None
+
+    def set(self, comic_id: int, row_id: Optional[int], weight: float, emb, excluded: bool = False) -> None:
+        self.remove(comic_id, emb)
+        if row_id is None or weight == 0.0:
+            return
+        self.items[comic_id] = (int(row_id), float(weight), bool(excluded))
+        self.total += weight * np.asarray(emb[int(row_id)], dtype=np.float64)
+        self.abs_weight += abs(weight)
+        if excluded:
+            self._excluded = None
+
+    def remove(self, comic_id: int, emb) -> None:
+        old = self.items.pop(comic_id, None)
+        if old is None:
+            return
+        rid, w, excluded = old
+        if excluded:
+            self._excluded = None
+        self.total -= w * np.asarray(emb[rid], dtype=np.float64)
+        self.abs_weight -= abs(w)
+        if not self.items:
+            # Drop accumulated rounding error once the library is empty again.
+            self.total[:] = 0.0
+            self.abs_weight = 0.0
+
+    def vector(self) -> Optional[np.ndarray]:
+        if not self.items:
+            return None
+        return (self.total / (self.abs_weight + 1e-6)).astype(np.float32)
+
+    def excluded_rows(self) -> np.ndarray:
+        # Sorted row ids to leave out of this user's results; rebuilt only after a change.
+        if self._excluded is None:
+            rows = {rid for rid, _, excluded in self.items.values() if excluded}
+            self._excluded = np.asarray(sorted(rows), dtype=np.int64)
+        return self._excluded
+
+    def snapshot(self) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        return self.vector(), self.excluded_rows()
+
+
+class UserProfileCache:
+    """
+    Bounded LRU cache of UserProfile by user id.
+
+    Library writes in this process update entries in place. Entries also expire
+    `ttl_seconds` after they were built, which bounds how long writes served by other
+    worker processes stay invisible here.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl_seconds = float(ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[int, Tuple[float, UserProfile]]" = OrderedDict()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, user_id: int) -> Optional[Tuple[Optional[np.ndarray], np.ndarray]]:
+        # UserProfile.snapshot() of a cached user, or None on a miss. A None vector means
+        # a cached library with no usable items.
+        now = time.time()
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None or self._expired(item[0], now):
+                if item is not None:
+                    del self._items[user_id]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(user_id)
+            self.hits += 1
+            return item[1].snapshot()
+
+    def put(self, user_id: int, profile: UserProfile) -> None:
+        with self._lock:
+            self._items[user_id] = (time.time(), profile)
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def update(
+        self, user_id: int, comic_id: int, row_id: Optional[int], weight: float, emb, excluded: bool = False
+    ) -> None:
+        # Applies one library change to a cached profile; uncached users are built on demand.
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is not None:
+                item[1].set(comic_id, row_id, weight, emb, excluded=excluded)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._items.clear()
+            else:
+                self._items.pop(user_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -1,19 +1,70 @@
 from __future__ import annotations
 
+import atexit
+import bisect
+import hashlib
+import logging
 import os
-from dataclasses import dataclass
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple
 
 import numpy as np
+from flask import current_app, has_app_context
 
 from ..models.comic import Comic
 from ..models.interaction import UserComic
 from .. import db
 
-from .catalog import CatalogPaths, build_source_id_map, best_effort_match_row_id, load_catalog
-from .embedding import OptionalReranker, load_embedder
+from .catalog import (
+    CatalogPaths,
+    build_source_id_map,
+    build_title_author_index,
+    load_catalog,
+    row_content_hashes,
+)
+from .embedding import EncodeBatcher, OptionalReranker, PromptEmbeddingCache, RerankScoreCache, load_embedder
+from .cf import CF_STATUS_WEIGHTS, CFSnapshotStore, CFTrainer, InteractionMatrix
+from .filters import AttributeIndex, SearchFilters
+from .fusion import fuse
+from .metrics import REGISTRY, HistogramValue, Sample, StageTimer
+from .popularity import POPULARITY_STATUS_WEIGHTS, PopularityIndex
+from .profiles import EXCLUDED_STATUSES, PROFILE_STATUS_WEIGHTS, UserProfile, UserProfileCache
 from .query import parse_query
-from .vector_index import VectorIndex
+from .records import RecordStore
+from .response_cache import ResponseCache
+from .vector_index import IndexParams, VectorIndex, fill_rows
+
+logger = logging.getLogger(__name__)
+
+
+_WARMUP_PROMPT = "a dark fantasy adventure with a strong female lead"
+
+# Catalog rows encoded and written per step of an index rebuild.
+_INGEST_CHUNK_ROWS = 4096
+
+
+# Upper bounds of the encode batch-size histogram buckets.
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _size_histogram(sizes: Dict[int, int]) -> HistogramValue:
+    # {batch size: batches} -> a histogram over _BATCH_SIZE_BUCKETS.
+    counts = [0] * (len(_BATCH_SIZE_BUCKETS) + 1)
+    for size, n in sizes.items():
+        counts[bisect.bisect_left(_BATCH_SIZE_BUCKETS, size)] += n
+    return _BATCH_SIZE_BUCKETS, counts, float(sum(size * n for size, n in sizes.items()))
+
+
+def _utc_timestamp(value: Optional[datetime]) -> float:
+    # UserComic.updated_at is stored as naive UTC.
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
 
 
 @dataclass
@@ -26,6 +77,95 @@ class RecommenderConfig:
     prompt_weight: float
     profile_weight: float
     cf_weight: float = 0.0
+    # torch | torch-int8-dynamic | onnxruntime (see embedding.load_embedder)
+    embedding_backend: str = "torch"
+    embedding_storage: str = "float32"
+    embedding_mmap: bool = False
+    index_params: IndexParams = field(default_factory=IndexParams)
+    # False: never build the index in-process; a missing or stale index is an error
+    # (build it offline with `python -m app.ai.build_index`).
+    index_auto_build: bool = True
+    prompt_cache_size: int = 1024
+    prompt_cache_ttl_seconds: float = 3600.0
+    prompt_cache_path: Optional[str] = None
+    # "weighted" (sum of weighted scores) or "rrf" (reciprocal rank fusion)
+    fusion_method: str = "weighted"
+    fusion_rrf_k: int = 60
+    profile_cache_size: int = 10000
+    # Leave the user's favorite/completed/trash comics out of their results (in the search).
+    exclude_shelved: bool = True
+    profile_cache_ttl_seconds: float = 300.0
+    # Cross-encoder backend (torch | torch-int8 | onnx), token budget per pair (0 = model
+    # default) and the (prompt, row_id) score cache size (0 disables it).
+    rerank_backend: str = "torch"
+    rerank_max_length: int = 0
+    rerank_cache_size: int = 50000
+    # Seconds between background checks for new interactions to retrain CF on.
+    cf_train_interval_seconds: float = 60.0
+    # The CF interaction matrix is otherwise updated incrementally; a full table scan every
+    # this many seconds also picks up deletions made by other worker processes.
+    cf_matrix_resync_seconds: float = 3600.0
+    # Concurrent prompt encodes are coalesced into batches of up to this many (<= 1 disables).
+    encode_batch_max_size: int = 16
+    encode_batch_max_wait_ms: float = 2.0
+    # Popularity: half-life of a library entry's weight, how often writes are folded into
+    # the top lists (and other workers' writes picked up), and how often a full rescan
+    # also catches their deletions (0 = never).
+    popularity_half_life_days: float = 30.0
+    popularity_refresh_seconds: float = 60.0
+    popularity_resync_seconds: float = 3600.0
+    # Serialized anonymous responses (/popular, /chat without a user) per index version; 0 disables.
+    response_cache_size: int = 2048
+
+    @classmethod
+    def from_config(cls, config) -> "RecommenderConfig":
+        """
+        Settings from a Flask config (or any mapping with the keys of app.config.Config),
+        so the web app and the offline tools build identical indexes.
+        """
+        return cls(
+            catalog_path=config["CATALOG_PATH"],
+            index_dir=config["INDEX_DIR"],
+            embedding_model=config["EMBEDDING_MODEL"],
+            enable_reranker=bool(config.get("ENABLE_RERANKER")),
+            rerank_model=config.get("RERANK_MODEL"),
+            rerank_backend=config.get("RERANK_BACKEND") or "torch",
+            rerank_max_length=int(config.get("RERANK_MAX_LENGTH") or 0),
+            rerank_cache_size=int(config.get("RERANK_CACHE_SIZE") or 0),
+            prompt_weight=float(config.get("PROMPT_WEIGHT") or 0.7),
+            profile_weight=float(config.get("PROFILE_WEIGHT") or 0.3),
+            cf_weight=float(config.get("CF_WEIGHT") or 0.0),
+            cf_train_interval_seconds=float(config.get("CF_TRAIN_INTERVAL_SECONDS") or 60),
+            cf_matrix_resync_seconds=float(config.get("CF_MATRIX_RESYNC_SECONDS") or 0),
+            embedding_backend=config.get("EMBEDDING_BACKEND") or "torch",
+            embedding_storage=config.get("EMBEDDING_STORAGE") or "float32",
+            embedding_mmap=bool(config.get("EMBEDDING_MMAP")),
+            index_auto_build=bool(config.get("INDEX_AUTO_BUILD", True)),
+            index_params=IndexParams(
+                index_type=config.get("INDEX_TYPE") or "flat",
+                nlist=int(config.get("INDEX_NLIST") or 1024),
+                pq_m=int(config.get("INDEX_PQ_M") or 16),
+                pq_nbits=int(config.get("INDEX_PQ_NBITS") or 8),
+                hnsw_m=int(config.get("INDEX_HNSW_M") or 32),
+                hnsw_ef_construction=int(config.get("INDEX_HNSW_EF_CONSTRUCTION") or 200),
+                nprobe=int(config.get("INDEX_NPROBE") or 16),
+                ef_search=int(config.get("INDEX_EF_SEARCH") or 64),
+            ),
+            prompt_cache_size=int(config.get("PROMPT_CACHE_SIZE") or 0),
+            prompt_cache_ttl_seconds=float(config.get("PROMPT_CACHE_TTL_SECONDS") or 0),
+            prompt_cache_path=config.get("PROMPT_CACHE_PATH") or None,
+            fusion_method=config.get("FUSION_METHOD") or "weighted",
+            fusion_rrf_k=int(config.get("FUSION_RRF_K") or 60),
+            profile_cache_size=int(config.get("PROFILE_CACHE_SIZE") or 0),
+            profile_cache_ttl_seconds=float(config.get("PROFILE_CACHE_TTL_SECONDS") or 0),
+            exclude_shelved=bool(config.get("EXCLUDE_SHELVED")),
+            encode_batch_max_size=int(config.get("ENCODE_BATCH_MAX_SIZE") or 0),
+            encode_batch_max_wait_ms=float(config.get("ENCODE_BATCH_MAX_WAIT_MS") or 0),
+            response_cache_size=int(config.get("RESPONSE_CACHE_SIZE") or 0),
+            popularity_half_life_days=float(config.get("POPULARITY_HALF_LIFE_DAYS") or 30),
+            popularity_refresh_seconds=float(config.get("POPULARITY_REFRESH_SECONDS") or 0),
+            popularity_resync_seconds=float(config.get("POPULARITY_RESYNC_SECONDS") or 0),
+        )
 
 
 class ComicRecommender:
@@ -36,98 +176,496 @@ class ComicRecommender:
       - personalization via user profile embedding from implicit library interactions
     """
 
-    def __init__(self, cfg: RecommenderConfig):
+    def __init__(self, cfg: RecommenderConfig, app=None):
         self.cfg = cfg
         self.paths = CatalogPaths(catalog_csv=cfg.catalog_path, index_dir=cfg.index_dir)
 
-        self.comics_df = load_catalog(self.paths.catalog_csv)
+        self.comics_df = load_catalog(self.paths.catalog_csv, cache_path=self.paths.catalog_parquet)
         self._source_id_to_row_id = build_source_id_map(self.comics_df)
-
-        self.embedder = load_embedder(cfg.embedding_model)
+        self._title_author_index = build_title_author_index(self.comics_df)
+        self.records = RecordStore(self.comics_df)
+        self.attributes = AttributeIndex(self.comics_df)
+        self.metrics = REGISTRY
+
+        self.embedder = load_embedder(cfg.embedding_model, backend=cfg.embedding_backend)
+        if cfg.prompt_cache_size > 0:
+            self.embedder.cache = PromptEmbeddingCache(
+                max_size=cfg.prompt_cache_size,
+                ttl_seconds=cfg.prompt_cache_ttl_seconds,
+                persist_path=cfg.prompt_cache_path,
+            )
+            if cfg.prompt_cache_path:
+                atexit.register(self.embedder.cache.save)
+        if cfg.encode_batch_max_size > 1:
+            self.embedder.batcher = EncodeBatcher(
+                self.embedder.encode,
+                max_batch=cfg.encode_batch_max_size,
+                max_wait_ms=cfg.encode_batch_max_wait_ms,
+            )
         self.index = VectorIndex(
             faiss_index_path=self.paths.faiss_index,
             embeddings_path=self.paths.embeddings_npy,
             meta_path=self.paths.meta_json,
+            scales_path=self.paths.embedding_scales_npy,
+            storage_dtype=cfg.embedding_storage,
+            mmap=cfg.embedding_mmap,
+            params=cfg.index_params,
+            hashes_path=self.paths.row_hashes_json,
+            embedding_backend=self.embedder.backend,
         )
 
-        self.reranker = OptionalReranker(cfg.rerank_model)
+        self.profiles = (
+            UserProfileCache(max_size=cfg.profile_cache_size, ttl_seconds=cfg.profile_cache_ttl_seconds)
+            if cfg.profile_cache_size > 0
+            else None
+        )
+
+        self.reranker = OptionalReranker(
+            cfg.rerank_model,
+            backend=cfg.rerank_backend,
+            max_length=cfg.rerank_max_length or None,
+            cache=RerankScoreCache(max_size=cfg.rerank_cache_size) if cfg.rerank_cache_size > 0 else None,
+        )
+        self.responses = ResponseCache(max_size=cfg.response_cache_size) if cfg.response_cache_size > 0 else None
         self._ensure_index()
 
-        self._cf_cache = None  # built lazily
+        # CF factors and popularity are refreshed off the request path; `app` gives those
+        # background threads DB access (else the app of the request that starts them).
+        self._app = app
+        self._cf = None
+        self._interactions = None
+        self._interactions_loaded_at = 0.0
+        self._interactions_watermark = None
+        self._comic_rows: Dict[int, Optional[int]] = {}
+
+        # Loaded from the DB in the background on first use (see refresh_popularity), then
+        # kept current by library_changed.
+        self.popularity = PopularityIndex(
+            n_items=len(self.comics_df),
+            genre_rows=self.attributes.genres,
+            half_life_seconds=cfg.popularity_half_life_days * 86400.0,
+        )
+        self._popularity_lock = threading.Lock()
+        self._popularity_checked_at = 0.0
+        self._popularity_loaded_at = 0.0
+        self._popularity_watermark = None
+        if cfg.cf_weight > 0:
+            self._interactions = InteractionMatrix(n_items=len(self.comics_df))
+            self._cf = CFTrainer(
+                CFSnapshotStore(cfg.index_dir),
+                stamp_fn=self._cf_stamp,
+                matrix_fn=self._cf_matrix,
+                app=app,
+                interval_seconds=cfg.cf_train_interval_seconds,
+                n_items=len(self.comics_df),
+            )
+
+    def preload(self) -> None:
+        """
+        Loads everything that is otherwise loaded lazily (the reranker weights), without
+        running any inference: safe to call in a prefork server's master process.
+        """
+        if self.cfg.enable_reranker:
+            self.reranker.load()
+
+    def warmup(self) -> Dict[str, float]:
+        """
+        Sends one throwaway query through encode, search and (if enabled) rerank, so lazy
+        loads and first-inference kernel setup happen here instead of in the first request.
+        The prompt and rerank caches are bypassed. Returns seconds per stage.
+        """
+        timings: Dict[str, float] = {}
+        if self.comics_df.empty:
+            return timings
+        t0 = time.perf_counter()
+        vec = np.asarray(self.embedder.encode([_WARMUP_PROMPT], batch_size=1), dtype=np.float32)[0]
+        timings["encode"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        idx, _ = self.index.search(vec, top_k=50)
+        timings["search"] = time.perf_counter() - t0
+
+        if self.cfg.enable_reranker:
+            t0 = time.perf_counter()
+            docs = [str(r.get("search_text") or "") for r in self.records.rows(idx[:8])]
+            self.reranker.rerank(_WARMUP_PROMPT, docs)
+            timings["rerank"] = time.perf_counter() - t0
+        return timings
 
     def _ensure_index(self) -> None:
         if self.comics_df.empty:
             return
-        if self.index.is_stale(self.embedder.model_name, self.paths.catalog_csv):
-            texts = self.comics_df["search_text"].fillna("").astype(str).tolist()
-            emb = self.embedder.encode(texts, batch_size=32)
-            self.index.build(embeddings=emb, embedding_model=self.embedder.model_name, catalog_path=self.paths.catalog_csv)
-        else:
+        stale = self.index.is_stale(self.embedder.model_name, self.paths.catalog_csv, len(self.comics_df))
+        if not stale:
             try:
                 self.index.load()
+                return
             except Exception:
-                texts = self.comics_df["search_text"].fillna("").astype(str).tolist()
-                emb = self.embedder.encode(texts, batch_size=32)
-                self.index.build(embeddings=emb, embedding_model=self.embedder.model_name, catalog_path=self.paths.catalog_csv)
-
-    def process_prompt(self, user_prompt: str, user_id: Optional[int] = None) -> Dict:
-        q = parse_query(user_prompt)
-        recs, explanation = self.recommend(prompt=q.raw, user_id=user_id)
-        return {
-            "keywords": q.keywords,
-            "recommendations": recs[:10],
-            "explanation": explanation,
-        }
-
-    def recommend(self, prompt: str, user_id: Optional[int]) -> Tuple[List[Dict], str]:
+                if not self.cfg.index_auto_build:
+                    raise
+        if not self.cfg.index_auto_build:
+            raise RuntimeError(
+                f"Vector index in {self.cfg.index_dir} is missing or stale and INDEX_AUTO_BUILD is off; "
+                "build it with `python -m app.ai.build_index`."
+            )
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        if self.profiles is not None:
+            # Cached profiles are sums of the old vectors.
+            self.profiles.invalidate()
+        if self.responses is not None:
+            self.responses.clear()
+        # Streamed in chunks straight to the index files, so the build holds one chunk of
+        # texts and vectors at a time. Only rows that are new or whose search_text changed
+        # go through the model; every other vector is copied from the previous index.
+        prev = self.index.previous_rows(self.embedder.model_name)
+        n = len(self.comics_df)
+        writer = None
+        try:
+            for start in range(0, n, _INGEST_CHUNK_ROWS):
+                chunk = self.comics_df.iloc[start : start + _INGEST_CHUNK_ROWS]
+                texts = chunk["search_text"].fillna("").astype(str).tolist()
+                source_ids = chunk["source_id"].astype(str).tolist()
+                hashes = row_content_hashes(texts)
+                emb, todo = prev.reuse(source_ids, hashes) if prev is not None else (None, np.arange(len(texts)))
+                if len(todo):
+                    fresh = self.embedder.encode([texts[i] for i in todo], batch_size=32)
+                    emb = fill_rows(emb, todo, fresh)
+                if writer is None:
+                    writer = self.index.writer(n, emb.shape[1], self.embedder.model_name, self.paths.catalog_csv)
+                writer.append(emb, source_ids, hashes)
+            writer.commit()
+        finally:
+            if writer is not None:
+                writer.abort()
+
+    def response_version(self) -> str:
+        """
+        Identifies everything an anonymous response depends on besides the request: the
+        loaded index build and the settings. Changes whenever the index is rebuilt.
+        """
+        meta = self.index.meta
+        parts = [repr(meta.built_at if meta else None), repr(self.cfg)]
+        return hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+    def process_prompt(
+        self,
+        user_prompt: str,
+        user_id: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> Dict:
+        return self.process_prompts([(user_prompt, user_id)], batched=False, filters=filters, timer=timer)[0]
+
+    def process_prompts(
+        self,
+        items: List[Tuple[str, Optional[int]]],
+        batched: bool = True,
+        filters: Optional[SearchFilters] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> List[Dict]:
+        parsed = [parse_query(p) for p, _ in items]
+        requests = [(q.raw, uid) for q, (_, uid) in zip(parsed, items)]
+        if batched:
+            results = self.recommend_many(requests, filters=filters, timer=timer)
+        else:
+            results = [self.recommend(prompt=p, user_id=uid, filters=filters, timer=timer) for p, uid in requests]
+        return [
+            {
+                "keywords": q.keywords,
+                "recommendations": recs[:10],
+                "explanation": explanation,
+            }
+            for q, (recs, explanation) in zip(parsed, results)
+        ]
+
+    def recommend(
+        self,
+        prompt: str,
+        user_id: Optional[int],
+        filters: Optional[SearchFilters] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> Tuple[List[Dict], str]:
+        """
+        Top recommendations for a prompt (and the user's library, when known). `filters`
+        restricts every retrieval source to matching catalog rows.
+
+        Stage times go to the metrics registry under "recommend". A caller passing its own
+        `timer` gets them there instead and reports them itself, with its own stages.
+        """
+        own = timer is None
+        timer = StageTimer() if own else timer
+        try:
+            return self._recommend(prompt, user_id, filters, timer)
+        finally:
+            if own:
+                self.metrics.observe_stages("recommend", timer)
+
+    def _recommend(
+        self, prompt: str, user_id: Optional[int], filters: Optional[SearchFilters], timer: StageTimer
+    ) -> Tuple[List[Dict], str]:
         if self.comics_df.empty:
             return [], "Catalog is empty."
+        mask = self.attributes.mask(filters)
+        timer.lap("filters")
+        if mask is not None and not mask.any():
+            return [], "No comics match the selected filters."
 
         prompt = (prompt or "").strip()
         if not prompt:
-            # Personalized feed without prompt.
-            recs = self._personalized_only(user_id=user_id, top_k=10)
-            if recs:
-                return recs, "Recommendations based on your library."
-            return self.comics_df.head(10).to_dict("records"), "Popular picks from the catalog."
+            return self._without_prompt(user_id, filters, mask, timer)
+
+        prompt_vec = self.embedder.encode_query(prompt)
+        timer.lap("encode")
+        states = self._user_states([user_id])
+        excluded = self._excluded(states.get(user_id))
+        timer.lap("profile_query")
+        idx, scores = self.index.search(prompt_vec, top_k=200, mask=mask, exclude=excluded)
+        timer.lap("search")
+        profile_hits = self._profile_hits(states, mask)
+        timer.lap("profile_search")
+        return self._rank(prompt, user_id, idx, scores, profile_hits.get(user_id), mask, excluded, timer)
+
+    def recommend_many(
+        self,
+        requests: List[Tuple[str, Optional[int]]],
+        filters: Optional[SearchFilters] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> List[Tuple[List[Dict], str]]:
+        """
+        Batched `recommend` over (prompt, user_id) pairs: all prompts are encoded in one
+        Embedder call, and prompt and profile vectors each go through one multi-query
+        index search. Fusion, reranking and CF still run per item. `filters` applies to
+        every item. Stage times add up over the batch (see `recommend` for `timer`).
+        """
+        own = timer is None
+        timer = StageTimer() if own else timer
+        try:
+            return self._recommend_many(requests, filters, timer)
+        finally:
+            if own:
+                self.metrics.observe_stages("recommend_many", timer)
+
+    def _recommend_many(
+        self, requests: List[Tuple[str, Optional[int]]], filters: Optional[SearchFilters], timer: StageTimer
+    ) -> List[Tuple[List[Dict], str]]:
+        if self.comics_df.empty:
+            return [([], "Catalog is empty.") for _ in requests]
+        mask = self.attributes.mask(filters)
+        timer.lap("filters")
+        if mask is not None and not mask.any():
+            return [([], "No comics match the selected filters.") for _ in requests]
+
+        prompts = [(p or "").strip() for p, _ in requests]
+        with_prompt = [i for i, p in enumerate(prompts) if p]
+        states = self._user_states([requests[i][1] for i in with_prompt])
+        timer.lap("profile_query")
+        hits = {}
+        if with_prompt:
+            vecs = self.embedder.encode_queries([prompts[i] for i in with_prompt])
+            timer.lap("encode")
+            exclude = [self._excluded(states.get(requests[i][1])) for i in with_prompt]
+            idx, scores = self.index.search_many(vecs, top_k=200, mask=mask, exclude=exclude)
+            hits = {i: (idx[j], scores[j]) for j, i in enumerate(with_prompt)}
+            timer.lap("search")
+        profile_hits = self._profile_hits(states, mask)
+        timer.lap("profile_search")
+
+        out = []
+        for i, (prompt, (_, user_id)) in enumerate(zip(prompts, requests)):
+            if i not in hits:
+                out.append(self._without_prompt(user_id, filters, mask, timer))
+                continue
+            out.append(
+                self._rank(
+                    prompt,
+                    user_id,
+                    hits[i][0],
+                    hits[i][1],
+                    profile_hits.get(user_id),
+                    mask,
+                    self._excluded(states.get(user_id)),
+                    timer,
+                )
+            )
+        return out
 
-        prompt_vec = self.embedder.encode([prompt], batch_size=1)
-        idx, scores = self.index.search(prompt_vec[0], top_k=200)
+    def _without_prompt(
+        self,
+        user_id: Optional[int],
+        filters: Optional[SearchFilters] = None,
+        mask: Optional[np.ndarray] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> Tuple[List[Dict], str]:
+        # Personalized feed without prompt; popular picks skip the user's shelved comics too.
+        state = self._user_state(user_id) if user_id is not None else None
+        recs = self._personalized_only(state, top_k=10, mask=mask, timer=timer)
+        if recs:
+            return recs, "Recommendations based on your library."
+        recs = self.records.rows(self.popular_rows(10, filters, mask, exclude=self._excluded(state)))
+        if timer is not None:
+            timer.lap("records")
+        return recs, "Popular picks from the catalog."
+
+    def popular_rows(
+        self,
+        top_k: int = 10,
+        filters: Optional[SearchFilters] = None,
+        mask: Optional[np.ndarray] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Row ids of the `top_k` most popular comics matching `filters` and not in `exclude`,
+        topped up in catalog order when fewer than that have been shelved. A filter on a
+        single genre reads that genre's precomputed list; any other filter narrows the
+        overall list.
+        """
+        self.refresh_popularity()
+        if mask is None:
+            mask = self.attributes.mask(filters)
+        only_genre = (
+            filters is not None
+            and len(filters.genres) == 1
+            and not (filters.publishers or filters.authors)
+            and filters.year_min is None
+            and filters.year_max is None
+        )
+        rows = self.popularity.top(filters.genres[0] if only_genre else None)
+        if mask is not None and not only_genre:
+            rows = rows[mask[rows]]
+        if exclude is None:
+            exclude = np.zeros(0, dtype=np.int64)
+        if len(exclude):
+            rows = rows[~np.isin(rows, exclude)]
+        rows = rows[:top_k]
+        if len(rows) < top_k:
+            if mask is not None:
+                fill = np.flatnonzero(mask)
+            else:
+                fill = np.arange(min(len(self.comics_df), top_k + len(rows) + len(exclude)))
+            fill = fill[~np.isin(fill, rows) & ~np.isin(fill, exclude)][: top_k - len(rows)]
+            rows = np.concatenate([rows, fill])
+        return rows
+
+    def popularity_version(self) -> int:
+        # Changes whenever popular_rows() may answer differently.
+        self.refresh_popularity()
+        return self.popularity.version
+
+    def refresh_popularity(self) -> None:
+        """
+        Loads the popularity index on first use, then at most every POPULARITY_REFRESH_SECONDS
+        picks up library writes made by other workers and compacts. The work runs in a
+        background thread, one at a time; requests keep serving the current lists (catalog
+        order before the first load) instead of paying for the table scan.
+        """
+        # Failed loads are rate-limited too, so a broken database is not rescanned per request.
+        if time.time() - self._popularity_checked_at < self.cfg.popularity_refresh_seconds:
+            return
+        app = self._app
+        if app is None:
+            if not has_app_context():
+                return
+            app = current_app._get_current_object()
+        if not self._popularity_lock.acquire(blocking=False):
+            return
+        self._popularity_checked_at = time.time()
+        try:
+            threading.Thread(target=self._refresh_popularity, args=(app,), name="popularity-refresh", daemon=True).start()
+        except BaseException:
+            self._popularity_lock.release()
+            raise
+
+    def _refresh_popularity(self, app) -> None:
+        # Caller holds _popularity_lock; released here.
+        try:
+            with app.app_context():
+                resync = self.cfg.popularity_resync_seconds
+                if not self.popularity.loaded or (resync > 0 and time.time() - self._popularity_loaded_at > resync):
+                    self._load_popularity()
+                else:
+                    self._sync_popularity()
+                    self.popularity.compact()
+        except Exception:
+            # Served from what is already loaded (or catalog order); retried next interval.
+            logger.exception("Popularity refresh failed")
+        finally:
+            self._popularity_lock.release()
+
+    def _user_states(self, user_ids: List[Optional[int]]) -> Dict[int, Tuple[Optional[np.ndarray], np.ndarray]]:
+        # (profile vector, excluded row ids) per distinct known user.
+        return {uid: self._user_state(uid) for uid in dict.fromkeys(user_ids) if uid is not None}
+
+    def _excluded(self, state: Optional[Tuple[Optional[np.ndarray], np.ndarray]]) -> Optional[np.ndarray]:
+        if state is None or not self.cfg.exclude_shelved:
+            return None
+        return state[1]
+
+    def _profile_hits(
+        self, states: Dict[int, Tuple[Optional[np.ndarray], np.ndarray]], mask: Optional[np.ndarray] = None
+    ) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        # Profile-vector search results per user, searched together in one call.
+        if self.cfg.profile_weight <= 0:
+            return {}
+        users = [uid for uid, (prof, _) in states.items() if prof is not None]
+        if not users:
+            return {}
+        idx, scores = self.index.search_many(
+            np.vstack([states[uid][0] for uid in users]),
+            top_k=200,
+            mask=mask,
+            exclude=[self._excluded(states[uid]) for uid in users],
+        )
+        return {uid: (idx[j], scores[j]) for j, uid in enumerate(users)}
+
+    def _rank(
+        self,
+        prompt: str,
+        user_id: Optional[int],
+        idx: np.ndarray,
+        scores: np.ndarray,
+        profile_hits: Optional[Tuple[np.ndarray, np.ndarray]],
+        mask: Optional[np.ndarray] = None,
+        excluded: Optional[np.ndarray] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> Tuple[List[Dict], str]:
+        timer = timer if timer is not None else StageTimer()
+        # Each retrieval source contributes (row ids, scores, weight) to one fused ranking.
+        sources = [(idx, scores, self.cfg.prompt_weight)]
 
         # Optional personalization blend
-        blended = None
-        if user_id is not None and self.cfg.profile_weight > 0:
-            prof = self._user_profile_embedding(user_id)
-            if prof is not None:
-                pidx, pscores = self.index.search(prof, top_k=200)
-                blended = self._blend_results(
-                    (idx, scores),
-                    (pidx, pscores),
-                    w_prompt=self.cfg.prompt_weight,
-                    w_profile=self.cfg.profile_weight,
-                    top_k=100,
-                )
+        if user_id is not None and profile_hits is not None:
+            pidx, pscores = profile_hits
+            sources.append((pidx, pscores, self.cfg.profile_weight))
 
         # Optional collaborative filtering blend (implicit ALS)
         if user_id is not None and self.cfg.cf_weight > 0:
             cf = self._cf_recommend(user_id=user_id, top_k=200)
             if cf is not None:
                 cidx, cscores = cf
-                base_idx, base_scores = blended if blended is not None else (idx, scores)
-                blended = self._blend_3way(
-                    (base_idx, base_scores),
-                    (cidx, cscores),
-                    w_base=(self.cfg.prompt_weight + self.cfg.profile_weight),
-                    w_cf=self.cfg.cf_weight,
-                    top_k=100,
-                )
+                if mask is not None:
+                    keep = mask[cidx]
+                    cidx, cscores = cidx[keep], cscores[keep]
+                if excluded is not None and len(excluded):
+                    keep = ~np.isin(cidx, excluded)
+                    cidx, cscores = cidx[keep], cscores[keep]
+                sources.append((cidx, cscores, self.cfg.cf_weight))
+            timer.lap("cf")
+
+        blended = None
+        if len(sources) > 1:
+            blended = fuse(sources, top_k=100, method=self.cfg.fusion_method, rrf_k=self.cfg.fusion_rrf_k)
+            timer.lap("fusion")
 
         final_idx, final_scores = blended if blended is not None else (idx, scores)
         candidates = self._rows_to_records(final_idx, final_scores)
+        timer.lap("records")
 
         # Optional reranking (slow but more accurate ordering)
         if self.cfg.enable_reranker:
             candidates = self._rerank(prompt, candidates, top_n=50)
+            timer.lap("rerank")
 
         explanation = "Recommendations based on your prompt."
         if user_id is not None and blended is not None:
@@ -138,17 +676,7 @@ class ComicRecommender:
         return candidates[:10], explanation
 
     def _rows_to_records(self, row_ids: np.ndarray, scores: np.ndarray) -> List[Dict]:
-        out = []
-        for rid, sc in zip(row_ids.tolist(), scores.tolist()):
-            if rid < 0:
-                continue
-            try:
-                r = self.comics_df.iloc[int(rid)].to_dict()
-                r["score"] = float(sc)
-                out.append(r)
-            except Exception:
-                continue
-        return out
+        return self.records.get(row_ids, scores)
 
     def _rerank(self, prompt: str, candidates: List[Dict], top_n: int) -> List[Dict]:
         if not candidates:
@@ -157,7 +685,7 @@ class ComicRecommender:
         keep = candidates[:top_n]
         for c in keep:
             docs.append(str(c.get("search_text") or c.get("title") or ""))
-        scores = self.reranker.rerank(prompt, docs)
+        scores = self.reranker.rerank(prompt, docs, keys=[c.get("row_id") for c in keep])
         if scores is None:
             return candidates
         reranked = list(zip(keep, scores))
@@ -169,220 +697,314 @@ class ComicRecommender:
             keep2.append(c2)
         return keep2 + candidates[top_n:]
 
-    def _blend_results(
-        self,
-        a: Tuple[np.ndarray, np.ndarray],
-        b: Tuple[np.ndarray, np.ndarray],
-        w_prompt: float,
-        w_profile: float,
-        top_k: int,
-    ) -> Tuple[np.ndarray, np.ndarray]:
-        idx_a, sc_a = a
-        idx_b, sc_b = b
-
-        score_map = {}
-        for i, s in zip(idx_a.tolist(), sc_a.tolist()):
-            if i < 0:
-                continue
-            score_map[int(i)] = score_map.get(int(i), 0.0) + w_prompt * float(s)
-        for i, s in zip(idx_b.tolist(), sc_b.tolist()):
-            if i < 0:
-                continue
-            score_map[int(i)] = score_map.get(int(i), 0.0) + w_profile * float(s)
-
-        items = sorted(score_map.items(), key=lambda x: x[1], reverse=True)[:top_k]
-        idx = np.array([i for i, _ in items], dtype=np.int64)
-        sc = np.array([s for _, s in items], dtype=np.float32)
-        return idx, sc
-
-    def _blend_3way(
+    def _personalized_only(
         self,
-        base: Tuple[np.ndarray, np.ndarray],
-        cf: Tuple[np.ndarray, np.ndarray],
-        w_base: float,
-        w_cf: float,
+        state: Optional[Tuple[Optional[np.ndarray], np.ndarray]],
         top_k: int,
-    ) -> Tuple[np.ndarray, np.ndarray]:
-        idx_a, sc_a = base
-        idx_b, sc_b = cf
-
-        score_map = {}
-        for i, s in zip(idx_a.tolist(), sc_a.tolist()):
-            if i < 0:
-                continue
-            score_map[int(i)] = score_map.get(int(i), 0.0) + w_base * float(s)
-        for i, s in zip(idx_b.tolist(), sc_b.tolist()):
-            if i < 0:
-                continue
-            score_map[int(i)] = score_map.get(int(i), 0.0) + w_cf * float(s)
-
-        items = sorted(score_map.items(), key=lambda x: x[1], reverse=True)[:top_k]
-        idx = np.array([i for i, _ in items], dtype=np.int64)
-        sc = np.array([s for _, s in items], dtype=np.float32)
-        return idx, sc
-
-    def _personalized_only(self, user_id: Optional[int], top_k: int) -> List[Dict]:
-        if user_id is None:
+        mask: Optional[np.ndarray] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> List[Dict]:
+        # `state` is the user's _user_state(), None for anonymous requests.
+        if state is None:
             return []
-        prof = self._user_profile_embedding(user_id)
-        if prof is None:
+        timer = timer if timer is not None else StageTimer()
+        timer.lap("profile_query")
+        if state[0] is None:
             return []
-        idx, scores = self.index.search(prof, top_k=top_k)
-        return self._rows_to_records(idx, scores)[:top_k]
-
-    def _user_profile_embedding(self, user_id: int) -> Optional[np.ndarray]:
-        # Create an embedding from user's implicit interactions.
-        # We map DB comics back to catalog rows using Comic.source_id when available,
+        idx, scores = self.index.search(state[0], top_k=top_k, mask=mask, exclude=self._excluded(state))
+        timer.lap("profile_search")
+        recs = self._rows_to_records(idx, scores)[:top_k]
+        timer.lap("records")
+        return recs
+
+    def _match_row_id(self, source_id: Optional[str], title: Optional[str], author: Optional[str]) -> Optional[int]:
+        # Map a DB comic back to its catalog row using Comic.source_id when available,
         # otherwise fall back to title+author matching.
-        weights = {
-            "favorite": 2.0,
-            "completed": 1.5,
-            "reading": 1.0,
-            "trash": -1.0,
-        }
+        rid = None
+        if source_id:
+            rid = self._source_id_to_row_id.get(str(source_id))
+        if rid is None:
+            rid = self._title_author_index.match(title, author)
+        return rid
+
+    def _user_state(self, user_id: int) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        (profile embedding from the user's implicit interactions, sorted row ids of their
+        favorite/completed/trash comics), from the profile cache when possible.
+        """
+        if self.profiles is not None:
+            cached = self.profiles.get(user_id)
+            if cached is not None:
+                return cached
 
         rows = (
-            db.session.query(UserComic.status, Comic.source_id, Comic.title, Comic.author)
+            db.session.query(UserComic.comic_id, UserComic.status, Comic.source_id, Comic.title, Comic.author)
             .join(Comic, Comic.id == UserComic.comic_id)
             .filter(UserComic.user_id == user_id)
             .all()
         )
-        if not rows:
-            return None
 
         emb = self.index.get_embeddings()
-        vecs = []
-        ws = []
-        for status, source_id, title, author in rows:
-            w = float(weights.get(status, 0.0))
+        profile = UserProfile(dim=int(emb.shape[1]))
+        for comic_id, status, source_id, title, author in rows:
+            w = float(PROFILE_STATUS_WEIGHTS.get(status, 0.0))
             if w == 0.0:
                 continue
-
-            rid = None
-            if source_id:
-                rid = self._source_id_to_row_id.get(str(source_id))
-            if rid is None:
-                rid = best_effort_match_row_id(self.comics_df, title=title, author=author)
-            if rid is None:
+            rid = self._match_row_id(source_id, title, author)
+            if rid is None or not 0 <= int(rid) < int(emb.shape[0]):
                 continue
+            profile.set(int(comic_id), rid, w, emb, excluded=status in EXCLUDED_STATUSES)
 
+        if self.profiles is not None:
+            self.profiles.put(user_id, profile)
+        return profile.snapshot()
+
+    def library_changed(
+        self,
+        user_id: int,
+        comic_id: int,
+        status: Optional[str],
+        source_id: Optional[str] = None,
+        title: Optional[str] = None,
+        author: Optional[str] = None,
+    ) -> None:
+        """
+        Applies one library write to the cached profile of `user_id` and to the CF
+        interaction matrix. `status` is the new status, or None when the entry was removed.
+        """
+        if self._interactions is not None and self._interactions.loaded:
             try:
-                vecs.append(emb[int(rid)])
-                ws.append(w)
+                rid = self._comic_row_id(int(comic_id), source_id, title, author)
+                if rid is not None:
+                    w = float(CF_STATUS_WEIGHTS.get(status, 0.0)) if status else 0.0
+                    self._interactions.set(int(user_id), rid, w)
             except Exception:
-                continue
-
-        if not vecs:
-            return None
-
-        v = np.vstack(vecs).astype(np.float32)
-        w = np.array(ws, dtype=np.float32).reshape(-1, 1)
-        prof = (v * w).sum(axis=0) / (np.abs(w).sum() + 1e-6)
-        return prof.astype(np.float32)
+                # The next full resync repairs the matrix.
+                pass
+        if self.popularity.loaded:
+            try:
+                rid = self._comic_row_id(int(comic_id), source_id, title, author)
+                if rid is not None:
+                    w = float(POPULARITY_STATUS_WEIGHTS.get(status, 0.0)) if status else 0.0
+                    self.popularity.set(int(user_id), rid, w)
+            except Exception:
+                pass
+        if self.profiles is None:
+            return
+        try:
+            w = float(PROFILE_STATUS_WEIGHTS.get(status, 0.0)) if status else 0.0
+            rid = self._match_row_id(source_id, title, author) if w != 0.0 else None
+            emb = self.index.get_embeddings()
+            if rid is not None and not 0 <= int(rid) < int(emb.shape[0]):
+                rid = None
+            self.profiles.update(int(user_id), int(comic_id), rid, w, emb, excluded=status in EXCLUDED_STATUSES)
+        except Exception:
+            # Never fail the write; the profile is rebuilt on next use instead.
+            self.profiles.invalidate(int(user_id))
 
     def _cf_recommend(self, user_id: int, top_k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # Reads whatever snapshot the background trainer last swapped in; never trains here.
+        if self._cf is None:
+            return None
+        self._cf.ensure_started()
+        snap = self._cf.current
+        if snap is None:
+            return None
         try:
-            cache = self._get_or_build_cf()
-            if cache is None:
-                return None
-            col = cache["user_id_to_col"].get(int(user_id))
-            if col is None:
-                return None
-            model = cache["model"]
-            user_items = cache["user_items"]
-
-            ids, scores = model.recommend(
-                col,
-                user_items,
-                N=top_k,
-                filter_already_liked_items=True,
-            )
-            return np.asarray(ids, dtype=np.int64), np.asarray(scores, dtype=np.float32)
+            return snap.recommend(user_id, top_k=top_k)
         except Exception:
             return None
 
-    def _get_or_build_cf(self):
-        # Build once per process (small apps). Rebuild if interactions change.
-        import time
+    def cf_status(self) -> Optional[Dict]:
+        if self._cf is None:
+            return None
+        return {**self._cf.stats(), "interactions": self._interactions.stats()}
+
+    def metric_samples(self) -> List[Sample]:
+        """
+        Index, catalog, cache and CF gauges for the metrics endpoint, read at scrape time.
+        """
+        ix = self.index.stats()
+        built_at = ix["built_at"]
+        labels = {"index_type": str(ix["index_type"] or "none"), "storage": ix["storage_dtype"]}
+        out: List[Sample] = [
+            ("catalog_rows", "gauge", "Rows in the loaded catalog.", {}, len(self.comics_df)),
+            ("index_rows", "gauge", "Vectors in the loaded index.", labels, ix["rows"]),
+            ("index_dim", "gauge", "Dimension of the index vectors.", {}, ix["dim"]),
+            ("index_bytes", "gauge", "Size of the index files on disk.", {}, ix["bytes"]),
+            ("index_built_timestamp_seconds", "gauge", "When the loaded index was built.", {}, built_at),
+            (
+                "index_age_seconds",
+                "gauge",
+                "Seconds since the loaded index was built.",
+                {},
+                time.time() - built_at if built_at else None,
+            ),
+        ]
+        caches = {
+            "prompt": self.embedder.cache,
+            "rerank": self.reranker.cache,
+            "profile": self.profiles,
+            "filter_mask": self.attributes,
+            "response": self.responses,
+        }
+        for name, cache in caches.items():
+            if cache is None:
+                continue
+            st = cache.stats()
+            out.append(("cache_hits_total", "counter", "Cache lookups answered from the cache.", {"cache": name}, st["hits"]))
+            out.append(("cache_misses_total", "counter", "Cache lookups that had to compute.", {"cache": name}, st["misses"]))
+            out.append(("cache_entries", "gauge", "Entries held by a cache.", {"cache": name}, st["size"]))
+        if self.embedder.batcher is not None:
+            st = self.embedder.batcher.stats()
+            out.append(("encode_batches_total", "counter", "Batched prompt encoder calls.", {}, st["batches"]))
+            out.append(("encode_batched_prompts_total", "counter", "Prompts encoded through the batcher.", {}, st["items"]))
+            out.append(
+                ("encode_queue_delay_seconds", "histogram", "Time prompts wait for their encode batch.", {}, st["queue_delay_seconds"])
+            )
+            out.append(("encode_batch_size", "histogram", "Prompts per batched encoder call.", {}, _size_histogram(st["batch_sizes"])))
+        if self.popularity.loaded:
+            st = self.popularity.stats()
+            out.append(("popularity_entries", "gauge", "Library entries counted in the popularity scores.", {}, st["entries"]))
+            out.append(
+                ("popularity_pending_edits", "gauge", "Library writes not yet compacted into the popular lists.", {}, st["pending"])
+            )
+        if self._cf is not None:
+            st = self.cf_status()
+            out.append(("cf_snapshot_age_seconds", "gauge", "Age of the CF factors in use.", {}, st["age_seconds"]))
+            out.append(("cf_snapshot_behind", "gauge", "1 when newer interactions await training.", {}, float(st["behind"])))
+            out.append(("cf_trainings_total", "counter", "CF trainings run by this process.", {}, st["trainings"]))
+            out.append(("cf_interactions", "gauge", "Non-zero entries of the CF matrix.", {}, st["interactions"]["nnz"]))
+            out.append(
+                ("cf_pending_edits", "gauge", "Library writes not yet compacted into the CF matrix.", {}, st["interactions"]["pending"])
+            )
+        return out
 
-        # Only useful if you have multiple users/interactions.
+    def _cf_stamp(self) -> Optional[str]:
+        # Catalog and interactions version: changes when the index is rebuilt and on every
+        # library insert, update or delete.
+        meta = self.index.meta
+        catalog = f"{len(self.comics_df)}@{meta.built_at if meta else None}"
         count = db.session.query(UserComic.id).count()
+        # Only useful if you have multiple users/interactions.
         if count < 20:
             return None
-
         last_ts = db.session.query(db.func.max(UserComic.updated_at)).scalar()
         last_ts_val = float(last_ts.timestamp()) if last_ts is not None else 0.0
+        return f"{catalog}:{count}:{last_ts_val}"
+
+    def _comic_row_id(
+        self, comic_id: int, source_id: Optional[str], title: Optional[str], author: Optional[str]
+    ) -> Optional[int]:
+        rid = self._comic_rows.get(comic_id)
+        if rid is None and comic_id not in self._comic_rows:
+            rid = self._match_row_id(source_id, title, author)
+            # Without source_id or title nothing was looked up; a cached miss would keep
+            # the comic out of the CF matrix and popularity until the next full resync.
+            if rid is not None or source_id or title:
+                self._comic_rows[comic_id] = rid
+        return rid
+
+    def _resolve_comics(self) -> Dict[int, int]:
+        """
+        Resolves every comic to its catalog row (once each, not once per interaction) and
+        returns {comic id: row id} of those in the catalog. The shared cache is swapped
+        for the new map in one assignment, so the CF and popularity paths never read it
+        half-built.
+        """
+        comic_rows = {
+            int(comic_id): self._match_row_id(source_id, title, author)
+            for comic_id, source_id, title, author in db.session.query(
+                Comic.id, Comic.source_id, Comic.title, Comic.author
+            ).all()
+        }
+        self._comic_rows = comic_rows
+        return {c: rid for c, rid in comic_rows.items() if rid is not None}
+
+    def _load_interactions(self) -> None:
+        # Full scan.
+        watermark = db.session.query(db.func.max(UserComic.updated_at)).scalar()
+        comic_rows = self._resolve_comics()
+
+        rows = db.session.query(UserComic.user_id, UserComic.comic_id, UserComic.status).all()
+        n = len(rows)
+        user_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        items = np.fromiter((comic_rows.get(int(r[1]), -1) for r in rows), dtype=np.int64, count=n)
+        weights = np.fromiter((CF_STATUS_WEIGHTS.get(r[2], 0.0) for r in rows), dtype=np.float32, count=n)
+        self._interactions.load(user_ids, items, weights)
+        self._interactions_watermark = watermark
+        self._interactions_loaded_at = time.time()
+
+    def _sync_interactions(self) -> None:
+        # Rows written since the last sync, including those served by other worker processes.
+        if self._interactions_watermark is None:
+            self._load_interactions()
+            return
+        watermark = db.session.query(db.func.max(UserComic.updated_at)).scalar()
+        rows = (
+            db.session.query(UserComic.user_id, UserComic.status, Comic.id, Comic.source_id, Comic.title, Comic.author)
+            .join(Comic, Comic.id == UserComic.comic_id)
+            .filter(UserComic.updated_at >= self._interactions_watermark)
+            .all()
+        )
+        for uid, status, comic_id, source_id, title, author in rows:
+            rid = self._comic_row_id(int(comic_id), source_id, title, author)
+            if rid is not None:
+                self._interactions.set(int(uid), rid, float(CF_STATUS_WEIGHTS.get(status, 0.0)))
+        if watermark is not None:
+            self._interactions_watermark = watermark
+
+    def _load_popularity(self) -> None:
+        # Full scan, as for the CF matrix.
+        watermark = db.session.query(db.func.max(UserComic.updated_at)).scalar()
+        comic_rows = self._resolve_comics()
+        rows = db.session.query(UserComic.user_id, UserComic.comic_id, UserComic.status, UserComic.updated_at).all()
+        n = len(rows)
+        self.popularity.load(
+            np.fromiter((r[0] for r in rows), dtype=np.int64, count=n),
+            np.fromiter((comic_rows.get(int(r[1]), -1) for r in rows), dtype=np.int64, count=n),
+            np.fromiter((POPULARITY_STATUS_WEIGHTS.get(r[2], 0.0) for r in rows), dtype=np.float64, count=n),
+            np.fromiter((_utc_timestamp(r[3]) for r in rows), dtype=np.float64, count=n),
+        )
+        self._popularity_watermark = watermark
+        self._popularity_loaded_at = time.time()
 
-        if self._cf_cache and self._cf_cache.get("last_ts") == last_ts_val:
-            # cache fresh for 10 minutes
-            if time.time() - self._cf_cache.get("built_at", 0) < 600:
-                return self._cf_cache
-
+    def _sync_popularity(self) -> None:
+        # Rows written since the last sync, including those served by other worker processes.
+        watermark = db.session.query(db.func.max(UserComic.updated_at)).scalar()
+        if watermark is None:
+            return
+        query = db.session.query(
+            UserComic.user_id, UserComic.status, UserComic.updated_at, Comic.id, Comic.source_id, Comic.title, Comic.author
+        ).join(Comic, Comic.id == UserComic.comic_id)
+        if self._popularity_watermark is not None:
+            query = query.filter(UserComic.updated_at >= self._popularity_watermark)
+        rows = query.all()
+        for uid, status, updated_at, comic_id, source_id, title, author in rows:
+            rid = self._comic_row_id(int(comic_id), source_id, title, author)
+            if rid is not None:
+                self.popularity.set(int(uid), rid, POPULARITY_STATUS_WEIGHTS.get(status, 0.0), _utc_timestamp(updated_at))
+        self._popularity_watermark = watermark
+
+    def _cf_matrix(self):
+        """
+        Returns (user x item CSR of positive interaction weights, DB user id per row), or
+        None when there is too little data to train on. The matrix is maintained
+        incrementally; this only syncs recent rows and compacts.
+        """
         try:
-            import scipy.sparse  # type: ignore
-            import implicit  # type: ignore
+            import scipy.sparse  # type: ignore  # noqa: F401
+            import implicit  # type: ignore  # noqa: F401
         except Exception:
             return None
 
-        users = db.session.query(Comic.id, UserComic.user_id, UserComic.status, Comic.source_id, Comic.title, Comic.author).join(
-            UserComic, UserComic.comic_id == Comic.id
-        ).all()
-        if not users:
-            return None
-
-        # Map user ids to dense columns
-        user_ids = sorted({int(r[1]) for r in users if r[1] is not None})
-        if len(user_ids) < 2:
-            return None
-        user_id_to_col = {uid: i for i, uid in enumerate(user_ids)}
-
-        n_items = int(len(self.comics_df))
-        n_users = int(len(user_ids))
-
-        weights = {
-            "favorite": 3.0,
-            "completed": 2.0,
-            "reading": 1.0,
-            "trash": -1.0,
-        }
-
-        rows = []
-        cols = []
-        data = []
-
-        for _, uid, status, source_id, title, author in users:
-            w = float(weights.get(status, 0.0))
-            if w <= 0:
-                continue
-            rid = None
-            if source_id:
-                rid = self._source_id_to_row_id.get(str(source_id))
-            if rid is None:
-                rid = best_effort_match_row_id(self.comics_df, title=title, author=author)
-            if rid is None:
-                continue
-            rows.append(int(rid))
-            cols.append(int(user_id_to_col[int(uid)]))
-            data.append(w)
+        resync = self.cfg.cf_matrix_resync_seconds
+        if not self._interactions.loaded or (resync > 0 and time.time() - self._interactions_loaded_at > resync):
+            self._load_interactions()
+        else:
+            self._sync_interactions()
 
-        if len(data) < 20:
+        user_items, user_ids = self._interactions.compact()
+        if len(user_ids) < 2 or user_items.nnz < 20:
             return None
-
-        item_user = scipy.sparse.coo_matrix((data, (rows, cols)), shape=(n_items, n_users)).tocsr()
-        user_item = item_user.T.tocsr()
-
-        model = implicit.als.AlternatingLeastSquares(
-            factors=64,
-            regularization=0.01,
-            iterations=15,
-        )
-        model.fit(item_user)
-
-        self._cf_cache = {
-            "model": model,
-            "user_id_to_col": user_id_to_col,
-            "user_items": user_item,
-            "built_at": time.time(),
-            "last_ts": last_ts_val,
-        }
-        return self._cf_cache
+        return user_items, user_ids
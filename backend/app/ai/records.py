@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import math
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def _native(v):
+    # JSON-safe plain Python value (NaN -> None, numpy scalars unboxed).
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    return v
+
+
+class RecordStore:
+    """
+    Catalog rows materialized once, addressable by row id.
+
+    `records[row_id]` is a plain dict shared across requests (treat it as read-only).
+    `fragments[row_id]` is the same record pre-encoded as JSON minus its closing brace,
+    so a response only appends the per-request fields (score, rerank_score) and joins.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.records: List[Dict] = []
+        self.fragments: List[str] = []
+        if df.empty:
+            return
+        for rec in df.to_dict("records"):
+            rec = {k: _native(v) for k, v in rec.items()}
+            self.records.append(rec)
+            self.fragments.append(json.dumps(rec, ensure_ascii=False, sort_keys=True)[:-1])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, row_ids: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        n = len(self.records)
+        out = []
+        for rid, sc in zip(np.asarray(row_ids).tolist(), np.asarray(scores).tolist()):
+            if 0 <= rid < n:
+                rec = dict(self.records[rid])
+                rec["score"] = float(sc)
+                out.append(rec)
+        return out
+
+    def head(self, n: int) -> List[Dict]:
+        return [dict(r) for r in self.records[:n]]
+
+    def rows(self, row_ids: Sequence[int]) -> List[Dict]:
+        n = len(self.records)
+        return [dict(self.records[r]) for r in np.asarray(row_ids).tolist() if 0 <= r < n]
+
+    def dumps(self, records: Iterable[Dict]) -> str:
+        # JSON array of records from this store. Only keys not in the stored record
+        # (per-request scores) are encoded here; the rest comes from the fragment.
+        parts = []
+        n = len(self.records)
+        for rec in records:
+            rid = rec.get("row_id")
+            if not isinstance(rid, int) or not 0 <= rid < n:
+                parts.append(json.dumps(rec, ensure_ascii=False, sort_keys=True))
+                continue
+            base = self.records[rid]
+            extra = "".join(
+                f",{json.dumps(k)}:{json.dumps(_native(v))}" for k, v in rec.items() if k not in base
+            )
+            parts.append(self.fragments[rid] + extra + "}")
+        return "[" + ",".join(parts) + "]"
+
+    def dumps_rows(self, row_ids: Sequence[int]) -> str:
+        n = len(self.records)
+        return "[" + ",".join(self.fragments[r] + "}" for r in row_ids if 0 <= r < n) + "]"
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized responses, keyed by (endpoint, request key) and tagged
+    with the version of the data they were computed from (index build time, model).
+
+    A lookup or store under a different version drops every entry first, so a rebuilt
+    index never serves responses computed from the previous one. Each entry keeps an ETag
+    derived from the version and the body.
+    """
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max(1, int(max_size))
+        self.hits = 0
+        self.misses = 0
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        # (endpoint, key) -> (body, etag)
+        self._items: "OrderedDict[Tuple[str, Hashable], Tuple[str, str]]" = OrderedDict()
+
+    def _switch(self, version: str) -> None:
+        # Caller holds the lock.
+        if version != self.version:
+            self._items.clear()
+            self.version = version
+
+    def get(self, version: str, endpoint: str, key: Hashable) -> Optional[Tuple[str, str]]:
+        """
+        (body, etag) of the cached response, or None.
+        """
+        with self._lock:
+            self._switch(version)
+            item = self._items.get((endpoint, key))
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((endpoint, key))
+            self.hits += 1
+            return item
+
+    def put(self, version: str, endpoint: str, key: Hashable, body: str) -> str:
+        """
+        Stores `body` and returns its ETag.
+        """
+        etag = make_etag(version, body)
+        with self._lock:
+            self._switch(version)
+            self._items[(endpoint, key)] = (body, etag)
+            self._items.move_to_end((endpoint, key))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return etag
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+def make_etag(version: str, body: str) -> str:
+    # Same version and body in any worker -> same ETag, so conditional requests work
+    # behind a load balancer.
+    h = hashlib.blake2b(digest_size=12)
+    h.update(version.encode("utf-8"))
+    h.update(b"\0")
+    h.update(body.encode("utf-8"))
+    return h.hexdigest()
@@ -1,11 +1,17 @@
+import hashlib
 import json
 import os
+import shutil
+import tempfile
 import time
-from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 
+from .catalog import file_digest
+from .embedding_store import EmbeddingMatrix, EmbeddingWriter, dot_scores, load_embeddings, open_temp_file
+
 
 def _try_import_faiss():
     try:
@@ -16,6 +22,57 @@ def _try_import_faiss():
         return None
 
 
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+
+# IVF/PQ training runs on at most this many rows; k-means quality plateaus well before.
+_MAX_TRAIN_ROWS = 100_000
+
+# A filtered search with at most this many matching rows scores exactly those rows; with
+# more, the filter goes into the FAISS search as an ID selector (or masks the full scan).
+_EXACT_FILTER_ROWS = 20_000
+
+
+@dataclass
+class IndexParams:
+    """
+    ANN index configuration.
+
+    index_type/nlist/pq_m/pq_nbits/hnsw_m/hnsw_ef_construction shape the index on disk;
+    changing any of them requires a rebuild. nprobe/ef_search only affect query time and
+    are applied on load.
+    """
+
+    index_type: str = "flat"
+    nlist: int = 1024
+    pq_m: int = 16
+    pq_nbits: int = 8
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    nprobe: int = 16
+    ef_search: int = 64
+
+    def build_params(self) -> dict:
+        if self.index_type == "ivf-flat":
+            return {"index_type": self.index_type, "nlist": self.nlist}
+        if self.index_type == "ivf-pq":
+            return {
+                "index_type": self.index_type,
+                "nlist": self.nlist,
+                "pq_m": self.pq_m,
+                "pq_nbits": self.pq_nbits,
+            }
+        if self.index_type == "hnsw":
+            return {
+                "index_type": self.index_type,
+                "hnsw_m": self.hnsw_m,
+                "hnsw_ef_construction": self.hnsw_ef_construction,
+            }
+        return {"index_type": "flat"}
+
+    def search_params(self) -> dict:
+        return {"nprobe": self.nprobe, "ef_search": self.ef_search}
+
+
 @dataclass
 class IndexMeta:
     embedding_model: str
@@ -23,6 +80,17 @@ class IndexMeta:
     built_at: float
     dim: int
     count: int
+    storage_dtype: str = "float32"
+    # Embedder backend the vectors came from (embedding.EMBEDDING_BACKENDS).
+    embedding_backend: str = "torch"
+    # Requested build parameters (IndexParams.build_params()) and the index actually built,
+    # which can be simpler than requested when the catalog is too small to train it.
+    index_params: dict = field(default_factory=lambda: {"index_type": "flat"})
+    index_effective: str = "flat"
+    search_params: dict = field(default_factory=dict)
+    # Content digest of the catalog CSV (catalog.file_digest); the mtime alone changes
+    # whenever the file is copied or shipped with the index.
+    catalog_digest: str = ""
 
     def to_dict(self) -> dict:
         return {
@@ -31,6 +99,12 @@ class IndexMeta:
             "built_at": self.built_at,
             "dim": self.dim,
             "count": self.count,
+            "storage_dtype": self.storage_dtype,
+            "embedding_backend": self.embedding_backend,
+            "index_params": self.index_params,
+            "index_effective": self.index_effective,
+            "search_params": self.search_params,
+            "catalog_digest": self.catalog_digest,
         }
 
     @staticmethod
@@ -41,6 +115,12 @@ class IndexMeta:
             built_at=float(d.get("built_at") or 0),
             dim=int(d.get("dim") or 0),
             count=int(d.get("count") or 0),
+            storage_dtype=str(d.get("storage_dtype") or "float32"),
+            embedding_backend=str(d.get("embedding_backend") or "torch"),
+            index_params=dict(d.get("index_params") or {"index_type": "flat"}),
+            index_effective=str(d.get("index_effective") or "flat"),
+            search_params=dict(d.get("search_params") or {}),
+            catalog_digest=str(d.get("catalog_digest") or ""),
         )
 
 
@@ -53,10 +133,15 @@ def _read_meta(meta_path: str) -> Optional[IndexMeta]:
 
 
 def _write_meta(meta_path: str, meta: IndexMeta) -> None:
-    tmp = meta_path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(meta.to_dict(), f)
-    os.replace(tmp, meta_path)
+    f, tmp = open_temp_file(meta_path, "w", encoding="utf-8")
+    try:
+        with f:
+            json.dump(meta.to_dict(), f)
+        os.replace(tmp, meta_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
 
 def _l2_normalize(x: np.ndarray) -> np.ndarray:
@@ -65,14 +150,39 @@ def _l2_normalize(x: np.ndarray) -> np.ndarray:
 
 
 class VectorIndex:
-    def __init__(self, faiss_index_path: str, embeddings_path: str, meta_path: str):
+    def __init__(
+        self,
+        faiss_index_path: str,
+        embeddings_path: str,
+        meta_path: str,
+        scales_path: Optional[str] = None,
+        storage_dtype: str = "float32",
+        mmap: bool = False,
+        params: Optional[IndexParams] = None,
+        hashes_path: Optional[str] = None,
+        embedding_backend: str = "torch",
+    ):
         self.faiss_index_path = faiss_index_path
         self.embeddings_path = embeddings_path
         self.meta_path = meta_path
+        self.scales_path = scales_path or embeddings_path + ".scales.npy"
+        self.hashes_path = hashes_path or embeddings_path + ".hashes.json"
+        # storage_dtype: float32 | float16 | int8 (see embedding_store.STORAGE_DTYPES)
+        self.storage_dtype = storage_dtype
+        # mmap: map the embeddings file read-only instead of copying it into the heap,
+        # so every worker process shares one page-cache copy of the matrix.
+        self.mmap = mmap
+        self.params = params or IndexParams()
+        # Vectors from another backend are not interchangeable with ours: never reused.
+        self.embedding_backend = embedding_backend
+        if self.params.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.params.index_type}")
 
         self._faiss = _try_import_faiss()
         self._index = None
-        self._embeddings = None
+        self._embeddings: Optional[EmbeddingMatrix] = None
+        # Meta of the loaded index.
+        self.meta: Optional[IndexMeta] = None
 
     def is_available(self) -> bool:
         return self._faiss is not None
@@ -80,75 +190,564 @@ class VectorIndex:
     def load(self) -> None:
         if not os.path.exists(self.embeddings_path):
             raise FileNotFoundError(self.embeddings_path)
-        self._embeddings = np.load(self.embeddings_path)
+        self._embeddings = load_embeddings(self.embeddings_path, self.scales_path, mmap=self.mmap)
 
-        if self._faiss and os.path.exists(self.faiss_index_path):
-            self._index = self._faiss.read_index(self.faiss_index_path)
+        # A flat FAISS index holds its own float32 copy of every vector, which would defeat
+        # the shared mapping; in mmap mode the exact scan runs over the mapped file instead.
+        meta = _read_meta(self.meta_path)
+        self.meta = meta
+        flat = meta is None or meta.index_effective == "flat"
+        if self._faiss and not (self.mmap and flat) and os.path.exists(self.faiss_index_path):
+            self._index = self._read_index()
+            self._apply_search_params()
         else:
             self._index = None
 
-    def build(self, embeddings: np.ndarray, embedding_model: str, catalog_path: str) -> None:
-        os.makedirs(os.path.dirname(self.embeddings_path), exist_ok=True)
-        emb = np.asarray(embeddings, dtype=np.float32)
-        emb = _l2_normalize(emb)
-        np.save(self.embeddings_path, emb)
-
-        if self._faiss:
-            dim = emb.shape[1]
-            index = self._faiss.IndexFlatIP(dim)
-            index.add(emb)
-            self._faiss.write_index(index, self.faiss_index_path)
-            self._index = index
-        else:
-            self._index = None
+    def stats(self) -> Dict[str, object]:
+        """
+        Size and age of the loaded index, for monitoring.
+        """
+        emb = self._embeddings
+        meta = self.meta
+        paths = (self.embeddings_path, self.scales_path, self.faiss_index_path)
+        return {
+            "rows": int(emb.shape[0]) if emb is not None else 0,
+            "dim": int(emb.shape[1]) if emb is not None else 0,
+            "bytes": sum(os.path.getsize(p) for p in paths if os.path.exists(p)),
+            "built_at": meta.built_at if meta else None,
+            "index_type": meta.index_effective if meta else None,
+            "storage_dtype": self.storage_dtype,
+            "faiss": self._index is not None,
+        }
 
-        meta = IndexMeta(
-            embedding_model=embedding_model,
-            catalog_mtime=os.path.getmtime(catalog_path) if os.path.exists(catalog_path) else 0,
-            built_at=time.time(),
-            dim=int(emb.shape[1]),
-            count=int(emb.shape[0]),
-        )
-        _write_meta(self.meta_path, meta)
-        self._embeddings = emb
+    def _read_index(self):
+        faiss = self._faiss
+        if self.mmap:
+            # IVF inverted lists can be served straight from the mapped file.
+            flags = getattr(faiss, "IO_FLAG_MMAP", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+            try:
+                return faiss.read_index(self.faiss_index_path, flags)
+            except Exception:
+                pass
+        return faiss.read_index(self.faiss_index_path)
+
+    def _apply_search_params(self) -> None:
+        if self._index is None:
+            return
+        faiss = self._faiss
+        ps = faiss.ParameterSpace()
+        try:
+            faiss.extract_index_ivf(self._index)
+            ps.set_index_parameter(self._index, "nprobe", int(self.params.nprobe))
+        except Exception:
+            pass
+        if hasattr(self._index, "hnsw"):
+            ps.set_index_parameter(self._index, "efSearch", int(self.params.ef_search))
+
+    def _create_index(self, n: int, dim: int):
+        """
+        Returns (untrained faiss index, effective type) for n rows. Falls back to a simpler
+        index when the catalog has too few rows to train the requested one.
+        """
+        faiss = self._faiss
+        p = self.params
+        kind = p.index_type
+        if kind == "ivf-pq" and n < (1 << p.pq_nbits):
+            kind = "ivf-flat"
+        if kind == "ivf-flat" and n < 2 * 39:
+            # Not enough rows for even two well-trained lists; an exact scan is as fast.
+            kind = "flat"
+
+        if kind in ("ivf-flat", "ivf-pq"):
+            nlist = max(1, min(int(p.nlist), n // 39))
+            quantizer = faiss.IndexFlatIP(dim)
+            if kind == "ivf-pq":
+                # PQ sub-quantizers must evenly split the vector.
+                m = max(d for d in range(1, min(int(p.pq_m), dim) + 1) if dim % d == 0)
+                index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, int(p.pq_nbits), faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            return index, kind
+
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, int(p.hnsw_m), faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = int(p.hnsw_ef_construction)
+            return index, kind
+
+        return faiss.IndexFlatIP(dim), "flat"
+
+    def previous_rows(self, embedding_model: str) -> Optional["PreviousRows"]:
+        """
+        The rows of the index on disk, for reuse by a rebuild, or None when its vectors
+        cannot be reused for `embedding_model` and our settings.
+        """
+        meta = _read_meta(self.meta_path)
+        if not meta or meta.embedding_model != embedding_model:
+            return None
+        if meta.embedding_backend != self.embedding_backend:
+            return None
+        # Don't carry quantization error from a lossy matrix into a more precise one.
+        if meta.storage_dtype not in ("float32", self.storage_dtype):
+            return None
+        try:
+            with open(self.hashes_path, "r", encoding="utf-8") as f:
+                prev = json.load(f)
+            prev_ids, prev_hashes = prev["source_ids"], prev["hashes"]
+            old = load_embeddings(self.embeddings_path, self.scales_path, mmap=True)
+        except Exception:
+            return None
+        if not (len(prev_ids) == len(prev_hashes) == len(old) == meta.count):
+            return None
+        return PreviousRows(prev_ids, prev_hashes, old)
+
+    def writer(self, n_rows: int, dim: int, embedding_model: str, catalog_path: str) -> "IndexWriter":
+        """
+        Starts a streaming build of `n_rows` vectors of `dim` dimensions (see IndexWriter).
+        """
+        return IndexWriter(self, n_rows, dim, embedding_model, catalog_path)
+
+    def build(
+        self,
+        embeddings: np.ndarray,
+        embedding_model: str,
+        catalog_path: str,
+        source_ids: Optional[List[str]] = None,
+        row_hashes: Optional[List[str]] = None,
+    ) -> None:
+        emb = np.asarray(embeddings, dtype=np.float32)
+        with self.writer(len(emb), emb.shape[1], embedding_model, catalog_path) as w:
+            w.append(emb, source_ids, row_hashes)
+            w.commit()
 
-    def is_stale(self, embedding_model: str, catalog_path: str) -> bool:
+    def is_stale(self, embedding_model: str, catalog_path: str, expected_rows: Optional[int] = None) -> bool:
         meta = _read_meta(self.meta_path)
         if not meta:
             return True
+        if expected_rows is not None and meta.count != int(expected_rows):
+            return True
         if meta.embedding_model != embedding_model:
             return True
-        if not os.path.exists(catalog_path):
+        if meta.storage_dtype != self.storage_dtype:
+            return True
+        if meta.embedding_backend != self.embedding_backend:
             return True
-        if meta.catalog_mtime != os.path.getmtime(catalog_path):
+        if meta.index_params != self.params.build_params():
             return True
+        if not os.path.exists(catalog_path):
+            return True
+        # Same mtime: assume the same file. Otherwise compare contents, and on a match record
+        # the new mtime so later start-ups skip the hash again.
+        mtime = os.path.getmtime(catalog_path)
+        if meta.catalog_mtime != mtime:
+            if meta.catalog_digest != file_digest(catalog_path):
+                return True
+            meta.catalog_mtime = mtime
+            try:
+                _write_meta(self.meta_path, meta)
+            except OSError:
+                pass
         if not os.path.exists(self.embeddings_path):
             return True
         if self._faiss and not os.path.exists(self.faiss_index_path):
             return True
         return False
 
-    def search(self, query_vec: np.ndarray, top_k: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+    def search(
+        self,
+        query_vec: np.ndarray,
+        top_k: int = 50,
+        mask: Optional[np.ndarray] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """
         Returns (indices, scores). Indices are row offsets into the embeddings array.
         """
+        idx, scores = self.search_many(
+            np.asarray(query_vec).reshape(1, -1),
+            top_k=top_k,
+            mask=mask,
+            exclude=None if exclude is None else [exclude],
+        )
+        return idx[0], scores[0]
+
+    def search_many(
+        self,
+        query_vecs: np.ndarray,
+        top_k: int = 50,
+        mask: Optional[np.ndarray] = None,
+        exclude: Optional[Sequence[Optional[np.ndarray]]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches m queries at once. Returns (indices, scores), both shaped (m, k), each row
+        best-first; rows are padded with -1 when fewer than top_k results exist.
+
+        `mask` (boolean, one entry per row) restricts every query to the rows where it is
+        True. `exclude` gives each query its own row ids to leave out (or None). Both are
+        applied during retrieval, so top_k is filled from eligible rows only.
+        """
         if self._embeddings is None:
             self.load()
 
-        q = np.asarray(query_vec, dtype=np.float32).reshape(1, -1)
-        q = _l2_normalize(q)
+        q = np.asarray(query_vecs, dtype=np.float32)
+        q = _l2_normalize(q.reshape(len(q), -1))
+
+        if exclude is not None and not any(e is not None and len(e) for e in exclude):
+            exclude = None
+        if exclude is None:
+            return self._search_masked(q, top_k, mask)
+
+        n = len(self._embeddings)
+        on_faiss = self._faiss is not None and self._index is not None
+        n_allowed = n if mask is None else int(np.count_nonzero(mask))
+        if not on_faiss and n_allowed > _EXACT_FILTER_ROWS:
+            # Full scan: one matmul for all queries, exclusions knocked out per row.
+            scores = dot_scores(self._embeddings, q.T).T
+            if mask is not None:
+                scores[:, ~np.asarray(mask, dtype=bool)] = -np.inf
+            for j, ex in enumerate(exclude):
+                if ex is not None and len(ex):
+                    scores[j, ex] = -np.inf
+            return _drop_ineligible(*_top_k(scores, top_k))
 
-        if self._faiss and self._index is not None:
+        # Otherwise each query carries its own mask into a single search of its own.
+        results = []
+        for j, ex in enumerate(exclude):
+            m = mask
+            if ex is not None and len(ex):
+                m = np.ones(n, dtype=bool) if mask is None else np.array(mask, dtype=bool)
+                m[ex] = False
+            results.append(self._search_masked(q[j : j + 1], top_k, m))
+        return _stack_results(results)
+
+    def _search_masked(
+        self, q: np.ndarray, top_k: int, mask: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Normalized queries, one shared (optional) row mask.
+        if mask is not None:
+            allowed = np.flatnonzero(mask)
+            if len(allowed) <= _EXACT_FILTER_ROWS:
+                if 2 * len(allowed) > len(self._embeddings):
+                    # Most rows match (typically an exclusion-only mask): gathering them would
+                    # copy nearly the whole matrix per query, so score it in place instead.
+                    scores = dot_scores(self._embeddings, q.T).T
+                    scores[:, ~np.asarray(mask, dtype=bool)] = -np.inf
+                    return _top_k(scores, min(int(top_k), len(allowed)))
+                # Few matches: score just those rows, exactly.
+                scores = dot_scores(self._embeddings[allowed], q.T).T
+                idx, scores = _top_k(scores, top_k)
+                return allowed[idx], scores
+            if self._faiss and self._index is not None:
+                selector = self._selector_params(mask)
+                if selector is not None:
+                    # FAISS only holds raw pointers to the selector and its bitmap.
+                    params, _keepalive = selector
+                    scores, idx = self._index.search(q, top_k, params=params)
+                    return idx, scores
+
+        if self._faiss and self._index is not None and mask is None:
             scores, idx = self._index.search(q, top_k)
-            return idx[0], scores[0]
+            return idx, scores
 
         # Fallback: brute-force cosine via dot product (already normalized).
-        scores = (self._embeddings @ q.T).reshape(-1)
-        top = np.argsort(scores)[-top_k:][::-1]
-        return top, scores[top]
+        scores = dot_scores(self._embeddings, q.T).T
+        if mask is not None:
+            scores[:, ~np.asarray(mask, dtype=bool)] = -np.inf
+            top_k = min(int(top_k), int(np.count_nonzero(mask)))
+        return _top_k(scores, top_k)
 
-    def get_embeddings(self) -> np.ndarray:
+    def _selector_params(self, mask: np.ndarray):
+        """
+        (FAISS SearchParameters, objects they point to) restricting a search to the rows set in
+        `mask`, carrying the index's own nprobe/efSearch (per-call parameters replace the
+        index defaults). None when this FAISS build has no search-time ID selectors.
+        """
+        faiss = self._faiss
+        try:
+            bits = np.packbits(np.asarray(mask, dtype=bool), bitorder="little")
+            sel = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits))
+            if hasattr(self._index, "hnsw"):
+                params = faiss.SearchParametersHNSW()
+                params.efSearch = int(self.params.ef_search)
+            else:
+                try:
+                    faiss.extract_index_ivf(self._index)
+                    params = faiss.SearchParametersIVF()
+                    params.nprobe = int(self.params.nprobe)
+                except Exception:
+                    params = faiss.SearchParameters()
+            params.sel = sel
+            return params, (sel, bits)
+        except Exception:
+            return None
+
+    def get_embeddings(self) -> EmbeddingMatrix:
         if self._embeddings is None:
             self.load()
         return self._embeddings
 
+
+class PreviousRows:
+    """
+    The vectors of the index on disk, looked up by (source_id, content hash) so a rebuild
+    only re-encodes new or changed rows. Keys are held as one sorted array of 8-byte
+    digests (16 bytes per row with the order), not as a dict of strings.
+    """
+
+    def __init__(self, source_ids: Sequence[str], row_hashes: Sequence[str], embeddings: EmbeddingMatrix):
+        keys = _row_keys(source_ids, row_hashes)
+        # Stable, so a duplicated key resolves to its first row.
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+        self.embeddings = embeddings
+
+    def rows(self, source_ids: Sequence[str], row_hashes: Sequence[str]) -> np.ndarray:
+        """
+        Previous row of each (source_id, hash) pair, -1 where there is none.
+        """
+        keys = _row_keys(source_ids, row_hashes)
+        if not len(self._keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return np.where(self._keys[pos] == keys, self._order[pos], -1).astype(np.int64)
+
+    def reuse(self, source_ids: Sequence[str], row_hashes: Sequence[str]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Returns (embeddings, todo) for a run of catalog rows: a float32 matrix holding the
+        previous vector of every unchanged row (None when there is none), and the
+        positions that still need encoding. See fill_rows.
+        """
+        old = self.rows(source_ids, row_hashes)
+        todo = np.flatnonzero(old < 0)
+        if len(todo) == len(old):
+            return None, todo
+        emb = np.zeros((len(old), self.embeddings.shape[1]), dtype=np.float32)
+        hit = old >= 0
+        emb[hit] = self.embeddings[old[hit]]
+        return emb, todo
+
+
+def fill_rows(emb: Optional[np.ndarray], todo: np.ndarray, fresh: np.ndarray) -> np.ndarray:
+    """
+    Completes a chunk from PreviousRows.reuse with the freshly encoded rows `todo`.
+    """
+    fresh = np.asarray(fresh, dtype=np.float32)
+    if emb is None:
+        return fresh
+    emb[todo] = fresh
+    return emb
+
+
+def _row_keys(source_ids: Sequence[str], row_hashes: Sequence[str]) -> np.ndarray:
+    if len(source_ids) != len(row_hashes):
+        raise ValueError("source_ids and row_hashes differ in length")
+    digests = b"".join(
+        hashlib.blake2b(f"{s}\0{h}".encode("utf-8"), digest_size=8).digest() for s, h in zip(source_ids, row_hashes)
+    )
+    return np.frombuffer(digests, dtype="<u8")
+
+
+class _RowHashesWriter:
+    # Streams {"source_ids": [...], "hashes": [...]} to disk: ids go straight to the
+    # output, hashes to a side file that is appended when the build commits.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._out, self._tmp = open_temp_file(path, "w", encoding="utf-8")
+        self._hashes = tempfile.TemporaryFile("w+", encoding="utf-8", dir=os.path.dirname(path) or ".")
+        self._out.write('{"source_ids": [')
+
+    def append(self, source_ids: Sequence[str], row_hashes: Sequence[str]) -> None:
+        if len(source_ids) != len(row_hashes):
+            raise ValueError("source_ids and row_hashes differ in length")
+        if not len(source_ids):
+            return
+        sep = ", " if self.rows else ""
+        self._out.write(sep + ", ".join(json.dumps(str(v)) for v in source_ids))
+        self._hashes.write(sep + ", ".join(json.dumps(str(v)) for v in row_hashes))
+        self.rows += len(source_ids)
+
+    def commit(self) -> None:
+        self._out.write('], "hashes": [')
+        self._hashes.seek(0)
+        shutil.copyfileobj(self._hashes, self._out)
+        self._out.write("]}")
+        self._close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def _close(self) -> None:
+        self._out.close()
+        self._hashes.close()
+
+
+class IndexWriter:
+    """
+    Streaming VectorIndex build over a known number of rows.
+
+    Each appended chunk is normalized and written straight to the embeddings file (and
+    its row hashes to theirs). Flat and HNSW indexes take the chunk as it comes; IVF
+    indexes keep only their training sample (at most _MAX_TRAIN_ROWS rows) and are filled
+    from the written file at commit(), so with lossy storage they index the stored
+    vectors. Memory is one chunk plus the FAISS structure, whatever the row count.
+
+    Files are written under temp names unique to this writer (several workers may
+    rebuild at once) and renamed into place by commit(), meta last.
+    As a context manager it discards an uncommitted build on exit.
+    """
+
+    def __init__(self, index: VectorIndex, n_rows: int, dim: int, embedding_model: str, catalog_path: str):
+        if n_rows <= 0:
+            raise ValueError("An index needs at least one row")
+        os.makedirs(os.path.dirname(index.embeddings_path) or ".", exist_ok=True)
+        self.index = index
+        self.n_rows = int(n_rows)
+        self.dim = int(dim)
+        self.embedding_model = embedding_model
+        self.catalog_path = catalog_path
+        self._emb = EmbeddingWriter(index.embeddings_path, index.scales_path, n_rows, dim, index.storage_dtype)
+        self._hashes: Optional[_RowHashesWriter] = _RowHashesWriter(index.hashes_path)
+        self._faiss_index = None
+        self._faiss_tmp: Optional[str] = None
+        self.effective = "flat"
+        self._train_rows: Optional[np.ndarray] = None
+        self._sample: List[np.ndarray] = []
+        if index._faiss:
+            self._faiss_index, self.effective = index._create_index(self.n_rows, self.dim)
+            if not self._faiss_index.is_trained and self.n_rows > _MAX_TRAIN_ROWS:
+                rng = np.random.default_rng(0)
+                self._train_rows = np.sort(rng.choice(self.n_rows, _MAX_TRAIN_ROWS, replace=False))
+        self._done = False
+
+    @property
+    def rows(self) -> int:
+        return self._emb.rows
+
+    def append(
+        self,
+        embeddings: np.ndarray,
+        source_ids: Optional[Sequence[str]] = None,
+        row_hashes: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        Appends the next rows. Without source_ids/row_hashes (on any chunk) the build
+        writes no row-hash file, and the next rebuild re-encodes everything.
+        """
+        emb = np.ascontiguousarray(_l2_normalize(np.asarray(embeddings, dtype=np.float32)))
+        start = self._emb.rows
+        self._emb.append(emb)
+        if self._hashes is not None:
+            if source_ids is None or row_hashes is None:
+                self._hashes.abort()
+                self._hashes = None
+            else:
+                self._hashes.append(source_ids, row_hashes)
+
+        if self._faiss_index is None:
+            return
+        if self._faiss_index.is_trained:
+            self._faiss_index.add(emb)
+        elif self._train_rows is None:
+            self._sample.append(emb)
+        else:
+            lo, hi = np.searchsorted(self._train_rows, [start, start + len(emb)])
+            self._sample.append(emb[self._train_rows[lo:hi] - start])
+
+    def commit(self, load: bool = True) -> None:
+        """
+        Publishes the build; with `load`, the VectorIndex then serves it.
+        """
+        if self._emb.rows != self.n_rows:
+            raise ValueError(f"Appended {self._emb.rows} of {self.n_rows} rows")
+        index = self.index
+        if self._faiss_index is not None:
+            if not self._faiss_index.is_trained:
+                self._faiss_index.train(np.concatenate(self._sample))
+                self._sample = []
+                for chunk in self._emb.iter_chunks():
+                    self._faiss_index.add(chunk)
+            f, self._faiss_tmp = open_temp_file(index.faiss_index_path)
+            f.close()
+            index._faiss.write_index(self._faiss_index, self._faiss_tmp)
+            self._faiss_index = None
+
+        self._emb.commit()
+        if self._hashes is not None:
+            self._hashes.commit()
+        elif os.path.exists(index.hashes_path):
+            os.remove(index.hashes_path)
+        if self._faiss_tmp is not None:
+            os.replace(self._faiss_tmp, index.faiss_index_path)
+            self._faiss_tmp = None
+
+        has_catalog = os.path.exists(self.catalog_path)
+        meta = IndexMeta(
+            embedding_model=self.embedding_model,
+            catalog_mtime=os.path.getmtime(self.catalog_path) if has_catalog else 0,
+            built_at=time.time(),
+            dim=self.dim,
+            count=self.n_rows,
+            storage_dtype=index.storage_dtype,
+            embedding_backend=index.embedding_backend,
+            index_params=index.params.build_params(),
+            index_effective=self.effective,
+            search_params=index.params.search_params(),
+            catalog_digest=file_digest(self.catalog_path) if has_catalog else "",
+        )
+        # Every artifact above was written then renamed; the meta goes last and marks the
+        # build as complete for is_stale().
+        _write_meta(index.meta_path, meta)
+        self._done = True
+        if load:
+            index.load()
+
+    def abort(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._emb.abort()
+        if self._hashes is not None:
+            self._hashes.abort()
+        self._faiss_index = None
+        self._sample = []
+        if self._faiss_tmp is not None and os.path.exists(self._faiss_tmp):
+            os.remove(self._faiss_tmp)
+
+    def __enter__(self) -> "IndexWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.abort()
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Best-first top_k column offsets and scores per row of an (m, n) score matrix.
+    k = min(int(top_k), scores.shape[1])
+    if k <= 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def _drop_ineligible(idx: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Masked-out rows only reach a top-k when too few rows are eligible; pad those as -1.
+    idx = idx.copy()
+    idx[~np.isfinite(scores)] = -1
+    return idx, scores
+
+
+def _stack_results(results: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    # Per-query (1, k_i) results as one (m, max k_i) pair, short rows padded with -1 / -inf.
+    k = max(r[0].shape[1] for r in results)
+    idx = np.full((len(results), k), -1, dtype=np.int64)
+    scores = np.full((len(results), k), -np.inf, dtype=np.float32)
+    for j, (ri, rs) in enumerate(results):
+        idx[j, : ri.shape[1]] = ri[0]
+        scores[j, : rs.shape[1]] = rs[0]
+    return idx, scores
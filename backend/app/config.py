@@ -44,8 +44,61 @@ class Config:
         "INDEX_DIR",
         str((Path(__file__).resolve().parents[1] / "data")),
     )
+    # When the recommender is built: lazy (first request) | eager (background thread at
+    # start-up, with warmup) | preload (inside create_app, before a prefork server such as
+    # `gunicorn --preload` forks; workers then share it copy-on-write and warm up after the fork).
+    RECOMMENDER_INIT = os.getenv("RECOMMENDER_INIT", "lazy").strip().lower()
     # Default kept conservative for compatibility on common dev machines.
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    # torch | torch-int8-dynamic (CPU) | onnxruntime (needs optimum[onnxruntime]). Changing it
+    # rebuilds the index: vectors from different backends are never mixed.
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+    # Embedding matrix storage. float16/int8 shrink the file 2x/4x; EMBEDDING_MMAP maps it
+    # read-only so all worker processes share one page-cache copy instead of one heap copy each.
+    EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32").strip().lower()
+    EMBEDDING_MMAP = os.getenv("EMBEDDING_MMAP", "").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+        "on",
+    }
+    # Build/refresh the vector index inside the web process when it is missing or stale.
+    # Turn off where indexes are built offline (`python -m app.ai.build_index`).
+    INDEX_AUTO_BUILD = os.getenv("INDEX_AUTO_BUILD", "true").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+        "on",
+    }
+    # ANN index: flat (exact) | ivf-flat | ivf-pq | hnsw. Build parameters are recorded in the
+    # index meta and trigger a rebuild when changed; nprobe/efSearch apply at query time.
+    INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").strip().lower()
+    INDEX_NLIST = int(os.getenv("INDEX_NLIST", "1024"))
+    INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "16"))
+    INDEX_PQ_NBITS = int(os.getenv("INDEX_PQ_NBITS", "8"))
+    INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+    INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "200"))
+    INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+    INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+    # Query embedding cache (LRU + TTL). 0 disables it; set a path to keep it across restarts.
+    PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+    PROMPT_CACHE_TTL_SECONDS = float(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+    PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", "")
+    # Micro-batching of concurrent prompt encodes: a batch closes after MAX_WAIT_MS or
+    # MAX_SIZE prompts. MAX_SIZE <= 1 encodes each prompt on its own.
+    ENCODE_BATCH_MAX_SIZE = int(os.getenv("ENCODE_BATCH_MAX_SIZE", "16"))
+    ENCODE_BATCH_MAX_WAIT_MS = float(os.getenv("ENCODE_BATCH_MAX_WAIT_MS", "2"))
+    # Per-user profile embedding cache (LRU + TTL), updated in place by library writes.
+    # The TTL bounds staleness for writes handled by other worker processes. 0 disables it.
+    PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+    PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+    # Leave comics the user marked favorite/completed/trash out of their recommendations.
+    EXCLUDE_SHELVED = os.getenv("EXCLUDE_SHELVED", "true").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+        "on",
+    }
     ENABLE_RERANKER = os.getenv("ENABLE_RERANKER", "").strip().lower() in {
         "1",
         "true",
@@ -53,8 +106,42 @@ class Config:
         "on",
     }
     RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    # torch | torch-int8 (dynamic int8, CPU) | onnx (needs optimum[onnxruntime]).
+    RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch").strip().lower()
+    # Token budget per (prompt, doc) pair; 0 keeps the model's own limit.
+    RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "0"))
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+
+    # POST /api/recommend/batch: max items per call, and the X-API-Key that allows
+    # personalizing items for arbitrary user_ids (unset = only the caller's own token).
+    RECOMMEND_BATCH_MAX_ITEMS = int(os.getenv("RECOMMEND_BATCH_MAX_ITEMS", "500"))
+    RECOMMEND_BATCH_API_KEY = os.getenv("RECOMMEND_BATCH_API_KEY", "")
+
+    # Popular lists (/api/recommend/popular, prompt-less fallback): library entries weighted
+    # by status and decayed with this half-life. Writes reach the lists (and other workers)
+    # within REFRESH_SECONDS; a full rescan every RESYNC_SECONDS also catches deletions.
+    POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "30"))
+    POPULARITY_REFRESH_SECONDS = float(os.getenv("POPULARITY_REFRESH_SECONDS", "60"))
+    POPULARITY_RESYNC_SECONDS = float(os.getenv("POPULARITY_RESYNC_SECONDS", "3600"))
+
+    # Anonymous /api/recommend/popular and /chat responses are cached per index build and
+    # sent with an ETag; RESPONSE_CACHE_SIZE entries per worker (0 disables the server-side
+    # cache), MAX_AGE is the Cache-Control max-age in seconds.
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+    RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "60"))
+
+    # GET /api/metrics (Prometheus text format): X-API-Key required to scrape it (unset = open).
+    METRICS_API_KEY = os.getenv("METRICS_API_KEY", "")
 
     # Blend weights (prompt vs personalization). 1.0 means prompt-only.
     PROMPT_WEIGHT = float(os.getenv("PROMPT_WEIGHT", "0.7"))
     PROFILE_WEIGHT = float(os.getenv("PROFILE_WEIGHT", "0.3"))
     CF_WEIGHT = float(os.getenv("CF_WEIGHT", "0.0"))
+    # CF is retrained in the background when interactions change, at most this often.
+    CF_TRAIN_INTERVAL_SECONDS = float(os.getenv("CF_TRAIN_INTERVAL_SECONDS", "60"))
+    # The CF interaction matrix follows library writes incrementally; a full rescan this
+    # often also catches deletions made by other worker processes (0 = never).
+    CF_MATRIX_RESYNC_SECONDS = float(os.getenv("CF_MATRIX_RESYNC_SECONDS", "3600"))
+    # How the weighted sources are combined: weighted (score sum) | rrf (reciprocal rank).
+    FUSION_METHOD = os.getenv("FUSION_METHOD", "weighted").strip().lower()
+    FUSION_RRF_K = int(os.getenv("FUSION_RRF_K", "60"))
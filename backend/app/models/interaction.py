@@ -6,7 +6,11 @@ class UserComic(db.Model):
     __tablename__ = "user_comics"
     __table_args__ = (
         db.UniqueConstraint("user_id", "comic_id", name="uq_user_comic"),
-        db.Index("ix_user_comics_user_status", "user_id", "status"),
+        # Library listings (newest first, paged by (updated_at, id)) and any other lookup by
+        # (user_id, status).
+        db.Index("ix_user_comics_user_status_updated", "user_id", "status", "updated_at", "id"),
+        # Recommender syncs: rows written since a watermark.
+        db.Index("ix_user_comics_updated_at", "updated_at"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify
+
+from .recommendations import recommender_status
+
+health_bp = Blueprint("health", __name__)
+
+
+@health_bp.get("")
+def live():
+    return jsonify({"status": "ok"})
+
+
+@health_bp.get("/ready")
+def ready():
+    # 503 until this worker's recommender is loaded (and warmed up, when configured).
+    status = recommender_status()
+    return jsonify(status), 200 if status["ready"] else 503
@@ -1,13 +1,37 @@
+import base64
+from datetime import datetime
+
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from sqlalchemy import or_
+from sqlalchemy import or_, tuple_
 
 from .. import db
+from ..ai.metrics import REGISTRY, StageTimer
 from ..models.comic import Comic
 from ..models.interaction import UserComic
+from .recommendations import notify_library_change
 
 library_bp = Blueprint("library", __name__)
 
+# Comic fields a listing can be narrowed to with ?fields=title,author (all by default).
+LISTING_FIELDS = (
+    "id",
+    "source",
+    "source_id",
+    "title",
+    "author",
+    "publisher",
+    "genre",
+    "year",
+    "rating",
+    "description",
+    "tags",
+    "cover_image",
+)
+# Listings are unpaginated unless ?limit= or ?cursor= is given.
+_DEFAULT_PAGE_SIZE = 50
+_MAX_PAGE_SIZE = 500
+
 
 def _serialize_comic(comic: Comic):
     return {
@@ -78,8 +102,10 @@ def _parse_user_id():
 
 
 def _upsert_status(status: str):
+    timer = StageTimer()
     payload = request.get_json() or {}
     comic = _get_or_create_comic(payload)
+    timer.lap("comic")
     if not comic:
         return jsonify({"error": "Comic not found"}), 404
 
@@ -109,17 +135,109 @@ def _upsert_status(status: str):
     for extra in extras:
         db.session.delete(extra)
     db.session.commit()
+    timer.lap("write")
+    notify_library_change(user_id, comic.id, status, comic=comic)
+    timer.lap("notify")
+
+    response = jsonify({"status": "ok", "comic": _serialize_comic(comic), "state": status})
+    timer.lap("serialize")
+    REGISTRY.observe_stages("library_write", timer)
+    return response
 
-    return jsonify({"status": "ok", "comic": _serialize_comic(comic), "state": status})
 
+def _encode_cursor(updated_at: datetime, entry_id: int) -> str:
+    # Opaque to clients: the (updated_at, id) of the last entry of a page.
+    raw = f"{updated_at.isoformat()}|{entry_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
 
-def _get_by_status(status: str):
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        updated_at, entry_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(updated_at), int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor") from None
+
+
+def _listing_args():
+    # (fields, page size or None, decoded cursor or None) from the query string.
+    raw = request.args.get("fields")
+    fields = LISTING_FIELDS
+    if raw:
+        fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+        unknown = [f for f in fields if f not in LISTING_FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields selected")
+
+    cursor = request.args.get("cursor") or None
+    limit = request.args.get("limit")
+    if limit is None and cursor is None:
+        return fields, None, None
+    try:
+        limit = int(limit) if limit is not None else _DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("Invalid limit") from None
+    limit = min(max(limit, 1), _MAX_PAGE_SIZE)
+    return fields, limit, _decode_cursor(cursor) if cursor else None
+
+
+def _list_by_status(status: str, search: bool = False):
+    """
+    The caller's comics with `status`, newest first, from one joined query. With ?limit=
+    (or ?cursor=) one page is returned and the X-Next-Cursor header, when present, fetches
+    the next one. ?fields= selects the comic fields (and only those columns are read).
+    """
     user_id = _parse_user_id()
     if user_id is None:
         return jsonify({"error": "Invalid token"}), 401
-    records = UserComic.query.filter_by(user_id=user_id, status=status).all()
-    comics = [Comic.query.get(record.comic_id) for record in records]
-    return jsonify([_serialize_comic(comic) for comic in comics if comic])
+    try:
+        fields, limit, cursor = _listing_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    timer = StageTimer()
+
+    query = (
+        db.session.query(UserComic.id, UserComic.updated_at, *(getattr(Comic, f) for f in fields))
+        .join(Comic, Comic.id == UserComic.comic_id)
+        .filter(UserComic.user_id == user_id, UserComic.status == status)
+        # Served by ix_user_comics_user_status_updated, so a page reads only its own rows.
+        .order_by(UserComic.updated_at.desc(), UserComic.id.desc())
+    )
+    query_text = (request.args.get("q") or "").strip() if search else ""
+    if query_text:
+        like = f"%{query_text}%"
+        query = query.filter(
+            or_(
+                Comic.title.ilike(like),
+                Comic.author.ilike(like),
+                Comic.genre.ilike(like),
+            )
+        )
+    if cursor is not None:
+        query = query.filter(tuple_(UserComic.updated_at, UserComic.id) < tuple_(*cursor))
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = query.all()
+    timer.lap("query")
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][1], rows[-1][0])
+    with_tags = "tags" in fields
+    items = []
+    for row in rows:
+        item = dict(zip(fields, row[2:]))
+        if with_tags:
+            item["tags"] = item["tags"] or []
+        items.append(item)
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    timer.lap("serialize")
+    REGISTRY.observe_stages("library_list", timer)
+    return response
 
 
 @library_bp.post("/favorite")
@@ -149,47 +267,26 @@ def add_trash():
 @library_bp.get("/favorites")
 @jwt_required()
 def favorites():
-    return _get_by_status("favorite")
+    return _list_by_status("favorite")
 
 
 @library_bp.get("/reading")
 @jwt_required()
 def reading():
-    return _get_by_status("reading")
+    return _list_by_status("reading")
 
 
 @library_bp.get("/completed")
 @jwt_required()
 def completed():
-    return _get_by_status("completed")
+    return _list_by_status("completed")
 
 
 @library_bp.get("/trash")
 @jwt_required()
 def trash():
-    user_id = _parse_user_id()
-    if user_id is None:
-        return jsonify({"error": "Invalid token"}), 401
-    query_text = (request.args.get("q") or "").strip()
-
-    query = (
-        db.session.query(Comic)
-        .join(UserComic, UserComic.comic_id == Comic.id)
-        .filter(UserComic.user_id == user_id, UserComic.status == "trash")
-    )
-
-    if query_text:
-        like = f"%{query_text}%"
-        query = query.filter(
-            or_(
-                Comic.title.ilike(like),
-                Comic.author.ilike(like),
-                Comic.genre.ilike(like),
-            )
-        )
-
-    comics = query.all()
-    return jsonify([_serialize_comic(comic) for comic in comics])
+    # Also filterable with ?q= (title, author or genre).
+    return _list_by_status("trash", search=True)
 
 
 @library_bp.delete("/trash/<int:comic_id>")
@@ -198,11 +295,18 @@ def delete_trash(comic_id: int):
     user_id = _parse_user_id()
     if user_id is None:
         return jsonify({"error": "Invalid token"}), 401
+    timer = StageTimer()
     record = UserComic.query.filter_by(
         user_id=user_id, comic_id=comic_id, status="trash"
     ).first()
     if not record:
         return jsonify({"status": "not_found"}), 404
+    # Passed on so the recommender can resolve it to a catalog row.
+    comic = Comic.query.get(comic_id)
     db.session.delete(record)
     db.session.commit()
+    timer.lap("write")
+    notify_library_change(user_id, comic_id, None, comic=comic)
+    timer.lap("notify")
+    REGISTRY.observe_stages("library_delete", timer)
     return jsonify({"status": "deleted"})
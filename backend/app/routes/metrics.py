@@ -0,0 +1,22 @@
+import hmac
+
+from flask import Blueprint, current_app, jsonify, request
+
+from ..ai.metrics import REGISTRY
+from .recommendations import current_recommender, recommender_status
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.get("")
+def metrics():
+    # Prometheus scrape target for this worker. With METRICS_API_KEY set, scrapers send it as X-API-Key.
+    key = current_app.config.get("METRICS_API_KEY") or ""
+    if key and not hmac.compare_digest(key.encode("utf-8"), (request.headers.get("X-API-Key") or "").encode("utf-8")):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    samples = [("recommender_ready", "gauge", "1 when this worker's recommender is ready.", {}, float(recommender_status()["ready"]))]
+    rec = current_recommender()
+    if rec is not None:
+        samples.extend(rec.metric_samples())
+    return current_app.response_class(REGISTRY.render(samples), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,25 +1,195 @@
-from functools import lru_cache
+import gc
+import hmac
+import json
+import os
+import threading
+import time
 
 from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 
+from ..ai.embedding import normalize_prompt
+from ..ai.filters import SearchFilters
+from ..ai.metrics import REGISTRY, StageTimer
 from ..ai.recommender import ComicRecommender, RecommenderConfig
+from ..ai.response_cache import make_etag
 
 recommend_bp = Blueprint("recommendations", __name__)
 
-@lru_cache(maxsize=1)
+# lazy: built by the first request | eager: built and warmed up in a background thread at
+# start-up | preload: built synchronously in create_app (before a prefork server forks),
+# then warmed up in each worker after the fork.
+RECOMMENDER_INIT_MODES = ("lazy", "eager", "preload")
+
+# One recommender per process. `_status` is what /api/health/ready reports.
+_recommender: ComicRecommender | None = None
+_recommender_lock = threading.Lock()
+_status: dict = {"state": "lazy", "error": None, "warmup": None}
+_fork_hook_registered = False
+
+
+def _build_recommender(app) -> ComicRecommender:
+    return ComicRecommender(cfg=RecommenderConfig.from_config(app.config), app=app)
+
+
 def _get_recommender() -> ComicRecommender:
-    cfg = RecommenderConfig(
-        catalog_path=current_app.config["CATALOG_PATH"],
-        index_dir=current_app.config["INDEX_DIR"],
-        embedding_model=current_app.config["EMBEDDING_MODEL"],
-        enable_reranker=bool(current_app.config.get("ENABLE_RERANKER")),
-        rerank_model=current_app.config.get("RERANK_MODEL"),
-        prompt_weight=float(current_app.config.get("PROMPT_WEIGHT") or 0.7),
-        profile_weight=float(current_app.config.get("PROFILE_WEIGHT") or 0.3),
-        cf_weight=float(current_app.config.get("CF_WEIGHT") or 0.0),
+    global _recommender
+    rec = _recommender
+    if rec is not None:
+        return rec
+    with _recommender_lock:
+        if _recommender is None:
+            _recommender = _build_recommender(current_app._get_current_object())
+            # Also recovers from a failed eager/preload start-up.
+            if _status["state"] in ("lazy", "failed"):
+                _status.update(state="ready", error=None)
+        return _recommender
+
+
+def _initialize(app, warm: bool) -> None:
+    global _recommender
+    _status.update(state="loading", error=None)
+    try:
+        with app.app_context():
+            with _recommender_lock:
+                if _recommender is None:
+                    _recommender = _build_recommender(app)
+            if warm:
+                _warm(app)
+            else:
+                _recommender.preload()
+                _status["state"] = "ready"
+    except Exception as e:  # noqa: BLE001 - requests fall back to building lazily
+        _status.update(state="failed", error=f"{type(e).__name__}: {e}")
+        app.logger.exception("Recommender initialization failed")
+
+
+def _warm(app) -> None:
+    _status.update(state="warming")
+    try:
+        t0 = time.perf_counter()
+        timings = _recommender.warmup()
+        timings["total"] = time.perf_counter() - t0
+        _status.update(state="ready", warmup={k: round(v, 4) for k, v in timings.items()})
+    except Exception as e:  # noqa: BLE001
+        # A failed warmup only costs latency; the recommender itself is usable.
+        _status.update(state="ready", error=f"warmup: {type(e).__name__}: {e}")
+        app.logger.exception("Recommender warmup failed")
+
+
+def init_recommender(app) -> None:
+    """
+    Applies RECOMMENDER_INIT (see RECOMMENDER_INIT_MODES). In preload mode nothing runs
+    inference or starts threads before the fork: workers share the loaded catalog, index
+    and model weights copy-on-write, and each one warms up in its own thread afterwards.
+    """
+    global _fork_hook_registered
+    mode = (app.config.get("RECOMMENDER_INIT") or "lazy").strip().lower()
+    if mode not in RECOMMENDER_INIT_MODES:
+        raise ValueError(f"Unknown RECOMMENDER_INIT mode: {mode}")
+    if mode == "lazy":
+        return
+    if mode == "eager":
+        _status["state"] = "loading"
+        threading.Thread(target=_initialize, args=(app, True), name="recommender-init", daemon=True).start()
+        return
+
+    _initialize(app, warm=False)
+    # Move everything allocated so far out of the collector's reach, so GC passes in the
+    # workers don't write to (and so un-share) the preloaded pages.
+    gc.freeze()
+    if not _fork_hook_registered and hasattr(os, "register_at_fork"):
+        _fork_hook_registered = True
+
+        def _after_fork() -> None:
+            if _recommender is not None:
+                threading.Thread(target=_warm, args=(app,), name="recommender-warmup", daemon=True).start()
+
+        os.register_at_fork(after_in_child=_after_fork)
+
+
+def current_recommender() -> ComicRecommender | None:
+    # This process's recommender if it has been built; never builds one.
+    return _recommender
+
+
+def recommender_status() -> dict:
+    # Readiness of this process's recommender; lazy mode is ready before it is built.
+    state = _status["state"]
+    return {
+        "ready": state == "ready" or state == "lazy",
+        "state": state,
+        "loaded": _recommender is not None,
+        "error": _status["error"],
+        "warmup_seconds": _status["warmup"],
+        "pid": os.getpid(),
+    }
+
+
+def notify_library_change(user_id: int, comic_id: int, status: str | None, comic=None) -> None:
+    # Keep cached profile embeddings in step with library writes (status None = removed).
+    # A recommender that has not been built yet has nothing cached, so it is not built here.
+    if _recommender is None:
+        return
+    _get_recommender().library_changed(
+        user_id=user_id,
+        comic_id=comic_id,
+        status=status,
+        source_id=comic.source_id if comic is not None else None,
+        title=comic.title if comic is not None else None,
+        author=comic.author if comic is not None else None,
     )
-    return ComicRecommender(cfg=cfg)
+
+
+def _records_response(body: str):
+    # Record lists are serialized from RecordStore's pre-encoded fragments instead of jsonify.
+    return current_app.response_class(body, mimetype="application/json")
+
+
+def _cached_response(recommender: ComicRecommender, endpoint: str, key, render):
+    """
+    Response for a request whose body depends only on `key` and the loaded index: served
+    from the recommender's response cache (`render()` on a miss), with an ETag, a public
+    Cache-Control and, for GET, 304 when If-None-Match still matches.
+    """
+    cache = recommender.responses
+    version = recommender.response_version()
+    item = cache.get(version, endpoint, key) if cache is not None else None
+    if item is None:
+        body = render()
+        etag = cache.put(version, endpoint, key, body) if cache is not None else make_etag(version, body)
+    else:
+        body, etag = item
+    if request.method in ("GET", "HEAD") and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = _records_response(body)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={int(current_app.config.get('RESPONSE_CACHE_MAX_AGE') or 0)}"
+    # The same URL with a token is personalized.
+    response.vary.add("Authorization")
+    return response
+
+
+def _result_json(recommender: ComicRecommender, result: dict) -> str:
+    # process_prompt() output with its records spliced in from pre-encoded fragments.
+    result = dict(result)
+    recs = result.pop("recommendations")
+    head = json.dumps(result, ensure_ascii=False)[:-1]
+    sep = ", " if result else ""
+    return f'{head}{sep}"recommendations": {recommender.records.dumps(recs)}}}'
+
+
+def _wants_timings(payload: dict | None = None) -> bool:
+    # {"timings": true} in the body or ?timings=1 adds the stage times to the response.
+    if payload and payload.get("timings") is True:
+        return True
+    return request.args.get("timings", "").lower() in ("1", "true", "yes")
+
+
+def _with_timings(body: str, timer: StageTimer) -> str:
+    # Splices "timings_ms" into a serialized JSON object.
+    return f'{body[:-1]}, "timings_ms": {json.dumps(timer.as_ms())}}}'
 
 
 def _maybe_user_id() -> int | None:
@@ -33,13 +203,78 @@ def _maybe_user_id() -> int | None:
         return None
 
 
+def _filters_from_args() -> SearchFilters | None:
+    # Query-string form of the filters object: ?genre=a&genre=b&publisher=...&year_min=...
+    raw = {}
+    for key in ("genre", "publisher", "author"):
+        values = request.args.getlist(key)
+        if values:
+            raw[key] = values
+    for key in ("year_min", "year_max"):
+        if request.args.get(key):
+            raw[key] = request.args.get(key)
+    return SearchFilters.from_payload(raw)
+
+
 @recommend_bp.post("/chat")
 def chat():
+    """
+    {"prompt": ..., "filters": {"genre": ..., "publisher": ..., "author": ..., "year_min": ...,
+    "year_max": ...}}; every filter is optional and genre/publisher/author take a string or a list.
+    With "timings": true the response also carries the stage times as "timings_ms".
+    """
+    timer = StageTimer()
     payload = request.get_json() or {}
-    prompt = payload.get("prompt", "")
     try:
-        result = _get_recommender().process_prompt(prompt, user_id=_maybe_user_id())
-        return jsonify(result)
+        filters = SearchFilters.from_payload(payload.get("filters"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _chat(str(payload.get("prompt") or ""), filters, _wants_timings(payload), timer)
+
+
+@recommend_bp.get("/chat")
+def chat_get():
+    """
+    GET form of /chat: ?prompt=...&genre=...&year_min=... (filters as for /personalized),
+    so anonymous results can be cached by browsers and proxies.
+    """
+    timer = StageTimer()
+    try:
+        filters = _filters_from_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _chat(request.args.get("prompt", ""), filters, _wants_timings(), timer)
+
+
+def _chat(prompt: str, filters: SearchFilters | None, timings: bool, timer: StageTimer):
+    try:
+        recommender = _get_recommender()
+        timer.lap("init")
+        user_id = _maybe_user_id()
+
+        def render() -> str:
+            result = recommender.process_prompt(prompt, user_id=user_id, filters=filters, timer=timer)
+            return _result_json(recommender, result)
+
+        if user_id is None and not timings:
+            # Anonymous results depend only on the prompt, the filters and the index, plus
+            # the popular lists when there is no prompt.
+            key = (normalize_prompt(prompt), filters)
+            if not key[0]:
+                key += (recommender.popularity_version(),)
+            response = _cached_response(recommender, "chat", key, render)
+            timer.lap("serialize")
+            REGISTRY.observe_stages("chat", timer)
+            return response
+        body = render()
+        timer.lap("serialize")
+        REGISTRY.observe_stages("chat", timer)
+        if timings:
+            body = _with_timings(body, timer)
+        response = _records_response(body)
+        if user_id is not None:
+            response.headers["Cache-Control"] = "private, no-store"
+        return response
     except Exception as e:
         # Make dependency issues diagnosable from the frontend.
         return (
@@ -54,21 +289,103 @@ def chat():
         )
 
 
+def _has_batch_key() -> bool:
+    key = current_app.config.get("RECOMMEND_BATCH_API_KEY") or ""
+    given = request.headers.get("X-API-Key") or ""
+    return bool(key) and hmac.compare_digest(key.encode("utf-8"), given.encode("utf-8"))
+
+
+@recommend_bp.post("/batch")
+def batch():
+    """
+    Recommendations for many prompts in one call: {"items": [{"prompt": ..., "user_id": ...}]}.
+    Arbitrary user_ids need the X-API-Key header (RECOMMEND_BATCH_API_KEY); otherwise every
+    item is personalized for the caller's own token, if any. An optional top-level
+    "filters" object (as for /chat) applies to every item, and so does "timings".
+    """
+    timer = StageTimer()
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("items")
+    if not isinstance(items, list):
+        return jsonify({"error": "items must be a list"}), 400
+    try:
+        filters = SearchFilters.from_payload(payload.get("filters"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    max_items = int(current_app.config.get("RECOMMEND_BATCH_MAX_ITEMS") or 0)
+    if max_items and len(items) > max_items:
+        return jsonify({"error": f"At most {max_items} items per batch"}), 400
+
+    trusted = _has_batch_key()
+    caller = None if trusted else _maybe_user_id()
+    requests = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict):
+            return jsonify({"error": "Each item must be an object or a prompt string"}), 400
+        uid = caller
+        if trusted and item.get("user_id") is not None:
+            try:
+                uid = int(item["user_id"])
+            except (TypeError, ValueError):
+                return jsonify({"error": "Invalid user_id"}), 400
+        requests.append((str(item.get("prompt") or ""), uid))
+
+    try:
+        recommender = _get_recommender()
+        timer.lap("init")
+        results = recommender.process_prompts(requests, filters=filters, timer=timer)
+    except Exception as e:
+        return jsonify({"error": "recommender_init_failed", "details": str(e)}), 500
+    body = ",".join(_result_json(recommender, r) for r in results)
+    body = f'{{"results": [{body}]}}'
+    timer.lap("serialize")
+    REGISTRY.observe_stages("batch", timer)
+    if _wants_timings(payload):
+        body = _with_timings(body, timer)
+    return _records_response(body)
+
+
 @recommend_bp.get("/popular")
 def popular():
+    """
+    Most popular comics by recent library activity: ?limit=10 (at most 100) and the
+    filters of /personalized (?genre=... reads that genre's own list).
+    """
     recommender = _get_recommender()
     if recommender.comics_df.empty:
         return jsonify([])
-    return jsonify(recommender.comics_df.head(10).to_dict("records"))
+    try:
+        filters = _filters_from_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), recommender.popularity.depth)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    key = (filters, limit, recommender.popularity_version())
+    return _cached_response(
+        recommender, "popular", key, lambda: recommender.records.dumps_rows(recommender.popular_rows(limit, filters))
+    )
 
 
 @recommend_bp.get("/personalized")
 def personalized():
+    timer = StageTimer()
     recommender = _get_recommender()
     if recommender.comics_df.empty:
         return jsonify([])
     uid = _maybe_user_id()
     if uid is None:
         return jsonify({"error": "Unauthorized"}), 401
-    recs, _ = recommender.recommend(prompt="", user_id=uid)
-    return jsonify(recs)
+    try:
+        filters = _filters_from_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    timer.lap("init")
+    recs, _ = recommender.recommend(prompt="", user_id=uid, filters=filters, timer=timer)
+    body = recommender.records.dumps(recs)
+    timer.lap("serialize")
+    REGISTRY.observe_stages("personalized", timer)
+    return _records_response(body)
@@ -0,0 +1,74 @@
+"""
+Brings an existing database up to the current schema. create_app() only creates missing
+tables; this adds the indexes introduced since, drops the ones they replaced and
+backfills data the app now relies on. Run it once per deploy, before starting the
+workers, from backend/ with the same .env:
+
+  python -m app.upgrade_db
+
+Every step checks first, so running it again is harmless.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import sqlalchemy as sa
+
+# (table, index name, columns) of indexes superseded by a longer one with the same prefix.
+_DROPPED_INDEXES = [
+    # Left prefix of ix_user_comics_user_status_updated.
+    ("user_comics", "ix_user_comics_user_status", ("user_id", "status")),
+]
+
+
+def upgrade(log: Callable[[str], None] = print) -> None:
+    """
+    Runs every step inside the current app context.
+    """
+    from . import db
+    from .models.interaction import UserComic
+
+    engine = db.engine
+    for table in db.metadata.sorted_tables:
+        existing = {ix["name"] for ix in sa.inspect(engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                log(f"created index {index.name}")
+
+    for table_name, name, columns in _DROPPED_INDEXES:
+        if name in {ix["name"] for ix in sa.inspect(engine).get_indexes(table_name)}:
+            # A detached table, so the model's metadata never sees the old index.
+            table = sa.Table(table_name, sa.MetaData(), *(sa.Column(c) for c in columns))
+            sa.Index(name, *(table.c[c] for c in columns)).drop(engine)
+            log(f"dropped index {name}")
+
+    # Library listings page on (updated_at, id); rows from before updated_at was always
+    # set sort as the oldest.
+    n = UserComic.query.filter(UserComic.updated_at.is_(None)).update(
+        {UserComic.updated_at: datetime(1970, 1, 1)}, synchronize_session=False
+    )
+    db.session.commit()
+    if n:
+        log(f"backfilled updated_at on {n} user_comics rows")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args(argv)
+    # Nothing here needs the recommender.
+    os.environ["RECOMMENDER_INIT"] = "lazy"
+    from . import create_app
+
+    app = create_app()
+    with app.app_context():
+        upgrade(log=lambda msg: print(msg, file=sys.stderr, flush=True))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
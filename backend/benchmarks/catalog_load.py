@@ -0,0 +1,106 @@
+"""
+Catalog startup cost: the former row-wise CSV path vs the vectorized path and the
+Parquet cache.
+
+Run from backend/:
+  python -m benchmarks.catalog_load --rows 200000
+
+"legacy" is the python-engine parse with per-row tag parsing and iterrows id map;
+"cold" parses with the C engine, normalizes vectorized and writes the cache; "warm"
+reads the cache back (requires pyarrow).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.catalog import _try_import_pyarrow, build_source_id_map, load_catalog  # noqa: E402
+
+
+def _legacy_load(csv_path: str) -> dict:
+    df = pd.read_csv(csv_path, engine="python", on_bad_lines="skip", quotechar='"', escapechar="\\")
+
+    def _to_tags(x) -> list:
+        if x is None:
+            return []
+        if isinstance(x, list):
+            return [str(t).strip().lower() for t in x if str(t).strip()]
+        return [t.strip().lower() for t in str(x).split(",") if t.strip()]
+
+    df["tags"] = df["tags"].fillna("").apply(_to_tags)
+    for col in ["title", "author", "publisher", "genre", "series", "description"]:
+        df[col] = df[col].fillna("").astype(str)
+    df["search_text"] = (
+        df["title"] + " " + df["author"] + " " + df["publisher"] + " " + df["series"] + " " + df["genre"]
+        + " " + df["tags"].apply(lambda x: " ".join(x) if isinstance(x, list) else str(x)) + " " + df["description"]
+    ).astype(str)
+    df["source_id"] = df["id"].astype(str)
+    df["row_id"] = range(len(df))
+    df = df.where(pd.notnull(df), None)
+    out = {}
+    for _, r in df[["source_id", "row_id"]].iterrows():
+        out[str(r["source_id"])] = int(r["row_id"])
+    return out
+
+
+def _write_csv(path: str, rows: int) -> None:
+    rng = np.random.default_rng(0)
+    words = np.array(["dark", "hero", "space", "magic", "noir", "school", "romance", "war", "robot", "ghost"])
+    pd.DataFrame(
+        {
+            "id": [f"c{i}" for i in range(rows)],
+            "title": [f"Title {i}" for i in range(rows)],
+            "author": [f"Author {i % 5000}" for i in range(rows)],
+            "publisher": rng.choice(["Marvel", "DC", "Viz", "Kodansha"], size=rows),
+            "genre": rng.choice(["Action", "Drama", "Comedy"], size=rows),
+            "year": rng.integers(1950, 2026, size=rows),
+            "rating": np.round(rng.uniform(1, 5, size=rows), 1),
+            "description": [" ".join(rng.choice(words, size=20)) for _ in range(rows)],
+            "tags": [", ".join(rng.choice(words, size=3)) for _ in range(rows)],
+            "cover_image": [f"/covers/{i}.jpg" for i in range(rows)],
+            "series": "",
+        }
+    ).to_csv(path, index=False)
+
+
+def _time(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def run(rows: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "catalog.csv")
+        cache_path = os.path.join(tmp, "catalog_normalized.parquet")
+        _write_csv(csv_path, rows)
+        print(f"rows={rows} csv={os.path.getsize(csv_path) / 2**20:.1f} MiB")
+        print(f"{'path':<10}{'seconds':>10}")
+        print(f"{'legacy':<10}{_time(lambda: _legacy_load(csv_path)):>10.3f}")
+        print(f"{'cold':<10}{_time(lambda: build_source_id_map(load_catalog(csv_path, cache_path=cache_path))):>10.3f}")
+        if _try_import_pyarrow() is None or not os.path.exists(cache_path):
+            print("warm: skipped (pyarrow not installed)")
+            return
+        print(f"{'warm':<10}{_time(lambda: build_source_id_map(load_catalog(csv_path, cache_path=cache_path))):>10.3f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+    run(args.rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
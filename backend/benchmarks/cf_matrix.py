@@ -0,0 +1,126 @@
+"""
+Cost of keeping the CF interaction matrix current: full rebuild vs incremental edits.
+
+Run from backend/:
+  python -m benchmarks.cf_matrix --interactions 1000000 --users 50000 --items 200000 --edits 1000
+
+Interactions are synthetic (user id, catalog row, status) triples. "legacy rebuild" is
+the per-row loop plus COO -> CSR that the trainer used to run on every retrain.
+"InteractionMatrix.load" is the vectorized full scan, still used at start-up and for
+the periodic resync. "edits + compact" is what a retrain normally costs now: apply
+the library writes made since the last compaction and merge them into the CSR. The
+compacted matrix must equal a fresh full build over the edited data.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.cf import CF_STATUS_WEIGHTS, InteractionMatrix  # noqa: E402
+
+STATUSES = np.array(list(CF_STATUS_WEIGHTS))
+
+
+def _legacy_rebuild(user_ids, items, statuses, n_items: int):
+    # The former ComicRecommender._get_or_build_cf matrix build (minus the DB query).
+    uniq = sorted({int(u) for u in user_ids.tolist()})
+    user_id_to_row = {uid: i for i, uid in enumerate(uniq)}
+    rows, cols, data = [], [], []
+    for uid, rid, status in zip(user_ids.tolist(), items.tolist(), statuses.tolist()):
+        w = float(CF_STATUS_WEIGHTS.get(status, 0.0))
+        if w <= 0:
+            continue
+        rows.append(user_id_to_row[int(uid)])
+        cols.append(int(rid))
+        data.append(w)
+    return scipy.sparse.coo_matrix((data, (rows, cols)), shape=(len(uniq), n_items), dtype=np.float32).tocsr()
+
+
+def _synthetic(rng, n: int, n_users: int, n_items: int):
+    # Unique (user, item) pairs, as the uq_user_comic constraint guarantees.
+    keys = np.unique(rng.integers(0, n_users * n_items, size=int(n * 1.05), dtype=np.int64))[:n]
+    rng.shuffle(keys)
+    return keys // n_items, keys % n_items, rng.choice(STATUSES, size=len(keys))
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+
+def run(n: int, n_users: int, n_items: int, n_edits: int, repeat: int) -> None:
+    rng = np.random.default_rng(0)
+    user_ids, items, statuses = _synthetic(rng, n, n_users, n_items)
+    weights = np.array([CF_STATUS_WEIGHTS[s] for s in statuses.tolist()], dtype=np.float32)
+
+    # Edits: status changes on existing entries plus brand-new interactions.
+    pick = rng.integers(0, len(user_ids), size=n_edits // 2)
+    e_users = np.concatenate([user_ids[pick], rng.integers(0, n_users + 100, size=n_edits - len(pick))])
+    e_items = np.concatenate([items[pick], rng.integers(0, n_items, size=n_edits - len(pick))])
+    e_status = rng.choice(STATUSES, size=n_edits)
+    edits = [
+        (int(u), int(i), float(CF_STATUS_WEIGHTS[s])) for u, i, s in zip(e_users, e_items, e_status.tolist())
+    ]
+
+    def incremental():
+        m = InteractionMatrix(n_items)
+        m.load(user_ids, items, weights)
+        t0 = time.perf_counter()
+        m.set_many(edits)
+        out = m.compact()
+        return out, time.perf_counter() - t0
+
+    (merged, merged_users), _ = incremental()
+    final = {}
+    for u, i, w in zip(user_ids.tolist(), items.tolist(), weights.tolist()):
+        final[(u, i)] = w
+    for u, i, w in edits:
+        final[(u, i)] = w
+    ref = InteractionMatrix(n_items)
+    ref.load(
+        np.fromiter((k[0] for k in final), dtype=np.int64, count=len(final)),
+        np.fromiter((k[1] for k in final), dtype=np.int64, count=len(final)),
+        np.fromiter(final.values(), dtype=np.float32, count=len(final)),
+    )
+    ref_csr, ref_users = ref.compact()
+    # Row order differs (ref is sorted by user id, merged appends new users), so align first.
+    order = np.argsort(merged_users, kind="stable")
+    if not np.array_equal(merged_users[order], ref_users) or (merged[order] != ref_csr).nnz:
+        raise SystemExit("compacted matrix does not match a full rebuild")
+
+    print(f"interactions={len(user_ids)} users={n_users} items={n_items} edits={n_edits} nnz={merged.nnz}")
+    print(f"{'step':<24}{'ms':>10}")
+    legacy = _best(lambda: _legacy_rebuild(user_ids, items, statuses, n_items), repeat)
+    print(f"{'legacy rebuild':<24}{legacy:>10.1f}")
+    load = _best(lambda: InteractionMatrix(n_items).load(user_ids, items, weights), repeat)
+    print(f"{'InteractionMatrix.load':<24}{load:>10.1f}")
+    inc = min(incremental()[1] for _ in range(repeat)) * 1000.0
+    print(f"{'edits + compact':<24}{inc:>10.1f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--interactions", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=50_000)
+    ap.add_argument("--items", type=int, default=200_000)
+    ap.add_argument("--edits", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    run(args.interactions, args.users, args.items, args.edits, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+"""
+Embedding backends: encode throughput and cosine drift against the fp32 torch vectors.
+
+Run from backend/:
+  python -m benchmarks.embedding_backend --model all-MiniLM-L6-v2 --texts 2000
+
+Encodes the same texts (catalog search_text, repeated to --texts) with every backend.
+Drift is the cosine between each text's vector and its torch fp32 vector: mean and the
+worst case. Backends that are not installed are reported as skipped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.catalog import load_catalog  # noqa: E402
+from app.ai.embedding import EMBEDDING_BACKENDS, load_embedder  # noqa: E402
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
+
+
+def run(model: str, catalog: str, n_texts: int, batch_size: int) -> None:
+    df = load_catalog(catalog)
+    if df.empty:
+        raise SystemExit(f"Catalog is empty: {catalog}")
+    base = df["search_text"].astype(str).tolist()
+    texts = [base[i % len(base)] for i in range(n_texts)]
+
+    print(f"model={model} texts={n_texts} batch_size={batch_size}")
+    print(f"{'backend':<20}{'texts/s':>10}{'query ms':>10}{'mean cos':>10}{'min cos':>10}")
+    ref = None
+    for backend in EMBEDDING_BACKENDS:
+        emb = load_embedder(model, backend=backend)
+        if emb.backend != backend:
+            print(f"{backend:<20}  skipped (backend not installed)")
+            continue
+        emb.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+        t0 = time.perf_counter()
+        vecs = _unit(emb.encode(texts, batch_size=batch_size))
+        tput = n_texts / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for t in base:
+            emb.encode([t], batch_size=1)
+        query_ms = (time.perf_counter() - t0) / len(base) * 1000
+        if ref is None:
+            ref = vecs
+        cos = (vecs * ref).sum(axis=1)
+        print(f"{backend:<20}{tput:>10.1f}{query_ms:>10.2f}{cos.mean():>10.4f}{cos.min():>10.4f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default="all-MiniLM-L6-v2")
+    ap.add_argument("--catalog", default=str(Path(__file__).resolve().parents[1] / "data" / "books_manga_comics_catalog.csv"))
+    ap.add_argument("--texts", type=int, default=2000)
+    ap.add_argument("--batch-size", type=int, default=32)
+    args = ap.parse_args()
+    run(args.model, args.catalog, args.texts, args.batch_size)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+"""
+Per-worker memory of the catalog embedding matrix under each storage mode.
+
+Run from backend/:
+  python -m benchmarks.embedding_store --rows 200000 --dim 384 --workers 4
+
+Each worker process loads a VectorIndex and runs a few searches (touching every page),
+then reports RSS and PSS. PSS splits shared pages between the processes mapping them,
+so it is the number that shows the page-cache sharing of EMBEDDING_MMAP.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.vector_index import VectorIndex  # noqa: E402
+
+
+MODES = [
+    ("float32", False),
+    ("float32", True),
+    ("float16", True),
+    ("int8", True),
+]
+
+
+def _mem_mb() -> tuple[float, float]:
+    rss = pss = 0.0
+    with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1]) / 1024
+    return rss, pss
+
+
+def _worker(paths: dict, storage: str, mmap: bool, ready, go, out) -> None:
+    idx = VectorIndex(
+        faiss_index_path=paths["faiss"],
+        embeddings_path=paths["emb"],
+        meta_path=paths["meta"],
+        scales_path=paths["scales"],
+        storage_dtype=storage,
+        mmap=mmap,
+    )
+    idx.load()
+    # Force the exact scan so all workers touch the whole matrix.
+    idx._index = None
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(3):
+        idx.search(rng.standard_normal(paths["dim"]).astype(np.float32), top_k=10)
+    ready.release()
+    go.wait()
+    out.put(_mem_mb())
+
+
+def run(rows: int, dim: int, workers: int) -> None:
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((rows, dim)).astype(np.float32)
+    print(f"rows={rows} dim={dim} workers={workers} float32 matrix={emb.nbytes / 2**20:.1f} MiB")
+    print(f"{'storage':<10}{'mmap':<6}{'file MiB':>10}{'RSS/worker':>12}{'PSS/worker':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage, mmap in MODES:
+            paths = {
+                "faiss": os.path.join(tmp, "catalog.faiss"),
+                "emb": os.path.join(tmp, "catalog_embeddings.npy"),
+                "scales": os.path.join(tmp, "catalog_embeddings.scales.npy"),
+                "meta": os.path.join(tmp, "catalog_meta.json"),
+                "dim": dim,
+            }
+            builder = VectorIndex(
+                faiss_index_path=paths["faiss"],
+                embeddings_path=paths["emb"],
+                meta_path=paths["meta"],
+                scales_path=paths["scales"],
+                storage_dtype=storage,
+            )
+            builder._faiss = None
+            builder.build(emb, embedding_model="bench", catalog_path="")
+            del builder
+
+            ctx = mp.get_context("spawn")
+            ready = ctx.Semaphore(0)
+            go = ctx.Event()
+            out = ctx.Queue()
+            procs = [
+                ctx.Process(target=_worker, args=(paths, storage, mmap, ready, go, out))
+                for _ in range(workers)
+            ]
+            for p in procs:
+                p.start()
+            for _ in procs:
+                ready.acquire()
+            go.set()
+            mems = [out.get() for _ in procs]
+            for p in procs:
+                p.join()
+
+            file_mb = os.path.getsize(paths["emb"]) / 2**20
+            if os.path.exists(paths["scales"]):
+                file_mb += os.path.getsize(paths["scales"]) / 2**20
+            rss = float(np.mean([m[0] for m in mems]))
+            pss = float(np.mean([m[1] for m in mems]))
+            print(f"{storage:<10}{str(mmap):<6}{file_mb:>10.1f}{rss:>12.1f}{pss:>12.1f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+    run(args.rows, args.dim, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,86 @@
+"""
+Latency of N-way score fusion against the per-element dict blend it replaced.
+
+Run from backend/:
+  python -m benchmarks.fusion --sources 3 --candidates 200 --rows 200000 --repeat 2000
+
+Each source is a (row ids, scores) top-k list drawn from a catalog of `--rows` rows, as
+the prompt/profile/CF searches produce. Both implementations must return the same rows.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.fusion import fuse  # noqa: E402
+
+
+def _dict_blend(sources, top_k: int):
+    # The former ComicRecommender._blend_results/_blend_3way loop, generalized to N sources.
+    score_map = {}
+    for ids, scores, weight in sources:
+        for i, s in zip(ids.tolist(), scores.tolist()):
+            if i < 0:
+                continue
+            score_map[int(i)] = score_map.get(int(i), 0.0) + weight * float(s)
+    items = sorted(score_map.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    idx = np.array([i for i, _ in items], dtype=np.int64)
+    sc = np.array([s for _, s in items], dtype=np.float32)
+    return idx, sc
+
+
+def _make_sources(rng, n_sources: int, candidates: int, rows: int):
+    # Sources share part of their candidates, as prompt and profile searches do.
+    pool = rng.choice(rows, size=min(rows, candidates * 2), replace=False)
+    out = []
+    for _ in range(n_sources):
+        ids = rng.choice(pool, size=candidates, replace=False).astype(np.int64)
+        scores = np.sort(rng.random(candidates).astype(np.float32))[::-1]
+        out.append((ids, scores, float(rng.uniform(0.1, 1.0))))
+    return out
+
+
+def _time(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def run(n_sources: int, candidates: int, rows: int, top_k: int, repeat: int) -> None:
+    rng = np.random.default_rng(0)
+    sources = _make_sources(rng, n_sources, candidates, rows)
+
+    ref_idx, _ = _dict_blend(sources, top_k)
+    new_idx, _ = fuse(sources, top_k=top_k, method="weighted")
+    if set(ref_idx.tolist()) != set(new_idx.tolist()):
+        raise SystemExit("weighted fusion does not match the dict blend")
+
+    print(f"sources={n_sources} candidates={candidates} rows={rows} top_k={top_k} repeat={repeat}")
+    print(f"{'impl':<16}{'us/call':>10}")
+    print(f"{'dict blend':<16}{_time(lambda: _dict_blend(sources, top_k), repeat):>10.1f}")
+    print(f"{'fuse weighted':<16}{_time(lambda: fuse(sources, top_k=top_k, method='weighted'), repeat):>10.1f}")
+    print(f"{'fuse rrf':<16}{_time(lambda: fuse(sources, top_k=top_k, method='rrf'), repeat):>10.1f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sources", type=int, default=3)
+    ap.add_argument("--candidates", type=int, default=200)
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--top-k", type=int, default=100)
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    run(args.sources, args.candidates, args.rows, args.top_k, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+"""
+Peak memory of an index build as the catalog grows: whole-frame vs streaming ingestion.
+
+Run from backend/:
+  python -m benchmarks.ingest_memory --rows 50000 200000 800000 --dim 384
+
+A synthetic catalog CSV is written per size and encoded by a stub embedder (see
+benchmarks.synthetic, so the model is not what gets measured). Each build runs in a fresh
+process and reports its peak RSS above the post-import baseline:
+
+  whole-frame  load_catalog + the full text list + the full matrix + VectorIndex.build,
+               the former ComicRecommender._rebuild_index
+  streaming    iter_catalog_chunks + VectorIndex.writer, as app.ai.build_index does
+
+The streaming figure should stay roughly constant across sizes.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.catalog import iter_catalog_chunks, load_catalog, row_content_hashes  # noqa: E402
+from app.ai.vector_index import VectorIndex  # noqa: E402
+from benchmarks.synthetic import StubSentenceModel, write_catalog  # noqa: E402
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _index(out_dir: str) -> VectorIndex:
+    return VectorIndex(
+        faiss_index_path=os.path.join(out_dir, "catalog.faiss"),
+        embeddings_path=os.path.join(out_dir, "catalog_embeddings.npy"),
+        meta_path=os.path.join(out_dir, "catalog_meta.json"),
+        hashes_path=os.path.join(out_dir, "catalog_row_hashes.json"),
+    )
+
+
+def _whole_frame(csv_path: str, out_dir: str, dim: int) -> None:
+    df = load_catalog(csv_path)
+    texts = df["search_text"].fillna("").astype(str).tolist()
+    emb = StubSentenceModel(dim).encode(texts)
+    _index(out_dir).build(emb, "stub", csv_path, df["source_id"].astype(str).tolist(), row_content_hashes(texts))
+
+
+def _streaming(csv_path: str, out_dir: str, dim: int) -> None:
+    embedder = StubSentenceModel(dim)
+    n = sum(len(df) for df in iter_catalog_chunks(csv_path, 4096))
+    with _index(out_dir).writer(n, dim, "stub", csv_path) as w:
+        for df in iter_catalog_chunks(csv_path, 4096):
+            texts = df["search_text"].fillna("").astype(str).tolist()
+            w.append(embedder.encode(texts), df["source_id"].astype(str).tolist(), row_content_hashes(texts))
+        w.commit(load=False)
+
+
+def _child(mode: str, csv_path: str, dim: int, out) -> None:
+    base = _rss_mb()
+    with tempfile.TemporaryDirectory() as out_dir:
+        (_whole_frame if mode == "whole-frame" else _streaming)(csv_path, out_dir, dim)
+    out.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - base)
+
+
+def _measure(mode: str, csv_path: str, dim: int) -> float:
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    p = ctx.Process(target=_child, args=(mode, csv_path, dim, out))
+    p.start()
+    peak = out.get()
+    p.join()
+    return peak
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, nargs="+", default=[50_000, 200_000, 800_000])
+    ap.add_argument("--dim", type=int, default=384)
+    args = ap.parse_args()
+
+    print(f"{'rows':>10}{'whole-frame MB':>18}{'streaming MB':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            csv_path = os.path.join(tmp, f"catalog_{rows}.csv")
+            write_catalog(csv_path, rows)
+            whole = _measure("whole-frame", csv_path, args.dim)
+            stream = _measure("streaming", csv_path, args.dim)
+            print(f"{rows:>10}{whole:>18.1f}{stream:>16.1f}")
+            os.remove(csv_path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
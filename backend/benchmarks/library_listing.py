@@ -0,0 +1,177 @@
+"""
+Library listing latency and query count as a shelf grows: per-entry lookups vs one join.
+
+Run from backend/:
+  python -m benchmarks.library_listing --sizes 100 2000 20000
+
+For each size, one more user with a favorites shelf of that size is seeded into a
+SQLite database, then each listing is requested --repeat times through the real endpoint
+(test client, JWT):
+
+  n+1        the former _get_by_status: the UserComic rows, then one Comic lookup per row
+  joined     GET /api/library/favorites (the whole shelf, one query)
+  page       GET ...?limit=--page-size, the first page
+  walk       every page of --page-size, following X-Next-Cursor
+  fields     GET ...?fields=id,title,author (the whole shelf, three columns)
+
+Reported per variant: median milliseconds per listing and SQL statements per listing
+(each request through the endpoint also runs one token-blocklist query).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.synthetic import GENRES, PUBLISHERS, WORDS  # noqa: E402
+
+
+def _app(db_path: str):
+    os.environ.update(
+        DATABASE_URL="sqlite:///" + db_path,
+        SECRET_KEY="benchmark-secret-key-benchmark-secret-key",
+        JWT_SECRET_KEY="benchmark-jwt-key-benchmark-jwt-key-0000",
+        RECOMMENDER_INIT="lazy",
+    )
+    from app import create_app
+
+    return create_app()
+
+
+def _seed(app, size: int, user_id: int, first_comic: int) -> None:
+    from sqlalchemy import insert
+
+    from app import db
+    from app.models import Comic, User, UserComic
+
+    with app.app_context():
+        db.session.execute(
+            insert(User),
+            [{"id": user_id, "username": f"reader{user_id}", "email": f"reader{user_id}@example.com", "password_hash": "x"}],
+        )
+        db.session.execute(
+            insert(Comic),
+            [
+                {
+                    "id": first_comic + i,
+                    "source": "catalog",
+                    "source_id": f"syn{i}",
+                    "title": " ".join(WORDS[(i + k) % len(WORDS)] for k in range(3)).title(),
+                    "author": f"Author {i % 97}",
+                    "publisher": PUBLISHERS[i % len(PUBLISHERS)],
+                    "genre": GENRES[i % len(GENRES)],
+                    "year": 1960 + i % 66,
+                    "rating": 3.5,
+                    "description": " ".join(WORDS[(i * 7 + k) % len(WORDS)] for k in range(60)),
+                    "tags": WORDS[i % len(WORDS) : i % len(WORDS) + 3],
+                }
+                for i in range(size)
+            ],
+        )
+        db.session.execute(
+            insert(UserComic),
+            [{"user_id": user_id, "comic_id": first_comic + i, "status": "favorite"} for i in range(size)],
+        )
+        db.session.commit()
+
+
+def _n_plus_one(app, user_id: int) -> None:
+    from flask import jsonify
+
+    from app import db
+    from app.models import Comic, UserComic
+    from app.routes.library import _serialize_comic
+
+    with app.test_request_context():
+        # A fresh session, as each request gets; otherwise get() answers from the identity map.
+        db.session.remove()
+        records = UserComic.query.filter_by(user_id=user_id, status="favorite").all()
+        comics = [db.session.get(Comic, record.comic_id) for record in records]
+        jsonify([_serialize_comic(comic) for comic in comics if comic]).get_data()
+
+
+def _walk(client, headers, page_size: int) -> None:
+    cursor = None
+    while True:
+        params = {"limit": page_size}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/api/library/favorites", query_string=params, headers=headers)
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return
+
+
+def _measure(fn: Callable[[], None], engine, repeat: int) -> Dict[str, float]:
+    from sqlalchemy import event
+
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    fn()  # warm-up
+    event.listen(engine, "before_cursor_execute", count)
+    times = []
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return {"ms": statistics.median(times) * 1000.0, "queries": statements[0] / repeat}
+
+
+def run_size(app, size: int, user_id: int, first_comic: int, args) -> Dict[str, Dict[str, float]]:
+    from flask_jwt_extended import create_access_token
+
+    from app import db
+
+    _seed(app, size, user_id, first_comic)
+    client = app.test_client()
+    with app.app_context():
+        headers = {"Authorization": "Bearer " + create_access_token(identity=str(user_id))}
+        variants = {
+            "n+1": lambda: _n_plus_one(app, user_id),
+            "joined": lambda: client.get("/api/library/favorites", headers=headers),
+            "page": lambda: client.get("/api/library/favorites", query_string={"limit": args.page_size}, headers=headers),
+            "walk": lambda: _walk(client, headers, args.page_size),
+            "fields": lambda: client.get(
+                "/api/library/favorites", query_string={"fields": "id,title,author"}, headers=headers
+            ),
+        }
+        out = {name: _measure(fn, db.engine, args.repeat) for name, fn in variants.items()}
+        db.session.remove()
+    return out
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 2000, 20000])
+    ap.add_argument("--page-size", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    print(f"{'entries':>8} {'variant':<8}{'median ms':>12}{'queries':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Config is read once per process, so all sizes share one app and database.
+        app = _app(os.path.join(tmp, "bench.db"))
+        first_comic = 1
+        for user_id, size in enumerate(args.sizes, start=1):
+            for name, r in run_size(app, size, user_id, first_comic, args).items():
+                print(f"{size:>8} {name:<8}{r['ms']:>12.2f}{r['queries']:>10.1f}")
+            first_comic += size
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,307 @@
+"""
+ComicRecommender.recommend latency per path on synthetic catalogs, users and libraries.
+
+Run from backend/:
+  python -m benchmarks.recommender --rows 10000 100000 1000000 --out recommender.json
+  python -m benchmarks.recommender --rows 10000 --baseline recommender.json
+
+For each catalog size, a synthetic catalog (benchmarks.synthetic) and a SQLite database
+of users, comics and library entries are created in a temp directory. Library entries
+follow a long-tail popularity, so CF has something to learn. A ComicRecommender is then
+built over them with the stub embedder and cross-encoder, so no model is downloaded and
+the numbers cover retrieval, fusion, DB access and serialization, not inference.
+
+Paths (each timed over --queries calls after --warmup calls):
+  anonymous     prompt, no user
+  profile       prompt + the user's profile vector, CF off
+  cf            prompt + profile + CF factors (needs `implicit`)
+  rerank        anonymous prompt + cross-encoder rerank
+  personalized  no prompt, profile vector only
+
+Every call gets a distinct prompt, so the prompt cache never hits. Users are drawn
+uniformly from --users, so the profile cache behaves as with that many active users.
+
+--out writes p50/p95/p99/mean (ms) per size and path, the build times, the settings and
+the environment as JSON. --baseline compares the run against such a file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app.ai.recommender as recommender_module  # noqa: E402
+from app import db  # noqa: E402
+from app.ai.embedding import Embedder  # noqa: E402
+from app.ai.recommender import ComicRecommender, RecommenderConfig  # noqa: E402
+from app.ai.vector_index import _try_import_faiss  # noqa: E402
+from benchmarks.synthetic import WORDS, StubCrossEncoder, StubSentenceModel, write_catalog  # noqa: E402
+
+# name -> (with prompt, with user, CF on, rerank on)
+PATHS = {
+    "anonymous": (True, False, False, False),
+    "profile": (True, True, False, False),
+    "cf": (True, True, True, False),
+    "rerank": (True, False, False, True),
+    "personalized": (False, True, False, False),
+}
+STATUSES = ["favorite", "reading", "completed", "trash"]
+STATUS_P = [0.35, 0.3, 0.25, 0.1]
+RESULTS_FORMAT = 1
+
+
+def _app(db_path: str):
+    from flask import Flask
+
+    app = Flask("benchmarks.recommender")
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + db_path
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        from app import models  # noqa: F401
+
+        db.create_all()
+    return app
+
+
+def _seed_library(app, df, n_users: int, library_size: int, rng) -> int:
+    """
+    Inserts users, the comics they shelved and their library entries. Returns the number
+    of library entries.
+    """
+    from sqlalchemy import insert
+
+    from app.models import Comic, User, UserComic
+
+    n_items = len(df)
+    # Long-tail popularity over a random order of the catalog.
+    p = 1.0 / (np.arange(n_items) + 10.0)
+    p /= p.sum()
+    order = rng.permutation(n_items)
+    users = np.repeat(np.arange(1, n_users + 1), library_size)
+    items = order[rng.choice(n_items, size=len(users), p=p)]
+    _, first = np.unique(users.astype(np.int64) * n_items + items, return_index=True)
+    users, items = users[first], items[first]
+    statuses = rng.choice(STATUSES, size=len(users), p=STATUS_P)
+
+    shelved = np.unique(items)
+    comic_id = {int(row): i + 1 for i, row in enumerate(shelved)}
+    cols = df[["source_id", "title", "author", "publisher", "genre"]].to_numpy()
+    with app.app_context():
+        db.session.execute(
+            insert(User),
+            [
+                {"id": u, "username": f"user{u}", "email": f"user{u}@example.com", "password_hash": "x"}
+                for u in range(1, n_users + 1)
+            ],
+        )
+        db.session.execute(
+            insert(Comic),
+            [
+                {
+                    "id": comic_id[int(row)],
+                    "source": "catalog",
+                    "source_id": cols[row][0],
+                    "title": cols[row][1],
+                    "author": cols[row][2],
+                    "publisher": cols[row][3],
+                    "genre": cols[row][4],
+                }
+                for row in shelved
+            ],
+        )
+        db.session.execute(
+            insert(UserComic),
+            [
+                {"user_id": int(u), "comic_id": comic_id[int(i)], "status": str(s)}
+                for u, i, s in zip(users, items, statuses)
+            ],
+        )
+        db.session.commit()
+    return len(users)
+
+
+def _config(csv_path: str, index_dir: str, dim: int, args) -> RecommenderConfig:
+    from app.config import Config
+
+    settings = {k: getattr(Config, k) for k in dir(Config) if k.isupper()}
+    settings.update(
+        CATALOG_PATH=csv_path,
+        INDEX_DIR=index_dir,
+        EMBEDDING_MODEL=f"stub-{dim}",
+        EMBEDDING_BACKEND="torch",
+        INDEX_TYPE=args.index_type,
+        EMBEDDING_STORAGE=args.storage,
+        EMBEDDING_MMAP=args.mmap,
+        ENABLE_RERANKER=False,
+        CF_WEIGHT=args.cf_weight,
+        CF_TRAIN_INTERVAL_SECONDS=3600,
+        PROMPT_CACHE_SIZE=0,
+        PROMPT_CACHE_PATH="",
+        ENCODE_BATCH_MAX_SIZE=0,
+    )
+    return RecommenderConfig.from_config(settings)
+
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    ms = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "calls": int(len(ms)),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def run_size(rows: int, args) -> Dict:
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "catalog.csv")
+        write_catalog(csv_path, rows, seed=args.seed)
+        app = _app(os.path.join(tmp, "bench.db"))
+
+        # The stub replaces the SentenceTransformer for everything this process builds.
+        model = StubSentenceModel(args.dim)
+        recommender_module.load_embedder = lambda name, backend="torch": Embedder(model_name=name, _model=model)
+        cfg = _config(csv_path, os.path.join(tmp, "index"), args.dim, args)
+
+        t0 = time.perf_counter()
+        rec = ComicRecommender(cfg, app=app)
+        build_seconds = time.perf_counter() - t0
+        rec.reranker._model = StubCrossEncoder()
+        interactions = _seed_library(app, rec.comics_df, args.users, args.library_size, rng)
+
+        cf_seconds = None
+        if rec._cf is not None:
+            t0 = time.perf_counter()
+            rec._cf.refresh()
+            if rec._cf.current is not None:
+                cf_seconds = time.perf_counter() - t0
+
+        out = {
+            "rows": rows,
+            "interactions": interactions,
+            "build_seconds": round(build_seconds, 3),
+            "cf_train_seconds": round(cf_seconds, 3) if cf_seconds is not None else None,
+            "paths": {},
+        }
+        cf_weight = cfg.cf_weight
+        with app.app_context():
+            for name, (with_prompt, with_user, cf_on, rerank_on) in PATHS.items():
+                if cf_on and cf_seconds is None:
+                    continue
+                rec.cfg.cf_weight = cf_weight if cf_on else 0.0
+                rec.cfg.enable_reranker = rerank_on
+                latencies = []
+                for i in range(args.warmup + args.queries):
+                    words = rng.choice(WORDS, size=int(rng.integers(2, 6)))
+                    prompt = " ".join(words) if with_prompt else ""
+                    user_id = int(rng.integers(1, args.users + 1)) if with_user else None
+                    t0 = time.perf_counter()
+                    rec.recommend(prompt, user_id)
+                    if i >= args.warmup:
+                        latencies.append(time.perf_counter() - t0)
+                out["paths"][name] = _summary(latencies)
+            rec.cfg.cf_weight = cf_weight
+            rec.cfg.enable_reranker = False
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    return out
+
+
+def _environment() -> Dict[str, object]:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent, timeout=5
+        ).stdout.strip()
+    except Exception:
+        rev = ""
+    return {
+        "git_rev": rev or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "faiss": _try_import_faiss() is not None,
+        "cpu_count": os.cpu_count(),
+        "platform": platform.platform(),
+    }
+
+
+def _compare(results: Dict, baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["rows"], name): stats for r in baseline.get("runs", []) for name, stats in r["paths"].items()}
+    print(f"\nvs {baseline_path} ({(baseline.get('environment') or {}).get('git_rev')})")
+    print(f"{'rows':>9} {'path':<14}" + "".join(f"{k:>22}" for k in ("p50_ms", "p95_ms", "p99_ms")))
+    for run in results["runs"]:
+        for name, stats in run["paths"].items():
+            prev = old.get((run["rows"], name))
+            if prev is None:
+                continue
+            cells = []
+            for k in ("p50_ms", "p95_ms", "p99_ms"):
+                change = (stats[k] / prev[k] - 1.0) * 100.0 if prev[k] else 0.0
+                cells.append(f"{prev[k]:>8.2f} -> {stats[k]:>6.2f} {change:+4.0f}%")
+            print(f"{run['rows']:>9} {name:<14}" + "".join(f"{c:>22}" for c in cells))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--library-size", type=int, default=40, help="library entries drawn per user")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--cf-weight", type=float, default=0.2)
+    ap.add_argument("--index-type", default="flat")
+    ap.add_argument("--storage", default="float32")
+    ap.add_argument("--mmap", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="write results as JSON here")
+    ap.add_argument("--baseline", default=None, help="earlier --out file to compare against")
+    args = ap.parse_args(argv)
+
+    settings = {k: v for k, v in vars(args).items() if k not in ("rows", "out", "baseline")}
+    results = {
+        "benchmark": "recommender",
+        "format": RESULTS_FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": _environment(),
+        "settings": settings,
+        "runs": [],
+    }
+    print(f"{'rows':>9} {'path':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for rows in args.rows:
+        run = run_size(rows, args)
+        results["runs"].append(run)
+        for name, s in run["paths"].items():
+            print(f"{rows:>9} {name:<14}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['mean_ms']:>10.2f}")
+        cf = run["cf_train_seconds"]
+        print(f"{rows:>9} build {run['build_seconds']:.1f}s, cf train {'-' if cf is None else f'{cf:.1f}s'}, {run['interactions']} entries")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        _compare(results, args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
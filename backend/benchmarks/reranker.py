@@ -0,0 +1,115 @@
+"""
+Cross-encoder rerank latency and ranking agreement per backend and token budget.
+
+Run from backend/:
+  python -m benchmarks.reranker --model cross-encoder/ms-marco-MiniLM-L-6-v2 --docs 50
+
+Every configuration reranks the same candidate lists (catalog search_text, drawn per
+prompt) that the recommender would send. Quality is measured against the current path
+(torch fp32, model's own max length): Spearman correlation of the scores and overlap of
+the top 10. "cached" repeats the run through RerankScoreCache, as a repeated or
+paginated query would.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.catalog import load_catalog  # noqa: E402
+from app.ai.embedding import OptionalReranker, RerankScoreCache  # noqa: E402
+
+PROMPTS = [
+    "dark psychological thriller with a detective",
+    "funny school romance manga",
+    "space opera with giant robots",
+    "superhero origin story",
+    "post-apocalyptic survival",
+    "magic academy fantasy adventure",
+]
+
+
+def _ranks(x: np.ndarray) -> np.ndarray:
+    r = np.empty(len(x), dtype=np.float64)
+    r[np.argsort(x, kind="stable")] = np.arange(len(x))
+    return r
+
+
+def _spearman(a, b) -> float:
+    ra, rb = _ranks(np.asarray(a)), _ranks(np.asarray(b))
+    if ra.std() == 0 or rb.std() == 0:
+        return 1.0
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def _top_overlap(a, b, k: int = 10) -> float:
+    k = min(k, len(a))
+    ta = set(np.argsort(-np.asarray(a))[:k].tolist())
+    tb = set(np.argsort(-np.asarray(b))[:k].tolist())
+    return len(ta & tb) / max(1, k)
+
+
+def _run(reranker: OptionalReranker, lists) -> tuple[list, float]:
+    scores = []
+    t0 = time.perf_counter()
+    for prompt, docs, keys in lists:
+        scores.append(reranker.rerank(prompt, docs, keys=keys))
+    return scores, (time.perf_counter() - t0) / len(lists) * 1000
+
+
+def run(model: str, catalog: str, n_docs: int, max_lengths: list[int]) -> None:
+    df = load_catalog(catalog)
+    if df.empty:
+        raise SystemExit(f"Catalog is empty: {catalog}")
+    texts = df["search_text"].astype(str).tolist()
+    rng = np.random.default_rng(0)
+    lists = []
+    for p in PROMPTS:
+        rows = rng.choice(len(texts), size=n_docs, replace=len(texts) < n_docs).tolist()
+        lists.append((p, [texts[r] for r in rows], list(range(len(rows)))))
+
+    ref = OptionalReranker(model, backend="torch")
+    ref.load()
+    _run(ref, lists[:1])  # warm up
+    ref_scores, ref_ms = _run(ref, lists)
+
+    print(f"model={model} prompts={len(lists)} docs/prompt={n_docs}")
+    print(f"{'backend':<12}{'max_len':>8}{'ms/query':>10}{'cached':>10}{'spearman':>10}{'top10':>8}")
+    print(f"{'torch':<12}{'model':>8}{ref_ms:>10.1f}{'-':>10}{1.0:>10.3f}{1.0:>8.2f}")
+    for backend in ("torch", "torch-int8", "onnx"):
+        for max_len in max_lengths:
+            r = OptionalReranker(model, backend=backend, max_length=max_len, cache=RerankScoreCache())
+            r.load()
+            if r.backend_effective != backend:
+                print(f"{backend:<12}{max_len:>8}  skipped (backend not installed)")
+                break
+            r.cache = None
+            _run(r, lists[:1])
+            scores, ms = _run(r, lists)
+            r.cache = RerankScoreCache()
+            _run(r, lists)
+            _, cached_ms = _run(r, lists)
+            rho = float(np.mean([_spearman(a, b) for a, b in zip(ref_scores, scores)]))
+            top = float(np.mean([_top_overlap(a, b) for a, b in zip(ref_scores, scores)]))
+            print(f"{r.backend_effective:<12}{max_len:>8}{ms:>10.1f}{cached_ms:>10.2f}{rho:>10.3f}{top:>8.2f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    ap.add_argument("--catalog", default=str(Path(__file__).resolve().parents[1] / "data" / "books_manga_comics_catalog.csv"))
+    ap.add_argument("--docs", type=int, default=50)
+    ap.add_argument("--max-length", type=int, nargs="+", default=[512, 256, 128])
+    args = ap.parse_args()
+    run(args.model, args.catalog, args.docs, args.max_length)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
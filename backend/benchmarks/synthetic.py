@@ -0,0 +1,103 @@
+"""
+Synthetic catalogs and model stand-ins shared by the benchmarks.
+
+Nothing here downloads a model: StubSentenceModel and StubCrossEncoder are deterministic
+and cheap, so a benchmark measures the code around the model, reproducibly.
+"""
+
+from __future__ import annotations
+
+import csv
+import zlib
+from typing import Dict, List
+
+import numpy as np
+import scipy.sparse
+
+WORDS = (
+    "space dark magic ninja robot school ghost detective pirate romance dragon city war "
+    "hero villain time travel mystery horror comedy sport music samurai vampire alien "
+    "island empire rebel knight witch zombie cyber noir heist family friendship revenge"
+).split()
+GENRES = ["Manga", "Superhero", "Fantasy", "Science Fiction", "Horror", "Romance", "Mystery", "Comedy"]
+PUBLISHERS = ["Viz", "Marvel", "DC", "Image", "Dark Horse", "Kodansha", "Shueisha", "IDW"]
+
+
+def write_catalog(path: str, rows: int, seed: int = 0) -> None:
+    """
+    Writes a catalog CSV in the layout of data/comics.csv with `rows` random comics.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "title", "author", "publisher", "genre", "year", "rating", "description", "tags"])
+        for start in range(0, rows, 10000):
+            n = min(10000, rows - start)
+            words = rng.integers(0, len(WORDS), size=(n, 24))
+            genres = rng.integers(0, len(GENRES), size=(n, 2))
+            publishers = rng.integers(0, len(PUBLISHERS), size=n)
+            authors = rng.integers(0, max(1, rows // 5), size=n)
+            years = rng.integers(1960, 2026, size=n)
+            ratings = np.round(rng.uniform(1, 5, size=n), 1)
+            for i in range(n):
+                ws = [WORDS[j] for j in words[i]]
+                w.writerow(
+                    [
+                        f"syn{start + i}",
+                        " ".join(ws[:3]).title(),
+                        f"Author {authors[i]}",
+                        PUBLISHERS[publishers[i]],
+                        ", ".join(dict.fromkeys(GENRES[g] for g in genres[i])),
+                        int(years[i]),
+                        float(ratings[i]),
+                        " ".join(ws[6:]),
+                        ",".join(ws[3:6]),
+                    ]
+                )
+
+
+class StubSentenceModel:
+    """
+    Stands in for a SentenceTransformer: a text's vector is the sum of fixed random
+    vectors of its words (hashed into `buckets`), so texts sharing words land close
+    together and the same text always gets the same vector.
+    """
+
+    def __init__(self, dim: int = 384, buckets: int = 1 << 14, seed: int = 0):
+        self.dim = dim
+        self.buckets = buckets
+        self.table = np.random.default_rng(seed).normal(size=(buckets, dim)).astype(np.float32)
+        self._word_bucket: Dict[str, int] = {}
+
+    def _bucket(self, word: str) -> int:
+        b = self._word_bucket.get(word)
+        if b is None:
+            b = self._word_bucket[word] = zlib.crc32(word.encode("utf-8")) % self.buckets
+        return b
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False, normalize_embeddings: bool = False):
+        cols: List[int] = []
+        indptr = [0]
+        for t in texts:
+            cols.extend(self._bucket(w) for w in str(t).lower().split())
+            indptr.append(len(cols))
+        counts = scipy.sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.float32), np.asarray(cols, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(texts), self.buckets),
+        )
+        return np.asarray(counts @ self.table, dtype=np.float32)
+
+
+class StubCrossEncoder:
+    """
+    Stands in for a CrossEncoder: scores a (query, doc) pair by the share of query words
+    found in the doc.
+    """
+
+    def predict(self, pairs):
+        out = []
+        for query, doc in pairs:
+            q = set(str(query).lower().split())
+            d = set(str(doc).lower().split())
+            out.append(len(q & d) / max(1, len(q)))
+        return np.asarray(out, dtype=np.float32)
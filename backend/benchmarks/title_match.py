@@ -0,0 +1,97 @@
+"""
+Title/author -> catalog row matching: per-call DataFrame scan vs TitleAuthorIndex.
+
+Run from backend/:
+  python -m benchmarks.title_match --rows 100000 --interactions 1000000
+
+Interactions draw titles from the catalog (with case/whitespace noise and some
+unknown titles), as unmapped library rows do during profile and CF builds. The scan
+is too slow to run a million times, so it is timed on `--scan-sample` lookups and
+extrapolated; both paths are checked to return the same rows on that sample.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ai.catalog import best_effort_match_row_id, build_title_author_index, normalize_catalog  # noqa: E402
+
+
+def _make_catalog(rng, rows: int) -> pd.DataFrame:
+    # ~10% duplicate titles so the author tie-break is exercised.
+    n_titles = max(1, int(rows * 0.9))
+    title_ids = rng.integers(0, n_titles, size=rows)
+    df = pd.DataFrame(
+        {
+            "id": [f"c{i}" for i in range(rows)],
+            "title": [f"Title {t}" for t in title_ids],
+            "author": [f"Author {a}" for a in rng.integers(0, rows // 4 + 1, size=rows)],
+        }
+    )
+    return normalize_catalog(df)
+
+
+def _make_lookups(rng, df: pd.DataFrame, n: int):
+    picks = rng.integers(0, len(df), size=n)
+    titles = df["title"].to_numpy()[picks]
+    authors = df["author"].to_numpy()[picks]
+    out = []
+    for i, (t, a) in enumerate(zip(titles, authors)):
+        if i % 10 == 0:
+            t = f"Unknown {i}"
+        elif i % 3 == 0:
+            t = f"  {t.upper()} "
+        if i % 5 == 0:
+            a = None
+        out.append((t, a))
+    return out
+
+
+def run(rows: int, interactions: int, scan_sample: int) -> None:
+    rng = np.random.default_rng(0)
+    df = _make_catalog(rng, rows)
+    lookups = _make_lookups(rng, df, interactions)
+    print(f"rows={rows} interactions={interactions} scan_sample={scan_sample}")
+
+    t0 = time.perf_counter()
+    index = build_title_author_index(df)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for t, a in lookups:
+        index.match(t, a)
+    index_s = time.perf_counter() - t0
+
+    sample = lookups[:scan_sample]
+    t0 = time.perf_counter()
+    expected = [best_effort_match_row_id(df, title=t, author=a) for t, a in sample]
+    scan_s = (time.perf_counter() - t0) / max(1, len(sample)) * interactions
+
+    if expected != [index.match(t, a) for t, a in sample]:
+        raise SystemExit("TitleAuthorIndex does not match best_effort_match_row_id")
+
+    print(f"{'impl':<22}{'build s':>10}{'lookups s':>12}")
+    print(f"{'DataFrame scan (est.)':<22}{0.0:>10.2f}{scan_s:>12.1f}")
+    print(f"{'TitleAuthorIndex':<22}{build_s:>10.2f}{index_s:>12.2f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--interactions", type=int, default=1_000_000)
+    ap.add_argument("--scan-sample", type=int, default=200)
+    args = ap.parse_args()
+    run(args.rows, args.interactions, args.scan_sample)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())